@@ -1,6 +1,36 @@
-from typing import List, Dict
-from src.ingestao import LegalPDFLoader, IngestionManager, DocumentProcessor
-from src.rag import VectorDatabaseManager, RAGChainManager
+import argparse
+import asyncio
+import csv
+import json
+import os
+import time
+from typing import List, Dict, Optional
+from src.dependencias import lazy_attributes, preload
+from src.metricas import profile, tracer
+
+# LangChain, Chroma, Gemini e pypdf só são importados quando um modo os usa:
+# `--help` e os comandos de manutenção não pagam esse custo na inicialização.
+__getattr__, _lazy = lazy_attributes(__name__, {
+    "LegalPDFLoader": "src.ingestao",
+    "IngestionManager": "src.ingestao",
+    "IngestionManifest": "src.ingestao",
+    "DocumentProcessor": "src.ingestao",
+    "ParsedPDFCache": "src.ingestao",
+    "AnswerCache": "src.cache",
+    "ConfidencePolicy": "src.confianca",
+    "EmbeddingPipeline": "src.indexacao",
+    "VectorDatabaseManager": "src.rag",
+    "RAGChainManager": "src.rag",
+    "QueryRouter": "src.roteamento",
+    "RAGServer": "src.servidor",
+    "batch_query_embeddings": "src.servidor",
+    "serve": "src.servidor",
+    "copy_vectors": "src.vetores",
+})
+
+# Módulos importados pelo `--preaquecer`, além dos do backend escolhido
+MODULOS_PESADOS = ["src.ingestao", "src.rag", "src.servidor", "langchain_google_genai"]
+MODULOS_BACKEND = {"chroma": ["chromadb", "langchain_chroma"], "mmap": []}
 
 class RAGView:
     """Responsável por toda a interface de saída para o usuário (Console)."""
@@ -30,10 +60,57 @@ class RAGView:
         else:
             print(f"\nBanco vetorial carregado de {persist_directory}.")
 
+    @staticmethod
+    def exibir_status_sincronizacao(persist_directory: str, resultado: Dict[str, int]):
+        print(f"\nBanco vetorial sincronizado em {persist_directory}:")
+        print(f"  - Chunks adicionados: {resultado['adicionados']}")
+        print(f"  - Chunks removidos: {resultado['removidos']}")
+        print(f"  - Chunks inalterados: {resultado['inalterados']}")
+        if "chunks_por_segundo" in resultado:
+            print(f"  - Embedding: {resultado['lotes']} lotes em {resultado['segundos']:.1f}s "
+                  f"({resultado['chunks_por_segundo']:.1f} chunks/s, {resultado['retentativas']} retentativas)")
+
+    @staticmethod
+    def exibir_resumo_lote(total: int, duracao: float, caminho_saida: str):
+        print(f"\n{total} perguntas respondidas em {duracao:.1f}s ({total / duracao if duracao else 0:.2f} perguntas/s).")
+        print(f"Respostas gravadas em {caminho_saida}.")
+
+    @staticmethod
+    def exibir_perfil(relatorio: str, caminho: str):
+        print(relatorio)
+        print(f"Perfil gravado em {caminho}.")
+
+    @staticmethod
+    def exibir_tempos_inicializacao(tempos: Dict[str, float]):
+        print("\nPré-aquecimento:")
+        for etapa, ms in tempos.items():
+            print(f"  - {etapa}: {ms:.0f} ms")
+
+    @staticmethod
+    def exibir_snapshot(acao: str, caminho: str, cabecalho: Dict, duracao: float):
+        fontes = ", ".join(f"{fonte}: {total}" for fonte, total in cabecalho["fontes"].items())
+        print(f"\n{cabecalho['linhas']} chunks {acao} {caminho} em {duracao:.1f}s "
+              f"({os.path.getsize(caminho) / 1024 / 1024:.1f} MB, {cabecalho['dtype']}).")
+        if fontes:
+            print(f"  - Fontes: {fontes}")
+
     @staticmethod
     def exibir_sucesso(mensagem: str):
         print(f"\n{mensagem}")
         
+    @staticmethod
+    def iniciar_resposta_stream():
+        print("Resposta: ", end="", flush=True)
+
+    @staticmethod
+    def exibir_token(token: str):
+        print(token, end="", flush=True)
+
+    @staticmethod
+    def finalizar_resposta_stream():
+        print()
+        print("-" * 50)
+
     @staticmethod
     def exibir_resposta_rag(pergunta: str, resposta: str):
         print(f"\nPergunta: {pergunta}")
@@ -43,35 +120,113 @@ class RAGView:
 class RAGController:
     """Orquestrador do Pipeline RAG (Padrão Controller)."""
     
-    def __init__(self, view: RAGView):
+    # Diretório de cada backend vetorial (ver src/vetores.py)
+    DIRETORIOS = {"chroma": "./chroma_db", "mmap": "./mmap_db"}
+
+    def __init__(self, view: RAGView, backend: str = "chroma"):
         self.view = view
-        self.processor = DocumentProcessor()
-        self.db_manager = VectorDatabaseManager()
-        self.rag_manager = RAGChainManager(self.db_manager)
+        self.backend = backend
+        # Banco, clientes do Gemini e caches são criados no primeiro uso (ver `preaquecer`)
+        self._processor = None
+        self._db_manager = None
+        self._pdf_cache = None
+        self._rag_manager = None
+
+    @property
+    def processor(self):
+        if self._processor is None:
+            self._processor = _lazy("DocumentProcessor")()
+        return self._processor
+
+    @property
+    def db_manager(self):
+        if self._db_manager is None:
+            self._db_manager = _lazy("VectorDatabaseManager")(persist_directory=self.DIRETORIOS[self.backend],
+                                                              backend=self.backend)
+        return self._db_manager
+
+    @property
+    def pdf_cache(self):
+        # Texto extraído dos PDFs, reaproveitado entre ingestões (ao lado do banco, como o cache de embeddings)
+        if self._pdf_cache is None:
+            self._pdf_cache = _lazy("ParsedPDFCache")(
+                os.path.join(os.path.dirname(os.path.abspath(self.DIRETORIOS[self.backend])), "pdf_cache")
+            )
+        return self._pdf_cache
+
+    @property
+    def rag_manager(self):
+        if self._rag_manager is None:
+            answer_cache = _lazy("AnswerCache")(max_size=512, ttl=24 * 3600, similarity_threshold=0.97,
+                                                embeddings=self.db_manager.embeddings)
+            # Roteamento por fonte: restringe a busca ao CDC e/ou à LGPD conforme a pergunta
+            router = _lazy("QueryRouter")(centroids=self.db_manager.source_centroids)
+            # Limiares calibrados por benchmarks/calibrar_confianca.py, quando existirem
+            caminho = os.path.join(self.DIRETORIOS[self.backend], "confianca.json")
+            policy = _lazy("ConfidencePolicy").load(caminho) if os.path.exists(caminho) else None
+            self._rag_manager = _lazy("RAGChainManager")(self.db_manager, answer_cache=answer_cache, router=router,
+                                                         confidence_policy=policy)
+        return self._rag_manager
+
+    def preaquecer(self) -> Dict[str, float]:
+        """Importa os módulos pesados, abre o banco e cria os clientes antes da primeira pergunta."""
+        tempos = preload(MODULOS_PESADOS + MODULOS_BACKEND[self.backend])
+        etapas = [("banco", lambda: self.db_manager.backend),
+                  ("clientes", lambda: self.rag_manager),
+                  ("centroides", lambda: self.rag_manager.router.centroids)]
+        for nome, etapa in etapas:
+            inicio = time.perf_counter()
+            etapa()
+            tempos[nome] = (time.perf_counter() - inicio) * 1000
+        for nome, ms in tempos.items():
+            tracer.record(f"inicializacao.{nome}", ms / 1000)
+        self.view.exibir_tempos_inicializacao(tempos)
+        return tempos
 
     def executar_pipeline_ingestao(self):
         self.view.exibir_titulo("PIPELINE DE INGESTÃO RAG")
         
         # 1. Ingestão (Model)
         loaders = [
-            LegalPDFLoader(file_path="./dados/cdc.pdf", source_label="cdc"),
-            LegalPDFLoader(file_path="./dados/lgpd.pdf", source_label="lgpd")
+            _lazy("LegalPDFLoader")(file_path="./dados/cdc.pdf", source_label="cdc", cache=self.pdf_cache),
+            _lazy("LegalPDFLoader")(file_path="./dados/lgpd.pdf", source_label="lgpd", cache=self.pdf_cache)
         ]
-        ingestion_manager = IngestionManager(loaders)
-        documents, stats = ingestion_manager.load_all()
+        manifest = _lazy("IngestionManifest")(os.path.join(self.db_manager.persist_directory, "ingestao_manifest.json"))
+        ingestion_manager = _lazy("IngestionManager")(loaders, manifest=manifest)
+        arquivos = ingestion_manager.plan()
         
-        # Limitando para evitar RESOURCE_EXHAUSTED no Gemini Free Tier
-        documents = documents[:20]
-        self.view.exibir_estatisticas_carregamento(stats)
+        # 2. Chunking (Model) - páginas lidas em paralelo e processadas em lotes,
+        # sem materializar o corpus inteiro em memória. Os iteradores medem o
+        # tempo exclusivo de leitura e de chunking.
+        documents = tracer.timed_iter("ingestao.load", ingestion_manager.iter_documents(max_workers=None))
+        chunking = tracer.timed_iter(
+            "ingestao.chunk",
+            self.processor.split_legal_stream(documents, max_tokens=400, batch_size=500),
+            exclude=documents
+        )
+        chunk_stats = {"total": 0, "caracteres": 0}
+        def contar_chunks(batches):
+            for batch in batches:
+                chunk_stats["total"] += len(batch)
+                chunk_stats["caracteres"] += sum(len(c.page_content) for c in batch)
+                yield batch
+        batches = contar_chunks(chunking)
         
-        # 2. Chunking (Model)
-        chunks_recursive = self.processor.split_recursive(documents, chunk_size=1500, chunk_overlap=300)
-        tamanho_medio_rec = sum(len(c.page_content) for c in chunks_recursive) / len(chunks_recursive)
-        self.view.exibir_estatisticas_chunking("RecursiveCharacterTextSplitter", len(chunks_recursive), tamanho_medio_rec)
+        # 3. Vector Store (Model) - apenas chunks novos ou alterados são embedados,
+        # em lotes paralelos e dentro da cota do Gemini
+        pipeline = _lazy("EmbeddingPipeline")(self.db_manager.embeddings, batch_size=50, max_workers=4, requests_per_minute=60)
+        inicio = time.perf_counter()
+        resultado = self.db_manager.sync_stream(batches, sources=arquivos, pipeline=pipeline)
+        tracer.record("ingestao.embed", time.perf_counter() - inicio - chunking.elapsed,
+                      chunks=resultado["adicionados"])
+        resultado["removidos"] += self.db_manager.delete_sources(ingestion_manager.removed_files())
         
-        # 3. Vector Store (Model)
-        vectorstore, criado_novo = self.db_manager.create_or_update(chunks_recursive)
-        self.view.exibir_status_banco(criado_novo, self.db_manager.persist_directory, len(chunks_recursive))
+        self.view.exibir_estatisticas_carregamento(ingestion_manager.stats)
+        if chunk_stats["total"]:
+            tamanho_medio_rec = chunk_stats["caracteres"] / chunk_stats["total"]
+            self.view.exibir_estatisticas_chunking("LegalStructureSplitter", chunk_stats["total"], tamanho_medio_rec)
+        ingestion_manager.commit()
+        self.view.exibir_status_sincronizacao(self.db_manager.persist_directory, resultado)
         
         self.view.exibir_sucesso("Pipeline executado com sucesso!")
 
@@ -79,19 +234,156 @@ class RAGController:
         self.view.exibir_titulo("ASSISTENTE JURÍDICO (CDC & LGPD)")
         print("Digite sua pergunta ou 'sair' para encerrar.")
         
-        while True:
-            pergunta = input("\nVocê: ")
-            if pergunta.lower() in ["sair", "exit", "quit"]:
-                break
-            
+        # Um único event loop para toda a sessão: os tokens são exibidos à medida que chegam
+        loop = asyncio.new_event_loop()
+        try:
+            while True:
+                pergunta = input("\nVocê: ")
+                if pergunta.lower() in ["sair", "exit", "quit"]:
+                    break
+                
+                loop.run_until_complete(self._responder_stream(pergunta))
+        finally:
+            loop.close()
+
+    def executar_pergunta(self, pergunta: str, caminho_perfil: Optional[str] = None, engine_perfil: str = "cprofile"):
+        """Responde uma única pergunta, opcionalmente perfilando a requisição."""
+        if caminho_perfil is None:
             resposta = self.rag_manager.ask(pergunta)
-            self.view.exibir_resposta_rag(pergunta, resposta)
+        else:
+            with profile(caminho_perfil, engine=engine_perfil) as perfil:
+                resposta = self.rag_manager.ask(pergunta)
+        self.view.exibir_resposta_rag(pergunta, resposta)
+        if caminho_perfil is not None:
+            self.view.exibir_perfil(perfil["relatorio"], caminho_perfil)
+
+    def migrar_para_mmap(self):
+        """Copia os vetores do Chroma para o backend mmap, sem reembedar."""
+        self.view.exibir_titulo("MIGRAÇÃO CHROMA -> MMAP")
+        manager_class = _lazy("VectorDatabaseManager")
+        with manager_class(persist_directory=self.DIRETORIOS["chroma"]) as origem, \
+                manager_class(persist_directory=self.DIRETORIOS["mmap"], backend="mmap") as destino:
+            total = _lazy("copy_vectors")(origem.backend, destino.backend)
+            destino.backend.optimize()
+            destino.rebuild_lexical_index()
+        self.view.exibir_sucesso(f"{total} chunks copiados para {self.DIRETORIOS['mmap']}.")
+
+    def exportar_snapshot(self, caminho: str, dtype: str = "int8"):
+        """Grava o corpus indexado (chunks, metadados, vetores e índice BM25) em um único arquivo."""
+        self.view.exibir_titulo("EXPORTAÇÃO DE SNAPSHOT")
+        inicio = time.perf_counter()
+        cabecalho = self.db_manager.export_snapshot(caminho, dtype=dtype)
+        self.view.exibir_snapshot("exportados para", caminho, cabecalho, time.perf_counter() - inicio)
+
+    def importar_snapshot(self, caminho: str):
+        """Substitui o banco pelo conteúdo de um snapshot, sem reembedar nem reprocessar os PDFs."""
+        self.view.exibir_titulo("IMPORTAÇÃO DE SNAPSHOT")
+        inicio = time.perf_counter()
+        cabecalho = self.db_manager.import_snapshot(caminho)
+        self.view.exibir_snapshot("importados de", caminho, cabecalho, time.perf_counter() - inicio)
+
+    def limpar_cache_pdf(self):
+        """Descarta o texto extraído dos PDFs; a próxima ingestão refaz o parsing."""
+        antes = self.pdf_cache.stats()
+        self.pdf_cache.invalidate()
+        self.view.exibir_sucesso(f"Cache de PDFs limpo ({antes['extracoes']} extrações, {antes['bytes'] / 1024:.0f} KB).")
+
+    def servir(self, porta: int = 8000, concorrencia: int = 8, fila: int = 64):
+        """Serve o assistente via HTTP para vários usuários, compartilhando banco, LLM e caches."""
+        self.view.exibir_titulo("SERVIDOR HTTP")
+        self.preaquecer()
+        _lazy("batch_query_embeddings")(self.db_manager)
+        app = _lazy("RAGServer")(self.rag_manager, max_concurrency=concorrencia, max_queue=fila)
+        print(f"POST http://127.0.0.1:{porta}/perguntar {{\"pergunta\": \"...\"}} (Ctrl+C encerra)")
+        _lazy("serve")(app, port=porta)
+
+    def executar_lote(self, caminho_entrada: str, caminho_saida: str, concorrencia: int = 4):
+        self.view.exibir_titulo("PERGUNTAS EM LOTE")
+        perguntas = ler_perguntas(caminho_entrada)
+        inicio = time.perf_counter()
+        resultados = self.rag_manager.ask_many(perguntas, concurrency=concorrencia)
+        duracao = time.perf_counter() - inicio
+        
+        with open(caminho_saida, "w", encoding="utf-8") as f:
+            for resultado in resultados:
+                f.write(json.dumps(resultado, ensure_ascii=False) + "\n")
+        self.view.exibir_resumo_lote(len(resultados), duracao, caminho_saida)
+
+    async def _responder_stream(self, pergunta: str):
+        self.view.iniciar_resposta_stream()
+        async for token in self.rag_manager.astream(pergunta):
+            self.view.exibir_token(token)
+        self.view.finalizar_resposta_stream()
+
+def ler_perguntas(caminho: str) -> List[str]:
+    """Lê perguntas de um JSONL (campo "pergunta") ou CSV (coluna "pergunta")."""
+    with open(caminho, encoding="utf-8") as f:
+        if caminho.endswith(".csv"):
+            return [linha["pergunta"] for linha in csv.DictReader(f) if linha.get("pergunta")]
+        return [json.loads(linha)["pergunta"] for linha in f if linha.strip()]
+
+def main(argv: Optional[List[str]] = None):
+    parser = argparse.ArgumentParser(description="Assistente Jurídico RAG (CDC & LGPD)")
+    parser.add_argument("--backend", choices=["chroma", "mmap"], default="chroma", help="backend vetorial")
+    parser.add_argument("--migrar-mmap", action="store_true", help="copia o banco Chroma para o backend mmap e encerra")
+    parser.add_argument("--limpar-cache-pdf", action="store_true", help="descarta o texto extraído dos PDFs e encerra")
+    parser.add_argument("--exportar-snapshot", metavar="ARQUIVO", help="grava o banco em um snapshot e encerra")
+    parser.add_argument("--importar-snapshot", metavar="ARQUIVO",
+                        help="substitui o banco pelo snapshot (sem chamar o modelo de embeddings) e encerra")
+    parser.add_argument("--snapshot-dtype", choices=["int8", "float16"], default="int8",
+                        help="precisão dos vetores no snapshot exportado")
+    parser.add_argument("--pergunta", help="responde uma única pergunta e encerra")
+    parser.add_argument("--perfil", help="perfila a pergunta de --pergunta e grava o resultado neste arquivo")
+    parser.add_argument("--perfil-engine", choices=["cprofile", "pyinstrument"], default="cprofile")
+    parser.add_argument("--lote", help="arquivo JSONL/CSV de perguntas para responder em lote")
+    parser.add_argument("--saida", default="respostas.jsonl", help="arquivo JSONL de saída do modo em lote")
+    parser.add_argument("--concorrencia", type=int, default=4, help="gerações simultâneas no modo em lote ou servidor")
+    parser.add_argument("--servir", action="store_true", help="serve o assistente via HTTP (requer uvicorn)")
+    parser.add_argument("--porta", type=int, default=8000, help="porta do modo servidor")
+    parser.add_argument("--fila", type=int, default=64, help="perguntas aguardando no modo servidor antes de responder 503")
+    parser.add_argument("--preaquecer", action="store_true",
+                        help="importa os módulos e abre o banco e os clientes antes do modo escolhido")
+    parser.add_argument("--metricas-arquivo", help="grava as métricas ao final (.json ou .prom)")
+    parser.add_argument("--metricas-porta", type=int, help="serve /metrics e /metrics.json nesta porta local")
+    args = parser.parse_args(argv)
+
+    if args.metricas_porta:
+        tracer.serve(args.metricas_porta)
 
-def main():
     view = RAGView()
-    controller = RAGController(view)
+    controller = RAGController(view, backend=args.backend)
+    try:
+        executar(controller, args)
+    finally:
+        if args.metricas_arquivo:
+            tracer.dump(args.metricas_arquivo)
+
+def executar(controller: RAGController, args: argparse.Namespace):
+    if args.preaquecer and not args.servir:  # o modo servidor sempre pré-aquece
+        controller.preaquecer()
+    if args.migrar_mmap:
+        controller.migrar_para_mmap()
+        return
+    if args.limpar_cache_pdf:
+        controller.limpar_cache_pdf()
+        return
+    if args.exportar_snapshot:
+        controller.exportar_snapshot(args.exportar_snapshot, args.snapshot_dtype)
+        return
+    if args.importar_snapshot:
+        controller.importar_snapshot(args.importar_snapshot)
+        return
+    if args.pergunta:
+        controller.executar_pergunta(args.pergunta, args.perfil, args.perfil_engine)
+        return
+    if args.lote:
+        controller.executar_lote(args.lote, args.saida, args.concorrencia)
+        return
+    if args.servir:
+        controller.servir(args.porta, args.concorrencia, args.fila)
+        return
     
-    print("\n[1] Rodar Ingestão (reconstruir banco)")
+    print("\n[1] Rodar Ingestão (sincronizar banco)")
     print("[2] Abrir Chat Assistente")
     opcao = input("\nEscolha uma opção: ")
     
@@ -0,0 +1,98 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+from benchmarks.bench_offline import compare
+from benchmarks.sintetico import StubGeminiServer
+from src.clientes import ResilientChatModel
+from src.metricas import Tracer
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && python benchmarks/bench_clientes.py --chamadas 400
+# Mede a latência de cauda (p95/p99) das chamadas ao LLM contra um servidor local que imita o Gemini com
+# latência de cauda longa no modelo primário: o cliente direto contra o ResilientChatModel (hedge no p95 e
+# fallback). Grava em benchmarks/resultados/ e compara com --baseline, como o bench_offline.
+
+PRIMARIO, RESERVA = "gemini-flash-latest", "gemini-flash-lite-latest"
+
+def stub_latency(rapida: float, lenta: float, fracao_lenta: float, reserva: float, seed: int = 0):
+    """Latência simulada: o primário é rápido, exceto numa fração das chamadas; a reserva é constante."""
+    rng, lock = random.Random(seed), threading.Lock()
+
+    def latency(model: str) -> float:
+        if model != PRIMARIO:
+            return reserva
+        with lock:
+            return lenta if rng.random() < fracao_lenta else rapida
+    return latency
+
+def measure(llm, chamadas: int, concorrencia: int) -> Dict[str, float]:
+    def chamar(i: int) -> float:
+        inicio = time.perf_counter()
+        llm.invoke(f"Pergunta {i}: quais os direitos do consumidor?")
+        return (time.perf_counter() - inicio) * 1000
+
+    with ThreadPoolExecutor(max_workers=concorrencia) as executor:
+        tempos = sorted(executor.map(chamar, range(chamadas)))
+    return {"p50_ms": statistics.median(tempos), "p95_ms": tempos[int(0.95 * (len(tempos) - 1))],
+            "p99_ms": tempos[int(0.99 * (len(tempos) - 1))]}
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de latência de cauda do cliente do LLM")
+    parser.add_argument("--chamadas", type=int, default=400)
+    parser.add_argument("--concorrencia", type=int, default=4)
+    parser.add_argument("--rapida", type=float, default=0.02, help="latência usual do primário (s)")
+    parser.add_argument("--lenta", type=float, default=0.8, help="latência da cauda do primário (s)")
+    parser.add_argument("--fracao-lenta", type=float, default=0.05, help="fração das chamadas na cauda")
+    parser.add_argument("--reserva", type=float, default=0.05, help="latência do modelo de fallback (s)")
+    parser.add_argument("--saida", help="arquivo JSON de resultados (padrão: benchmarks/resultados/clientes-<data>.json)")
+    parser.add_argument("--baseline", help="resultado anterior para comparação")
+    parser.add_argument("--tolerancia", type=float, default=0.15, help="piora relativa aceita antes de acusar regressão")
+    args = parser.parse_args(argv)
+
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    latency = stub_latency(args.rapida, args.lenta, args.fracao_lenta, args.reserva)
+    resultados, tracer = {}, Tracer()
+    with StubGeminiServer(latency=latency) as stub:
+        def cliente(model: str):
+            return ChatGoogleGenerativeAI(model=model, google_api_key="stub", base_url=stub.url, max_retries=0,
+                                          timeout=30)
+        primario, reserva = cliente(PRIMARIO), cliente(RESERVA)
+        resultados["direto"] = measure(primario, args.chamadas, args.concorrencia)
+        resiliente = ResilientChatModel(models=[primario, reserva], stage="bench", tracer=tracer)
+        measure(resiliente, 50, args.concorrencia)  # aquecimento: amostras para o p95 do hedge
+        tracer.reset()
+        resultados["resiliente"] = measure(resiliente, args.chamadas, args.concorrencia)
+        chamadas = tracer.to_json()["llm.bench"]
+        resultados["resiliente"]["tentativas_por_chamada"] = chamadas["contadores"]["tentativas"] / chamadas["contagem"]
+        resultados["resiliente"]["hedge_ms"] = (resiliente.hedge_delay() or 0.0) * 1000
+
+    execucao = {
+        "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {k: v for k, v in vars(args).items() if k not in ("saida", "baseline", "tolerancia")},
+        "resultados": resultados,
+    }
+    saida = args.saida or os.path.join("benchmarks", "resultados", "clientes-" + time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, "w", encoding="utf-8") as f:
+        json.dump(execucao, f, ensure_ascii=False, indent=2)
+    print(json.dumps(resultados, ensure_ascii=False, indent=2))
+    print(f"Resultados gravados em {saida}.")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressoes = compare(execucao, json.load(f), args.tolerancia)
+        for r in regressoes:
+            print(f"REGRESSÃO {r['metrica']}: {r['baseline']:.3f} -> {r['atual']:.3f} ({r['piora']:+.0%})")
+        if regressoes:
+            return 1
+        print("Sem regressões em relação ao baseline.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,185 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional
+import numpy as np
+from benchmarks.sintetico import FakeLegalLLM, HashEmbeddings, synthetic_corpus, synthetic_questions
+from src.cache import AnswerCache
+from src.indexacao import EmbeddingPipeline
+from src.metricas import Tracer
+from src.rag import RAGChainManager, VectorDatabaseManager
+from src.reranking import LLMReranker
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && python benchmarks/bench_offline.py --tamanhos 1k,100k
+# Não usa rede: embeddings e LLM são substitutos determinísticos com latência configurável.
+# Compare com uma execução anterior via --baseline benchmarks/resultados/<arquivo>.json.
+
+MODOS_BUSCA = ["vector", "lexical", "hybrid"]
+
+# Métricas em que um valor maior é melhor; nas demais (latência, memória) maior é pior.
+MAIOR_MELHOR = ("por_segundo", "hit_ratio")
+
+def parse_size(texto: str) -> int:
+    """Converte "1k", "100k" ou "1m" em número de chunks."""
+    texto = texto.strip().lower()
+    multiplicador = {"k": 1_000, "m": 1_000_000}.get(texto[-1:], 1)
+    return int(float(texto.rstrip("km")) * multiplicador)
+
+def _rss_mb() -> float:
+    if resource is None:
+        return 0.0
+    # ru_maxrss vem em KB no Linux e em bytes no macOS
+    escala = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / escala
+
+def _percentis(latencias: List[float]) -> Dict[str, float]:
+    amostras = np.asarray(latencias) * 1000
+    return {"p50_ms": float(np.percentile(amostras, 50)), "p99_ms": float(np.percentile(amostras, 99))}
+
+def run_benchmark(size: int, questions: int = 200, embedding_latency: float = 0.0,
+                  llm_latency: float = 0.0, workdir: Optional[str] = None, backend: str = "chroma") -> Dict:
+    """Executa ingestão, buscas, rerank e respostas em cache sobre um corpus sintético de `size` chunks."""
+    diretorio = workdir or tempfile.mkdtemp(prefix="bench_rag_")
+    embeddings = HashEmbeddings(latency=embedding_latency)
+    db_manager = VectorDatabaseManager(persist_directory=os.path.join(diretorio, "chroma_db"),
+                                       embedding_model="hash-256", embeddings=embeddings, tracer=Tracer(),
+                                       backend=backend)
+    rss_inicial = _rss_mb()
+    try:
+        # Ingestão
+        pipeline = EmbeddingPipeline(db_manager.embeddings, batch_size=100, max_workers=4, requests_per_minute=1e9)
+        inicio = time.perf_counter()
+        sincronizacao = db_manager.sync_stream(synthetic_corpus(size), sources=["sintetico/cdc.pdf", "sintetico/lgpd.pdf"],
+                                               pipeline=pipeline)
+        segundos = time.perf_counter() - inicio
+        resultado = {
+            "ingestao": {
+                "chunks": sincronizacao["adicionados"],
+                "segundos": segundos,
+                "chunks_por_segundo": sincronizacao["adicionados"] / segundos if segundos > 0 else 0.0,
+            },
+            "busca": {},
+        }
+        perguntas = synthetic_questions(questions)
+
+        # Busca
+        for modo in MODOS_BUSCA:
+            latencias = []
+            for pergunta in perguntas:
+                inicio = time.perf_counter()
+                db_manager.search(pergunta, k=10, mode=modo)
+                latencias.append(time.perf_counter() - inicio)
+            resultado["busca"][modo] = _percentis(latencias)
+
+        # Rerank: custo adicional sobre os candidatos já recuperados
+        candidatos = [db_manager.search(p, k=10, mode="hybrid") for p in perguntas[:50]]
+        rerankers = {"local": db_manager.local_reranker(), "llm": LLMReranker(FakeLegalLLM(latency=llm_latency))}
+        resultado["rerank"] = {}
+        for nome, reranker in rerankers.items():
+            latencias = []
+            for pergunta, docs in zip(perguntas, candidatos):
+                inicio = time.perf_counter()
+                reranker.rerank(pergunta, docs, k=4)
+                latencias.append(time.perf_counter() - inicio)
+            resultado["rerank"][nome] = _percentis(latencias)
+
+        # Respostas completas com os caches ativos
+        answer_cache = AnswerCache()
+        rag_manager = RAGChainManager(db_manager, model_name="fake-legal", answer_cache=answer_cache,
+                                      tracer=db_manager.tracer, reranker=rerankers["local"],
+                                      llm=FakeLegalLLM(latency=llm_latency))
+        latencias = []
+        for pergunta in perguntas:
+            inicio = time.perf_counter()
+            rag_manager.ask(pergunta)
+            latencias.append(time.perf_counter() - inicio)
+        resultado["resposta"] = _percentis(latencias)
+        resultado["cache"] = {
+            "respostas_hit_ratio": answer_cache.stats()["hit_ratio"],
+            "embeddings_hit_ratio": db_manager.embeddings.stats()["hit_ratio"],
+        }
+        resultado["memoria"] = {"rss_pico_mb": _rss_mb(), "rss_acrescimo_mb": _rss_mb() - rss_inicial}
+        return resultado
+    finally:
+        db_manager.close()
+        if workdir is None:
+            shutil.rmtree(diretorio, ignore_errors=True)
+
+def flatten(resultado: Dict, prefixo: str = "") -> Dict[str, float]:
+    """Achata o dicionário de resultados em {"busca.hybrid.p50_ms": valor, ...}."""
+    plano = {}
+    for chave, valor in resultado.items():
+        nome = f"{prefixo}.{chave}" if prefixo else chave
+        if isinstance(valor, dict):
+            plano.update(flatten(valor, nome))
+        elif isinstance(valor, (int, float)) and not isinstance(valor, bool):
+            plano[nome] = valor
+    return plano
+
+def compare(atual: Dict, baseline: Dict, tolerancia: float = 0.15) -> List[Dict]:
+    """Lista as métricas que pioraram mais que `tolerancia` (fração) em relação ao baseline."""
+    regressoes = []
+    anterior = flatten(baseline.get("resultados", {}))
+    for nome, valor in flatten(atual.get("resultados", {})).items():
+        referencia = anterior.get(nome)
+        if not referencia or nome.endswith(".chunks"):
+            continue
+        variacao = (valor - referencia) / abs(referencia)
+        if nome.endswith(MAIOR_MELHOR):
+            variacao = -variacao
+        if variacao > tolerancia:
+            regressoes.append({"metrica": nome, "baseline": referencia, "atual": valor, "piora": variacao})
+    return regressoes
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark offline do pipeline RAG")
+    parser.add_argument("--tamanhos", default="1k", help="tamanhos do corpus separados por vírgula (ex.: 1k,100k,1m)")
+    parser.add_argument("--perguntas", type=int, default=200)
+    parser.add_argument("--backend", choices=["chroma", "mmap"], default="chroma", help="backend vetorial avaliado")
+    parser.add_argument("--latencia-embedding", type=float, default=0.0, help="segundos por chamada de embedding")
+    parser.add_argument("--latencia-llm", type=float, default=0.0, help="segundos por chamada ao LLM")
+    parser.add_argument("--saida", help="arquivo JSON de resultados (padrão: benchmarks/resultados/<data>.json)")
+    parser.add_argument("--baseline", help="resultado anterior para comparação")
+    parser.add_argument("--tolerancia", type=float, default=0.15, help="piora relativa aceita antes de acusar regressão")
+    args = parser.parse_args(argv)
+
+    execucao = {
+        "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"backend": args.backend, "perguntas": args.perguntas, "latencia_embedding": args.latencia_embedding,
+                   "latencia_llm": args.latencia_llm},
+        "resultados": {},
+    }
+    for tamanho in args.tamanhos.split(","):
+        print(f"Corpus sintético de {parse_size(tamanho)} chunks...")
+        execucao["resultados"][tamanho.strip()] = run_benchmark(
+            parse_size(tamanho), args.perguntas, args.latencia_embedding, args.latencia_llm, backend=args.backend
+        )
+
+    saida = args.saida or os.path.join("benchmarks", "resultados", time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, "w", encoding="utf-8") as f:
+        json.dump(execucao, f, ensure_ascii=False, indent=2)
+    print(json.dumps(execucao["resultados"], ensure_ascii=False, indent=2))
+    print(f"Resultados gravados em {saida}.")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressoes = compare(execucao, json.load(f), args.tolerancia)
+        for r in regressoes:
+            print(f"REGRESSÃO {r['metrica']}: {r['baseline']:.3f} -> {r['atual']:.3f} ({r['piora']:+.0%})")
+        if regressoes:
+            return 1
+        print("Sem regressões em relação ao baseline.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
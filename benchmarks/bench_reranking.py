@@ -0,0 +1,36 @@
+import json
+from src.rag import VectorDatabaseManager, RAGChainManager
+from src.reranking import compare_rerankers
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && python benchmarks/bench_reranking.py
+# Requer GOOGLE_API_KEY e o banco vetorial (chroma_db) já ingerido.
+
+PERGUNTAS = [
+    "O consumidor pode desistir da compra feita pela internet?",
+    "Quais as responsabilidades do fornecedor?",
+    "Em que casos o consentimento é obrigatório?",
+    "Quais são os direitos do titular de dados pessoais?",
+    "O que diz o art. 18 da LGPD?",
+    "Qual o prazo para reclamar de vícios aparentes?",
+    "O que é considerado dado pessoal sensível?",
+    "O fornecedor pode se eximir de responsabilidade?",
+]
+
+def main():
+    db_manager = VectorDatabaseManager()
+    rag_manager = RAGChainManager(db_manager)
+    rerankers = {
+        "llm": rag_manager.reranker,
+        "local": db_manager.local_reranker(),
+    }
+    resultados = compare_rerankers(
+        PERGUNTAS,
+        retrieve=lambda pergunta: db_manager.search(pergunta, k=10, mode=rag_manager.search_mode),
+        rerankers=rerankers,
+        reference="llm",
+        k=4
+    )
+    print(json.dumps(resultados, indent=2, ensure_ascii=False))
+
+if __name__ == "__main__":
+    main()
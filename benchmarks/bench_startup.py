@@ -0,0 +1,69 @@
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import Dict, List, Optional
+from benchmarks.bench_offline import compare
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && python benchmarks/bench_startup.py --repeticoes 10
+# Mede o tempo de inicialização da CLI em processos novos (sem cache de módulos) e,
+# como o bench_offline, grava o resultado em benchmarks/resultados/ e compara com --baseline.
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+CENARIOS = {
+    "import_app": [sys.executable, "-c", "import app"],
+    "ajuda": [sys.executable, "app.py", "--help"],
+    "controlador": [sys.executable, "-c", "import app; app.RAGController(app.RAGView())"],
+    # Custo pago pelo --preaquecer (e pelo primeiro uso de um modo) ao importar o pipeline
+    "import_pipeline": [sys.executable, "-c", "import src.ingestao, src.rag, src.servidor"],
+}
+
+def measure(comando: List[str], repeticoes: int) -> Dict[str, float]:
+    """Mediana e mínimo, em ms, de `repeticoes` execuções do comando (após uma de aquecimento do disco)."""
+    env = {**os.environ, "PYTHONPATH": RAIZ + os.pathsep + os.environ.get("PYTHONPATH", "")}
+    tempos = []
+    for i in range(repeticoes + 1):
+        inicio = time.perf_counter()
+        subprocess.run(comando, cwd=RAIZ, env=env, check=True, stdout=subprocess.DEVNULL)
+        if i:
+            tempos.append((time.perf_counter() - inicio) * 1000)
+    return {"p50_ms": statistics.median(tempos), "min_ms": min(tempos)}
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark de inicialização da CLI")
+    parser.add_argument("--repeticoes", type=int, default=10)
+    parser.add_argument("--saida", help="arquivo JSON de resultados (padrão: benchmarks/resultados/inicializacao-<data>.json)")
+    parser.add_argument("--baseline", help="resultado anterior para comparação")
+    parser.add_argument("--tolerancia", type=float, default=0.15, help="piora relativa aceita antes de acusar regressão")
+    args = parser.parse_args(argv)
+
+    execucao = {
+        "data": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "config": {"repeticoes": args.repeticoes, "python": sys.version.split()[0]},
+        "resultados": {nome: measure(comando, args.repeticoes) for nome, comando in CENARIOS.items()},
+    }
+
+    saida = args.saida or os.path.join("benchmarks", "resultados",
+                                       "inicializacao-" + time.strftime("%Y%m%d-%H%M%S") + ".json")
+    os.makedirs(os.path.dirname(os.path.abspath(saida)), exist_ok=True)
+    with open(saida, "w", encoding="utf-8") as f:
+        json.dump(execucao, f, ensure_ascii=False, indent=2)
+    print(json.dumps(execucao["resultados"], ensure_ascii=False, indent=2))
+    print(f"Resultados gravados em {saida}.")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressoes = compare(execucao, json.load(f), args.tolerancia)
+        for r in regressoes:
+            print(f"REGRESSÃO {r['metrica']}: {r['baseline']:.3f} -> {r['atual']:.3f} ({r['piora']:+.0%})")
+        if regressoes:
+            return 1
+        print("Sem regressões em relação ao baseline.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,66 @@
+import argparse
+import json
+import os
+import shutil
+import sys
+import tempfile
+from typing import List, Optional
+from app import ler_perguntas
+from benchmarks.bench_reranking import PERGUNTAS
+from benchmarks.sintetico import HashEmbeddings, synthetic_corpus, synthetic_questions
+from src.confianca import ConfidencePolicy, calibrate, collect_samples, evaluate
+from src.rag import RAGChainManager, VectorDatabaseManager
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && python benchmarks/calibrar_confianca.py --perguntas perguntas.jsonl
+# Calibra os limiares da ConfidencePolicy no banco ingerido: o reranker de referência (LLM, ou o local com
+# --referencia local) ordena os 20 candidatos de cada pergunta e a política grava em <banco>/confianca.json,
+# que o app.py carrega. Requer GOOGLE_API_KEY; --sintetico 2000 roda sem rede, num corpus sintético.
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Calibração da política de confiança da busca")
+    parser.add_argument("--banco", default="./chroma_db", help="diretório do banco vetorial")
+    parser.add_argument("--backend", choices=["chroma", "mmap"], default="chroma")
+    parser.add_argument("--perguntas", help="JSONL/CSV de perguntas (padrão: as do bench_reranking)")
+    parser.add_argument("--referencia", choices=["llm", "local"], default="llm", help="reranker de referência")
+    parser.add_argument("--min-qualidade", type=float, default=0.95,
+                        help="fração mínima de perguntas que mantêm o chunk preferido pela referência")
+    parser.add_argument("--sintetico", type=int,
+                        help="calibra num corpus sintético deste tamanho, sem rede (referência local)")
+    parser.add_argument("--saida", help="arquivo da política (padrão: <banco>/confianca.json)")
+    args = parser.parse_args(argv)
+
+    temporario = None
+    if args.sintetico:
+        temporario = tempfile.mkdtemp(prefix="calibracao_")
+        db_manager = VectorDatabaseManager(persist_directory=os.path.join(temporario, "db"), embeddings=HashEmbeddings(),
+                                           backend=args.backend)
+        db_manager.sync_stream(synthetic_corpus(args.sintetico), sources=["sintetico/cdc.pdf", "sintetico/lgpd.pdf"])
+        perguntas = list(dict.fromkeys(synthetic_questions(200, repeat_ratio=0.0)))
+        reference = db_manager.local_reranker()
+    else:
+        db_manager = VectorDatabaseManager(persist_directory=args.banco, backend=args.backend)
+        perguntas = ler_perguntas(args.perguntas) if args.perguntas else PERGUNTAS
+        reference = (RAGChainManager(db_manager).reranker if args.referencia == "llm"
+                     else db_manager.local_reranker())
+
+    try:
+        base = ConfidencePolicy()
+        samples = collect_samples(
+            lambda pergunta: db_manager.search(pergunta, k=base.widen_k, mode="hybrid"), perguntas, reference,
+            final_k=base.final_k
+        )
+        policy, relatorio = calibrate(samples, min_quality=args.min_qualidade, base=base)
+        relatorio["padrao_atual"] = evaluate(base, samples)
+        print(json.dumps({"limiares": policy.to_dict(), "relatorio": relatorio}, ensure_ascii=False, indent=2))
+        if not args.sintetico or args.saida:
+            saida = args.saida or os.path.join(args.banco, "confianca.json")
+            policy.save(saida)
+            print(f"Política gravada em {saida}.")
+    finally:
+        db_manager.close()
+        if temporario:
+            shutil.rmtree(temporario, ignore_errors=True)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+import hashlib
+import json
+import random
+import threading
+import time
+from collections import deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Dict, Iterator, List, Optional
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+from src.ingestao import DocumentProcessor
+from src.lexico import tokenize
+
+# Substitutos determinísticos do Gemini e corpus jurídico sintético para benchmarks offline.
+
+SUJEITOS = ["o consumidor", "o fornecedor", "o titular", "o controlador", "o operador",
+            "a autoridade nacional", "o encarregado", "o comerciante", "o fabricante", "o órgão público"]
+VERBOS = ["tem direito a", "responde por", "deverá garantir", "poderá solicitar", "é obrigado a informar",
+          "não poderá exigir", "deve assegurar", "fica sujeito a"]
+OBJETOS = ["reparação de danos", "tratamento de dados pessoais", "informação clara e adequada",
+           "proteção contra publicidade enganosa", "eliminação dos dados", "portabilidade dos dados",
+           "substituição do produto", "restituição da quantia paga", "consentimento específico",
+           "segurança da informação", "anonimização dos dados", "abatimento proporcional do preço",
+           "prazo de reflexão de sete dias", "vício do produto ou serviço", "revisão de decisões automatizadas"]
+CONDICOES = ["nos termos do regulamento", "salvo disposição em contrário", "no prazo de trinta dias",
+             "independentemente de culpa", "mediante requisição expressa", "sem prejuízo das sanções cabíveis"]
+
+class HashEmbeddings(Embeddings):
+    """Embeddings determinísticos por hashing de termos (sem rede).
+
+    Cada termo da tokenização jurídica vira uma posição pseudoaleatória do
+    vetor, então textos com termos em comum têm cosseno alto, como num modelo
+    real. `latency` simula o tempo de cada chamada e `latency_per_text` o
+    custo adicional por texto do lote.
+    """
+    def __init__(self, size: int = 256, latency: float = 0.0, latency_per_text: float = 0.0):
+        self.size = size
+        self.latency = latency
+        self.latency_per_text = latency_per_text
+        self.calls = 0
+
+    def _vector(self, text: str) -> List[float]:
+        vector = np.zeros(self.size, dtype=np.float32)
+        for term in tokenize(text):
+            digest = hashlib.blake2b(term.encode("utf-8"), digest_size=8).digest()
+            value = int.from_bytes(digest, "little")
+            vector[value % self.size] += 1.0 if value >> 63 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def _wait(self, texts: int):
+        self.calls += 1
+        delay = self.latency + self.latency_per_text * texts
+        if delay > 0:
+            time.sleep(delay)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        self._wait(len(texts))
+        return [self._vector(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self._wait(1)
+        return self._vector(text)
+
+class FakeLegalLLM(BaseChatModel):
+    """Chat model determinístico com latência configurável.
+
+    Responde aos prompts de reranking com os primeiros IDs e aos demais com
+    uma resposta fixa citando a fonte, informando uso de tokens aproximado.
+    """
+    latency: float = 0.0
+    latency_per_token: float = 0.0
+    calls: int = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-legal"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Any = None, **kwargs: Any) -> ChatResult:
+        prompt = "\n".join(str(message.content) for message in messages)
+        if "IDs dos" in prompt:
+            text = "0, 1, 2, 3"
+        else:
+            text = "Conforme o contexto recuperado, o consumidor tem direito à reparação (CDC)."
+        input_tokens = len(prompt) // 4
+        output_tokens = len(text.split())
+        delay = self.latency + self.latency_per_token * output_tokens
+        if delay > 0:
+            time.sleep(delay)
+        self.calls += 1
+        message = AIMessage(content=text, usage_metadata={
+            "input_tokens": input_tokens, "output_tokens": output_tokens,
+            "total_tokens": input_tokens + output_tokens,
+        })
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+# Status da API do Gemini para cada código HTTP simulado pelo StubGeminiServer
+STATUS_HTTP = {400: "INVALID_ARGUMENT", 429: "RESOURCE_EXHAUSTED", 500: "INTERNAL", 503: "UNAVAILABLE"}
+
+class StubGeminiServer:
+    """Servidor HTTP local que imita `generateContent` e `streamGenerateContent` da API do Gemini.
+
+    Aponte o cliente real para `url` (`ChatGoogleGenerativeAI(base_url=...)`)
+    para testar prazos, cotas e fallback sem rede. `latency(modelo)` dá o
+    atraso de cada resposta e `fail(modelo, *status)` enfileira erros HTTP para
+    as próximas requisições do modelo. Como o `FakeLegalLLM`, responde aos
+    prompts de reranking com os primeiros IDs. `requests` guarda o modelo de
+    cada requisição recebida.
+    """
+    def __init__(self, latency: Optional[Callable[[str], float]] = None):
+        self.latency = latency or (lambda model: 0.0)
+        self.requests: List[str] = []
+        self._failures: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self._server: Optional[ThreadingHTTPServer] = None
+
+    def fail(self, model: str, *statuses: int):
+        with self._lock:
+            self._failures.setdefault(model, deque()).extend(statuses)
+
+    def _next_failure(self, model: str) -> Optional[int]:
+        with self._lock:
+            self.requests.append(model)
+            queue = self._failures.get(model)
+            return queue.popleft() if queue else None
+
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self._server.server_port}"
+
+    def start(self) -> "StubGeminiServer":
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # conexões persistentes, como no pool do cliente
+
+            def do_POST(self):
+                request = self.rfile.read(int(self.headers.get("Content-Length", 0))).decode("utf-8")
+                model = self.path.split("/models/")[1].split(":")[0]
+                status = stub._next_failure(model)
+                if status is not None:
+                    self._send(status, "application/json", json.dumps({"error": {
+                        "code": status, "message": "falha simulada", "status": STATUS_HTTP.get(status, "UNKNOWN")}}))
+                    return
+                time.sleep(stub.latency(model))
+                text = "0, 1, 2, 3" if "IDs dos" in request else f"Resposta simulada por {model} (CDC)."
+                body = {"candidates": [{"content": {"parts": [{"text": text}], "role": "model"}, "finishReason": "STOP"}],
+                        "usageMetadata": {"promptTokenCount": len(request) // 4,
+                                          "candidatesTokenCount": len(text.split()),
+                                          "totalTokenCount": len(request) // 4 + len(text.split())}}
+                if "streamGenerateContent" in self.path:
+                    self._send(200, "text/event-stream", f"data: {json.dumps(body)}\r\n\r\n")
+                else:
+                    self._send(200, "application/json", json.dumps(body))
+
+            def _send(self, status: int, content_type: str, body: str):
+                data = body.encode("utf-8")
+                try:
+                    self.send_response(status)
+                    self.send_header("Content-Type", content_type)
+                    self.send_header("Content-Length", str(len(data)))
+                    self.end_headers()
+                    self.wfile.write(data)
+                except (BrokenPipeError, ConnectionResetError):
+                    pass  # o cliente desistiu (prazo estourado ou hedge cancelado)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._server.daemon_threads = True
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def close(self):
+        if self._server is not None:
+            self._server.shutdown()
+            self._server.server_close()
+
+    def __enter__(self) -> "StubGeminiServer":
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.close()
+
+def _artigo(rng: random.Random, numero: int) -> str:
+    frases = []
+    for _ in range(rng.randint(2, 4)):
+        frases.append(f"{rng.choice(SUJEITOS).capitalize()} {rng.choice(VERBOS)} "
+                      f"{rng.choice(OBJETOS)}, {rng.choice(CONDICOES)}.")
+    paragrafo = f"§ {rng.randint(1, 4)}º {rng.choice(SUJEITOS).capitalize()} {rng.choice(VERBOS)} {rng.choice(OBJETOS)}."
+    return f"Art. {numero}º " + " ".join(frases) + " " + paragrafo
+
+def synthetic_corpus(size: int, seed: int = 0, batch_size: int = 1000) -> Iterator[List[Document]]:
+    """Gera `size` chunks jurídicos sintéticos (CDC/LGPD) em lotes, sem materializar o corpus."""
+    rng = random.Random(seed)
+    processor = DocumentProcessor()
+    for start in range(0, size, batch_size):
+        batch = []
+        for i in range(start, min(size, start + batch_size)):
+            fonte = "cdc" if i % 2 == 0 else "lgpd"
+            batch.append(Document(
+                page_content=_artigo(rng, i + 1),
+                metadata={"source": f"sintetico/{fonte}.pdf", "page": i // 20, "fonte": fonte}
+            ))
+        yield processor.assign_ids(batch)
+
+def synthetic_questions(count: int, seed: int = 1, repeat_ratio: float = 0.3) -> List[str]:
+    """Gera perguntas sintéticas; `repeat_ratio` delas repetem perguntas anteriores (acertos de cache)."""
+    rng = random.Random(seed)
+    questions: List[str] = []
+    for _ in range(count):
+        if questions and rng.random() < repeat_ratio:
+            questions.append(rng.choice(questions))
+        else:
+            questions.append(f"{rng.choice(SUJEITOS).capitalize()} {rng.choice(VERBOS)} {rng.choice(OBJETOS)}?")
+    return questions
@@ -0,0 +1,356 @@
+import asyncio
+import hashlib
+import inspect
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+import numpy as np
+from typing import Dict, List, Optional, Tuple
+from langchain_core.embeddings import Embeddings
+
+def normalize_query(text: str) -> str:
+    """Normaliza a pergunta (Unicode NFC, caixa e espaços) para uso como chave de cache."""
+    text = unicodedata.normalize("NFC", text)
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+def embed_query_batch(embeddings: Embeddings, texts: List[str]) -> List[List[float]]:
+    """Embeda várias perguntas numa única chamada ao modelo."""
+    # Modelos com task_type (Gemini) diferenciam embeddings de consulta e de documento.
+    if "task_type" in inspect.signature(embeddings.embed_documents).parameters:
+        return embeddings.embed_documents(texts, task_type="RETRIEVAL_QUERY")
+    return embeddings.embed_documents(texts)
+
+class LRUCache:
+    """Cache em memória com limite de itens e descarte do menos usado (LRU)."""
+    def __init__(self, max_size: int = 1024):
+        self.max_size = max_size
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key not in self._data:
+                return None
+            self._data.move_to_end(key)
+            return self._data[key]
+
+    def put(self, key, value):
+        with self._lock:
+            self._data[key] = value
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+    def __len__(self):
+        return len(self._data)
+
+class CachedEmbeddings(Embeddings):
+    """Cache de embeddings de consulta: LRU em memória com persistência em SQLite.
+
+    Apenas `embed_query` é cacheado; `embed_documents` é repassado ao modelo
+    original, pois a ingestão não repete textos. O SQLite guarda no máximo
+    `max_disk_rows` vetores; acima disso, os usados há mais tempo são descartados.
+    """
+    def __init__(self, embeddings: Embeddings, model_name: str, cache_path: Optional[str] = None, max_size: int = 1024,
+                 max_disk_rows: int = 100_000):
+        self.embeddings = embeddings
+        self.model_name = model_name
+        self.cache_path = cache_path
+        self.memory = LRUCache(max_size)
+        self.max_disk_rows = max_disk_rows
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.model_name}\0{normalize_query(text)}".encode("utf-8")).hexdigest()
+
+    def _connection(self) -> Optional[sqlite3.Connection]:
+        if self.cache_path is None:
+            return None
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.cache_path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.cache_path, check_same_thread=False)
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings (key TEXT PRIMARY KEY, model TEXT, vector BLOB, acesso REAL)"
+            )
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(query_embeddings)")]
+            if "acesso" not in columns:  # caches gravados antes do limite de linhas
+                self._conn.execute("ALTER TABLE query_embeddings ADD COLUMN acesso REAL DEFAULT 0")
+            self._conn.execute("CREATE INDEX IF NOT EXISTS query_embeddings_acesso ON query_embeddings (acesso)")
+            self._conn.commit()
+        return self._conn
+
+    def _load(self, key: str) -> Optional[List[float]]:
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return None
+            row = conn.execute("SELECT vector FROM query_embeddings WHERE key = ?", (key,)).fetchone()
+            if row is not None:
+                conn.execute("UPDATE query_embeddings SET acesso = ? WHERE key = ?", (time.time(), key))
+                conn.commit()
+        if row is None:
+            return None
+        vector = array("f")
+        vector.frombytes(row[0])
+        return vector.tolist()
+
+    def _store(self, key: str, vector: List[float]):
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return
+            conn.execute(
+                "INSERT OR REPLACE INTO query_embeddings (key, model, vector, acesso) VALUES (?, ?, ?, ?)",
+                (key, self.model_name, array("f", vector).tobytes(), time.time())
+            )
+            excess = conn.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0] - self.max_disk_rows
+            if excess > 0:
+                conn.execute(
+                    "DELETE FROM query_embeddings WHERE key IN "
+                    "(SELECT key FROM query_embeddings WHERE key != ? ORDER BY acesso LIMIT ?)", (key, excess)
+                )
+            conn.commit()
+
+    def embed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        vector = self.memory.get(key)
+        if vector is not None:
+            self.hits += 1
+            return vector
+
+        vector = self._load(key)
+        if vector is not None:
+            self.hits += 1
+            self.disk_hits += 1
+            self.memory.put(key, vector)
+            return vector
+
+        self.misses += 1
+        vector = self.embeddings.embed_query(text)
+        self.memory.put(key, vector)
+        self._store(key, vector)
+        return vector
+
+    def embed_queries(self, texts: List[str]) -> List[List[float]]:
+        """Embeda várias perguntas; as que não estão em cache vão ao modelo em uma única chamada."""
+        keys = [self._key(text) for text in texts]
+        vectors: List[Optional[List[float]]] = []
+        for key in keys:
+            vector = self.memory.get(key)
+            if vector is None:
+                vector = self._load(key)
+                if vector is not None:
+                    self.disk_hits += 1
+                    self.memory.put(key, vector)
+            if vector is not None:
+                self.hits += 1
+            vectors.append(vector)
+
+        missing = {}
+        for i, vector in enumerate(vectors):
+            if vector is None:
+                missing.setdefault(keys[i], []).append(i)
+        if missing:
+            first = [positions[0] for positions in missing.values()]
+            self.misses += len(first)
+            embedded = embed_query_batch(self.embeddings, [texts[i] for i in first])
+            for (key, positions), vector in zip(missing.items(), embedded):
+                self.memory.put(key, vector)
+                self._store(key, vector)
+                for i in positions:
+                    vectors[i] = vector
+        return vectors
+
+    async def aembed_query(self, text: str) -> List[float]:
+        key = self._key(text)
+        vector = self.memory.get(key)
+        if vector is None:
+            vector = await asyncio.to_thread(self._load, key)
+            if vector is not None:
+                self.disk_hits += 1
+        if vector is not None:
+            self.hits += 1
+            self.memory.put(key, vector)
+            return vector
+
+        self.misses += 1
+        vector = await self.embeddings.aembed_query(text)
+        self.memory.put(key, vector)
+        await asyncio.to_thread(self._store, key, vector)
+        return vector
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def stats(self) -> Dict[str, float]:
+        """Retorna contadores de acerto/erro do cache."""
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "memory_size": len(self.memory),
+        }
+
+    def disk_size(self) -> int:
+        """Número de vetores gravados no SQLite."""
+        with self._lock:
+            conn = self._connection()
+            if conn is None:
+                return 0
+            return conn.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()[0]
+
+    def close(self):
+        """Fecha a conexão com o SQLite; ela é reaberta no próximo acesso."""
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+class AnswerCache:
+    """Cache de respostas do RAG com TTL e limite de tamanho (LRU).
+
+    A chave combina a pergunta normalizada, o modelo, a versão do template de
+    prompt e a impressão digital (`fingerprint`) dos chunks recuperados, então
+    uma resposta só é reaproveitada quando a evidência é idêntica; qualquer
+    mudança no índice que altere os chunks invalida a entrada automaticamente.
+    Com `similarity_threshold` e `embeddings`, perguntas quase idênticas
+    (cosseno acima do limiar) com a mesma evidência também acertam o cache;
+    os vetores normalizados de cada escopo (modelo, prompt, evidência) ficam
+    numa matriz, e a busca é um único produto matriz-vetor.
+    """
+    def __init__(self, max_size: int = 512, ttl: Optional[float] = 3600.0,
+                 similarity_threshold: Optional[float] = None, embeddings: Optional[Embeddings] = None,
+                 clock=time.monotonic):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.embeddings = embeddings
+        self.clock = clock
+        self.hits = 0
+        self.similar_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._scopes: Dict[tuple, Dict[str, np.ndarray]] = {}  # escopo -> chave -> vetor normalizado
+        self._matrices: Dict[tuple, Tuple[List[str], np.ndarray]] = {}  # montadas sob demanda
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def fingerprint(chunk_ids: List[str]) -> str:
+        """Hash estável da lista ordenada de IDs de chunks usados como evidência."""
+        return hashlib.sha256("\0".join(chunk_ids).encode("utf-8")).hexdigest()
+
+    @staticmethod
+    def _key(question: str, model_name: str, prompt_version: str, fingerprint: str) -> str:
+        raw = "\0".join([normalize_query(question), model_name, prompt_version, fingerprint])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _expired(self, entry: Dict) -> bool:
+        return self.ttl is not None and self.clock() - entry["created"] > self.ttl
+
+    def _vector(self, question: str) -> Optional[np.ndarray]:
+        if self.similarity_threshold is None or self.embeddings is None:
+            return None
+        vector = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _remove(self, key: str):
+        """Remove a entrada e o seu vetor do índice do escopo (chamado com o lock)."""
+        entry = self._entries.pop(key)
+        vectors = self._scopes.get(entry["scope"])
+        if vectors is not None and vectors.pop(key, None) is not None:
+            self._matrices.pop(entry["scope"], None)
+            if not vectors:
+                del self._scopes[entry["scope"]]
+
+    def get(self, question: str, model_name: str, prompt_version: str, fingerprint: str):
+        """Retorna o valor armazenado ou None."""
+        key = self._key(question, model_name, prompt_version, fingerprint)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry):
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["value"]
+
+        vector = self._vector(question)
+        if vector is not None:
+            match = self._most_similar(vector, (model_name, prompt_version, fingerprint))
+            if match is not None:
+                return match
+
+        with self._lock:
+            self.misses += 1
+        return None
+
+    def _most_similar(self, vector: np.ndarray, scope):
+        with self._lock:
+            for key in [k for k in self._scopes.get(scope, ()) if self._expired(self._entries[k])]:
+                self._remove(key)
+            vectors = self._scopes.get(scope)
+            if not vectors:
+                return None
+            if scope not in self._matrices:
+                self._matrices[scope] = (list(vectors), np.stack(list(vectors.values())))
+            keys, matrix = self._matrices[scope]
+            scores = matrix @ vector
+            best = int(np.argmax(scores))
+            if scores[best] < self.similarity_threshold:
+                return None
+            best_key = keys[best]
+            self._entries.move_to_end(best_key)
+            self.hits += 1
+            self.similar_hits += 1
+            return self._entries[best_key]["value"]
+
+    def put(self, question: str, model_name: str, prompt_version: str, fingerprint: str, value):
+        key = self._key(question, model_name, prompt_version, fingerprint)
+        entry = {
+            "value": value,
+            "created": self.clock(),
+            "scope": (model_name, prompt_version, fingerprint),
+            "vector": self._vector(question),
+        }
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = entry
+            if entry["vector"] is not None:
+                self._scopes.setdefault(entry["scope"], {})[key] = entry["vector"]
+                self._matrices.pop(entry["scope"], None)
+            while len(self._entries) > self.max_size:
+                self._remove(next(iter(self._entries)))
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._scopes.clear()
+            self._matrices.clear()
+
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "similar_hits": self.similar_hits,
+            "misses": self.misses,
+            "hit_ratio": self.hits / total if total else 0.0,
+            "size": len(self._entries),
+        }
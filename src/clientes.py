@@ -0,0 +1,310 @@
+import asyncio
+import random
+import threading
+import time
+import weakref
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from typing import Any, AsyncIterator, Callable, Dict, Iterator, List, Optional, Tuple
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from pydantic import ConfigDict, PrivateAttr
+from src.indexacao import is_rate_limit_error, status_code
+from src.metricas import tracer as default_tracer
+
+def error_kind(error: BaseException) -> str:
+    """Classifica a falha de uma chamada: "tempo", "cota", "transitorio" ou "fatal" (não adianta repetir)."""
+    name = type(error).__name__
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)) or "Timeout" in name:
+        return "tempo"
+    if is_rate_limit_error(error):
+        return "cota"
+    code = status_code(error)
+    if (isinstance(error, ConnectionError) or (code is not None and code >= 500)
+            or any(part in name for part in ("ServerError", "Connect", "Transport", "Unavailable"))):
+        return "transitorio"
+    return "fatal"
+
+# Fim do bloqueio por cota de cada cliente (id -> (referência fraca, time.monotonic())): a cota é do
+# modelo, não da etapa, então vale para todas as instâncias que compartilham o cliente
+_quota_blocked: Dict[int, Tuple[weakref.ref, float]] = {}
+_quota_lock = threading.Lock()
+
+def _quota_blocked_until(model: Any) -> float:
+    ref, until = _quota_blocked.get(id(model), (None, 0.0))
+    return until if ref is not None and ref() is model else 0.0
+
+def model_name(model: BaseChatModel) -> str:
+    return str(getattr(model, "model", None) or getattr(model, "model_name", None) or type(model).__name__)
+
+class ResilientChatModel(BaseChatModel):
+    """Camada de resiliência sobre um ou mais chat models (o primário primeiro, depois os fallbacks).
+
+    Cada tentativa tem prazo de `timeout` segundos; erros transitórios, de cota
+    ou de prazo são repetidos até `max_retries` vezes com backoff exponencial
+    com jitter. Prazo estourado ou cota esgotada passam a tentativa seguinte
+    para o próximo modelo, e um modelo sem cota fica `quota_cooldown` segundos
+    fora da rota. Com `hedge`, uma chamada sem resposta após o p95 das
+    latências recentes (ou `hedge_after`, até haver `hedge_min_samples`
+    amostras) ganha uma segunda tentativa em paralelo, no próximo modelo se
+    houver; vale a primeira resposta. No streaming, a repetição só ocorre antes
+    do primeiro token, e o prazo vale até ele.
+
+    Os clientes em `models` são compartilhados (pool de conexões do SDK); cada
+    etapa (`stage`) tem sua instância, com prazo e histórico de latência
+    próprios. Cada tentativa é registrada no tracer como
+    `llm.<stage>.tentativa` e cada chamada como `llm.<stage>`.
+    """
+    model_config = ConfigDict(arbitrary_types_allowed=True)
+
+    models: List[Any]  # chat models do LangChain; o primário primeiro
+    stage: str = "llm"
+    timeout: float = 30.0
+    max_retries: int = 2
+    base_delay: float = 0.25
+    max_delay: float = 4.0
+    hedge: bool = True
+    hedge_after: Optional[float] = None
+    hedge_quantile: float = 0.95
+    hedge_min_samples: int = 20
+    quota_cooldown: float = 30.0
+    max_workers: int = 16
+    tracer: Any = None
+
+    _latencies: deque = PrivateAttr(default_factory=lambda: deque(maxlen=200))
+    _executor: Optional[ThreadPoolExecutor] = PrivateAttr(default=None)
+    _lock: Any = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "resiliente"
+
+    @property
+    def _tracer(self):
+        return self.tracer if self.tracer is not None else default_tracer
+
+    def _pool(self) -> ThreadPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix=f"llm-{self.stage}")
+            return self._executor
+
+    def hedge_delay(self) -> Optional[float]:
+        """Quanto esperar a tentativa principal antes de disparar a segunda (None = sem hedge)."""
+        if not self.hedge:
+            return None
+        with self._lock:
+            samples = sorted(self._latencies)
+        if len(samples) < self.hedge_min_samples:
+            return self.hedge_after
+        return samples[min(len(samples) - 1, int(self.hedge_quantile * len(samples)))]
+
+    def _route(self) -> List[int]:
+        """Índices dos modelos na ordem de uso; os sem cota vão para o fim."""
+        now = time.monotonic()
+        with _quota_lock:
+            blocked = {i for i, model in enumerate(self.models) if _quota_blocked_until(model) > now}
+        return [i for i in range(len(self.models)) if i not in blocked] + sorted(blocked)
+
+    def _backoff(self, attempt: int) -> float:
+        return min(self.max_delay, self.base_delay * 2 ** attempt) * random.uniform(0.5, 1.0)
+
+    def _after_failure(self, error: BaseException, attempt: int, position: int, route: List[int]) -> Tuple[int, float]:
+        """Decide a próxima tentativa após `error`: (posição na rota, espera em segundos). Repassa o erro
+        quando não adianta repetir ou as tentativas acabaram."""
+        kind = error_kind(error)
+        if kind == "cota":
+            with _quota_lock:
+                model = self.models[route[position]]
+                _quota_blocked[id(model)] = (weakref.ref(model), time.monotonic() + self.quota_cooldown)
+        if kind == "fatal" or attempt >= self.max_retries:
+            raise error
+        if kind in ("tempo", "cota") and position + 1 < len(route):
+            return position + 1, 0.0  # primário lento ou sem cota: o fallback responde sem esperar
+        return position, self._backoff(attempt)
+
+    def _record(self, index: int, start: float, outcome: str, hedge: bool):
+        duration = time.perf_counter() - start
+        if outcome in ("ok", "descartada") and index == 0:  # descartada: limite inferior da latência real
+            with self._lock:
+                self._latencies.append(duration)
+        self._tracer.record(f"llm.{self.stage}.tentativa", duration, modelo=model_name(self.models[index]),
+                            resultado=outcome, erro=int(outcome != "ok"), hedge=int(hedge), fallback=int(index != 0))
+
+    def _timeout_error(self) -> TimeoutError:
+        return TimeoutError(f"{self.stage}: o modelo não respondeu em {self.timeout:.1f}s.")
+
+    def _race(self, candidates: List[int], call: Callable[[BaseChatModel], Any], launched: List[bool]) -> Tuple[Any, int]:
+        """Uma tentativa, com hedge se a primeira demorar. Retorna (resultado, modelo que respondeu);
+        `launched` recebe, para cada chamada disparada, se ela foi um hedge."""
+        deadline = time.monotonic() + self.timeout
+        started: Dict[Any, Tuple[int, bool, float]] = {}
+
+        def launch(index: int, hedge: bool):
+            started[self._pool().submit(call, self.models[index])] = (index, hedge, time.perf_counter())
+            launched.append(hedge)
+
+        launch(candidates[0], False)
+        delay = self.hedge_delay()
+        if delay is not None and delay < self.timeout and not wait(started, timeout=delay)[0]:
+            launch(candidates[1] if len(candidates) > 1 else candidates[0], True)
+        pending, error, outcome = set(started), None, "tempo"
+        try:
+            while pending:
+                done, pending = wait(pending, timeout=max(0.0, deadline - time.monotonic()), return_when=FIRST_COMPLETED)
+                if not done:
+                    break
+                for future in done:
+                    index, hedge, start = started[future]
+                    if future.exception() is None:
+                        self._record(index, start, "ok", hedge)
+                        outcome = "descartada"
+                        return future.result(), index
+                    error = future.exception()
+                    self._record(index, start, error_kind(error), hedge)
+            raise error if error is not None and not pending else self._timeout_error()
+        finally:
+            # Chamadas síncronas não podem ser interrompidas: as pendentes terminam no prazo do próprio cliente
+            for future in pending:
+                future.cancel()
+                self._record(started[future][0], started[future][2], outcome, started[future][1])
+
+    async def _arace(self, candidates: List[int], call: Callable[[BaseChatModel], Any],
+                     launched: List[bool]) -> Tuple[Any, int]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        started: Dict[Any, Tuple[int, bool, float]] = {}
+
+        def launch(index: int, hedge: bool):
+            started[asyncio.ensure_future(call(self.models[index]))] = (index, hedge, time.perf_counter())
+            launched.append(hedge)
+
+        launch(candidates[0], False)
+        pending, error, outcome = set(started), None, "tempo"
+        try:
+            delay = self.hedge_delay()
+            if delay is not None and delay < self.timeout and not (await asyncio.wait(set(started), timeout=delay))[0]:
+                launch(candidates[1] if len(candidates) > 1 else candidates[0], True)
+            pending = set(started)
+            while pending:
+                done, pending = await asyncio.wait(pending, timeout=max(0.0, deadline - loop.time()),
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    break
+                for task in done:
+                    index, hedge, start = started[task]
+                    if task.exception() is None:
+                        self._record(index, start, "ok", hedge)
+                        outcome = "descartada"
+                        return task.result(), index
+                    error = task.exception()
+                    self._record(index, start, error_kind(error), hedge)
+            raise error if error is not None and not pending else self._timeout_error()
+        finally:
+            for task in pending:
+                task.cancel()  # a tentativa perdedora é cancelada (a requisição HTTP é abortada)
+                self._record(started[task][0], started[task][2], outcome, started[task][1])
+
+    def _finish(self, start: float, launched: List[bool], index: Optional[int]):
+        self._tracer.record(f"llm.{self.stage}", time.perf_counter() - start, tentativas=len(launched),
+                            hedge=int(any(launched)), fallback=int(bool(index)), falha=int(index is None))
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                  **kwargs) -> ChatResult:
+        call = lambda model: model.invoke(messages, stop=stop, **kwargs)
+        start, route, position, launched = time.perf_counter(), self._route(), 0, []
+        for attempt in range(self.max_retries + 1):
+            try:
+                message, index = self._race(route[position:], call, launched)
+            except Exception as e:
+                try:
+                    position, delay = self._after_failure(e, attempt, position, route)
+                except Exception:
+                    self._finish(start, launched, None)
+                    raise
+                time.sleep(delay)
+                continue
+            self._finish(start, launched, index)
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                         **kwargs) -> ChatResult:
+        call = lambda model: model.ainvoke(messages, stop=stop, **kwargs)
+        start, route, position, launched = time.perf_counter(), self._route(), 0, []
+        for attempt in range(self.max_retries + 1):
+            try:
+                message, index = await self._arace(route[position:], call, launched)
+            except Exception as e:
+                try:
+                    position, delay = self._after_failure(e, attempt, position, route)
+                except Exception:
+                    self._finish(start, launched, None)
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self._finish(start, launched, index)
+            return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                **kwargs) -> Iterator[ChatGenerationChunk]:
+        start, route, position = time.perf_counter(), self._route(), 0
+        for attempt in range(self.max_retries + 1):
+            index, attempt_start = route[position], time.perf_counter()
+            stream = self.models[index].stream(messages, stop=stop, **kwargs)
+            # O prazo vale até o primeiro token, esperado numa thread do pool (como em `_race`)
+            first_token = self._pool().submit(next, stream, None)
+            try:
+                first = first_token.result(timeout=self.timeout)
+            except Exception as e:
+                if isinstance(e, FutureTimeoutError):
+                    e = self._timeout_error()
+                    # A chamada travada não pode ser interrompida: o stream é fechado quando ela voltar
+                    first_token.add_done_callback(lambda _, stream=stream: stream.close())
+                self._record(index, attempt_start, error_kind(e), False)
+                try:
+                    position, delay = self._after_failure(e, attempt, position, route)
+                except Exception:
+                    self._finish(start, [False] * (attempt + 1), None)
+                    raise
+                time.sleep(delay)
+                continue
+            self._record(index, attempt_start, "ok", False)
+            self._finish(start, [False] * (attempt + 1), index)
+            if first is not None:
+                yield ChatGenerationChunk(message=first)
+                for chunk in stream:
+                    yield ChatGenerationChunk(message=chunk)
+            return
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None, run_manager=None,
+                       **kwargs) -> AsyncIterator[ChatGenerationChunk]:
+        start, route, position = time.perf_counter(), self._route(), 0
+        for attempt in range(self.max_retries + 1):
+            index, attempt_start = route[position], time.perf_counter()
+            stream = self.models[index].astream(messages, stop=stop, **kwargs)
+            try:
+                # O prazo vale até o primeiro token; depois o stream segue no ritmo do modelo
+                first = await asyncio.wait_for(stream.__anext__(), self.timeout)
+            except StopAsyncIteration:
+                first = None
+            except Exception as e:
+                await stream.aclose()
+                if isinstance(e, asyncio.TimeoutError):
+                    e = self._timeout_error()
+                self._record(index, attempt_start, error_kind(e), False)
+                try:
+                    position, delay = self._after_failure(e, attempt, position, route)
+                except Exception:
+                    self._finish(start, [False] * (attempt + 1), None)
+                    raise
+                await asyncio.sleep(delay)
+                continue
+            self._record(index, attempt_start, "ok", False)
+            self._finish(start, [False] * (attempt + 1), index)
+            if first is not None:
+                yield ChatGenerationChunk(message=first)
+                async for chunk in stream:
+                    yield ChatGenerationChunk(message=chunk)
+            return
@@ -0,0 +1,180 @@
+import json
+from typing import Dict, List, Optional, Sequence, Tuple
+from langchain_core.documents import Document
+from src.reranking import Reranker
+
+# Ações da política, da mais barata para a mais cara
+ACOES = ["pular_rerank", "reduzir", "padrao", "ampliar"]
+
+# Limiar que nenhum cosseno atinge (desliga uma faixa sem sair do JSON padrão)
+_NEVER = 2.0
+
+def similarities(docs: Sequence[Document]) -> List[float]:
+    """Similaridades vetoriais dos candidatos (`metadata["similaridade"]`), em ordem decrescente."""
+    values = [doc.metadata.get("similaridade") for doc in docs]
+    return sorted((v for v in values if v is not None), reverse=True)
+
+def _promote_best(docs: List[Document]) -> List[Document]:
+    """O candidato mais similar à frente, seguido dos demais na ordem da busca."""
+    best = max(docs, key=lambda d: d.metadata.get("similaridade", -_NEVER))
+    return [best] + [doc for doc in docs if doc is not best]
+
+class ConfidencePolicy:
+    """Decide, pela confiança da busca vetorial, quantos candidatos reranquear.
+
+    Usa a similaridade de cosseno do melhor candidato (`top1`) e a margem para
+    o segundo: com `top1 >= skip_similarity` e margem `>= skip_margin` o acerto
+    é óbvio e o rerank é pulado (os `final_k` primeiros vão direto ao prompt);
+    com `top1 >= shrink_similarity` só `shrink_k` candidatos vão ao reranker;
+    com `top1 < widen_similarity` a busca foi fraca e `widen_k` candidatos são
+    reranqueados; nos demais casos, `default_k`. Sem similaridades (busca
+    léxica, por exemplo) vale o padrão. Os limiares vêm de `calibrate`.
+    """
+    def __init__(self, skip_similarity: float = 0.85, skip_margin: float = 0.05, shrink_similarity: float = 0.75,
+                 widen_similarity: float = 0.6, final_k: int = 4, shrink_k: int = 6, default_k: int = 10,
+                 widen_k: int = 20, adaptive: bool = True):
+        self.skip_similarity = skip_similarity
+        self.skip_margin = skip_margin
+        self.shrink_similarity = shrink_similarity
+        self.widen_similarity = widen_similarity
+        self.final_k = final_k
+        self.shrink_k = shrink_k
+        self.default_k = default_k
+        self.widen_k = widen_k
+        self.adaptive = adaptive
+
+    @property
+    def max_candidates(self) -> int:
+        """Candidatos a recuperar antes da decisão."""
+        return self.widen_k if self.adaptive else self.default_k
+
+    def decide(self, scores: Sequence[float]) -> Dict:
+        """Retorna {"acao", "rerank", "candidatos", "similaridade", "margem"} para as similaridades (decrescentes)."""
+        top1 = scores[0] if scores else None
+        margin = top1 - (scores[1] if len(scores) > 1 else 0.0) if scores else None
+        if not self.adaptive or top1 is None:
+            action = "padrao"
+        elif top1 >= self.skip_similarity and margin >= self.skip_margin:
+            action = "pular_rerank"
+        elif top1 >= self.shrink_similarity:
+            action = "reduzir"
+        elif top1 < self.widen_similarity:
+            action = "ampliar"
+        else:
+            action = "padrao"
+        candidates = {"pular_rerank": self.final_k, "reduzir": self.shrink_k, "padrao": self.default_k,
+                      "ampliar": self.widen_k}[action]
+        return {"acao": action, "rerank": action != "pular_rerank", "candidatos": candidates,
+                "similaridade": top1, "margem": margin}
+
+    def apply(self, docs: List[Document]) -> Tuple[List[Document], Dict]:
+        """Retorna (candidatos escolhidos, decisão) para os docs recuperados em ordem de relevância."""
+        decision = self.decide(similarities(docs))
+        if decision["acao"] == "pular_rerank":
+            docs = _promote_best(docs)
+        return docs[:decision["candidatos"]], decision
+
+    def to_dict(self) -> Dict:
+        return {"skip_similarity": self.skip_similarity, "skip_margin": self.skip_margin,
+                "shrink_similarity": self.shrink_similarity, "widen_similarity": self.widen_similarity,
+                "final_k": self.final_k, "shrink_k": self.shrink_k, "default_k": self.default_k,
+                "widen_k": self.widen_k}
+
+    def save(self, path: str):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    @classmethod
+    def load(cls, path: str) -> "ConfidencePolicy":
+        with open(path, encoding="utf-8") as f:
+            return cls(**json.load(f))
+
+def collect_samples(retrieve, questions: List[str], reference: Reranker, final_k: int = 4) -> List[Dict]:
+    """Amostras de calibração: para cada pergunta, os candidatos de `retrieve` (com similaridade)
+    e o top-`final_k` escolhido pelo reranker de referência sobre todos eles."""
+    samples = []
+    for question in questions:
+        docs = retrieve(question)
+        chosen = reference.rerank(question, docs, k=final_k)
+        samples.append({"pergunta": question, "candidatos": [doc.id for doc in docs],
+                        "similaridades": [doc.metadata.get("similaridade") for doc in docs],
+                        "referencia": [doc.id for doc in chosen]})
+    return samples
+
+def _docs(sample: Dict) -> List[Document]:
+    return [Document(page_content="", id=cid, metadata={} if s is None else {"similaridade": s})
+            for cid, s in zip(sample["candidatos"], sample["similaridades"])]
+
+def evaluate(policy: ConfidencePolicy, samples: List[Dict]) -> Dict:
+    """Aplica a política às amostras: ações tomadas e qualidade.
+
+    Qualidade é a fração de perguntas em que o chunk preferido pela referência
+    continua entre os candidatos escolhidos (sem rerank, entre os que vão ao
+    prompt); `candidatos_medios` mede o custo do rerank.
+    """
+    report = {acao: 0 for acao in ACOES}
+    kept, candidates = 0, 0
+    for sample in samples:
+        chosen, decision = policy.apply(_docs(sample))
+        report[decision["acao"]] += 1
+        candidates += len(chosen) if decision["rerank"] else 0
+        kept += not sample["referencia"] or sample["referencia"][0] in {doc.id for doc in chosen}
+    total = max(len(samples), 1)
+    report.update({"perguntas": len(samples), "qualidade": kept / total, "candidatos_medios": candidates / total,
+                   "rerank_evitado": report["pular_rerank"] / total})
+    return report
+
+def calibrate(samples: List[Dict], min_quality: float = 0.95, base: Optional[ConfidencePolicy] = None,
+              margins: Sequence[float] = (0.0, 0.01, 0.02, 0.03, 0.05, 0.08, 0.1)) -> Tuple[ConfidencePolicy, Dict]:
+    """Escolhe os limiares que mais economizam mantendo a qualidade de cada faixa em `min_quality`.
+
+    Em etapas: o maior conjunto de perguntas em que pular o rerank preserva o
+    chunk da referência; depois, entre as restantes, o maior em que `shrink_k`
+    candidatos bastam; por fim, abaixo de que similaridade o chunk da
+    referência só aparece além de `default_k` (ampliar). Retorna (política,
+    relatório com a qualidade da calibrada e da fixa em `default_k`).
+    """
+    base = base or ConfidencePolicy()
+    params = base.to_dict()
+    docs = [_docs(sample) for sample in samples]
+    scores = [similarities(d) for d in docs]
+    scored = [i for i in range(len(samples)) if scores[i]]
+    top1 = {i: scores[i][0] for i in scored}
+    margin = {i: scores[i][0] - (scores[i][1] if len(scores[i]) > 1 else 0.0) for i in scored}
+    grid = sorted(set(top1.values()))
+
+    def hit(i: int, chosen: List[Document]) -> bool:
+        reference = samples[i]["referencia"]
+        return not reference or reference[0] in {doc.id for doc in chosen}
+
+    # O resultado de cada ação numa pergunta não depende dos limiares: basta calculá-lo uma vez
+    skip_hit = {i: hit(i, _promote_best(docs[i])[:base.final_k]) for i in scored}
+    shrink_hit = {i: hit(i, docs[i][:base.shrink_k]) for i in scored}
+
+    def rate(covered: List[int], hits: Dict[int, bool]) -> float:
+        return sum(hits[i] for i in covered) / len(covered)
+
+    # 1. Pular o rerank: maior cobertura; em empate fica o limiar mais alto (mais conservador)
+    best = (0, _NEVER, base.skip_margin)
+    for m in margins:
+        for t in grid:
+            covered = [i for i in scored if top1[i] >= t and margin[i] >= m]
+            if covered and len(covered) >= best[0] and rate(covered, skip_hit) >= min_quality:
+                best = (len(covered), t, m)
+    params["skip_similarity"], params["skip_margin"] = best[1], best[2]
+    rest = [i for i in scored if not (top1[i] >= best[1] and margin[i] >= best[2])]
+
+    # 2. Reduzir: o menor limiar (maior cobertura) em que shrink_k candidatos bastam
+    params["shrink_similarity"] = next(
+        (t for t in grid if [i for i in rest if top1[i] >= t]
+         and rate([i for i in rest if top1[i] >= t], shrink_hit) >= min_quality), _NEVER)
+    rest = [i for i in rest if top1[i] < params["shrink_similarity"]]
+
+    # 3. Ampliar: logo acima da pergunta mais confiante que precisou de mais de default_k candidatos
+    needs = [top1[i] for i in rest if not hit(i, docs[i][:base.default_k])]
+    params["widen_similarity"] = min(max(needs) + 1e-6, params["shrink_similarity"]) if needs else -_NEVER
+
+    policy = ConfidencePolicy(**params)
+    report = evaluate(policy, samples)
+    report["qualidade_fixa"] = evaluate(ConfidencePolicy(**params, adaptive=False), samples)["qualidade"]
+    return policy, report
@@ -0,0 +1,147 @@
+import re
+import zlib
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from src.estrutura import estimate_tokens
+from src.lexico import tokenize
+
+# Fim de frase (ou de inciso/alínea) seguido de maiúscula, "§" ou alínea; "Art. 5º" não é
+# quebrado porque depois do ponto vem um número. O separador é capturado para preservar as quebras de linha.
+_SENTENCE_RE = re.compile(r"(?<=[.;:!?])(\s+)(?=[A-ZÁÉÍÓÚÂÊÔÃÕÇ§]|[a-z]\) )")
+_ARTICLE_PREFIX_RE = re.compile(r"^\(Art\. [^)]+\) ")
+
+# Primo de Mersenne 2^61 - 1 para as permutações do MinHash.
+_PRIME = (1 << 61) - 1
+
+def _tag(doc: Document) -> str:
+    return doc.metadata.get("fonte", "desconhecida").upper()
+
+def _merge_overlap(first: str, second: str, probe: int = 64) -> Optional[str]:
+    """Une dois trechos da mesma página quando um contém o outro ou o fim de um repete o início do outro."""
+    for a, b in ((first, second), (second, first)):
+        if b in a:
+            return a
+        start = a.find(b[:probe])
+        # O início de `b` aparece em `a` e tudo de `a` a partir dali coincide com `b`
+        while start >= 0:
+            if b.startswith(a[start:]):
+                return a + b[len(a) - start:]
+            start = a.find(b[:probe], start + 1)
+    return None
+
+class ContextPacker:
+    """Monta o contexto do prompt dentro de um orçamento de tokens.
+
+    Recebe os chunks em ordem de relevância (busca ou rerank) e: (1) une
+    trechos da mesma página que se sobrepõem ou se contêm (overlap do
+    splitter) e as partes de um mesmo artigo; (2) remove frases quase
+    duplicadas (Jaccard estimado por MinHash sobre shingles de palavras acima
+    de `similarity`), mantendo a ocorrência do trecho mais relevante; (3)
+    ordena os blocos pela posição do seu melhor chunk e os inclui até
+    `max_tokens`, cortando o último bloco numa fronteira de frase. Cada bloco
+    mantém a tag da fonte (`[CDC]: ...`) usada nas citações.
+    """
+    def __init__(self, max_tokens: int = 1600, similarity: float = 0.8, shingle_size: int = 3,
+                 num_perm: int = 64, min_sentence_tokens: int = 4, seed: int = 1):
+        self.max_tokens = max_tokens
+        self.similarity = similarity
+        self.shingle_size = shingle_size
+        self.min_sentence_tokens = min_sentence_tokens
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, 1 << 31, size=num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _PRIME, size=num_perm, dtype=np.uint64)
+
+    def pack(self, docs: List[Document]) -> Tuple[str, Dict]:
+        """Retorna (contexto, relatório de economia em relação à concatenação simples)."""
+        original = "\n\n".join(f"[{_tag(doc)}]: {doc.page_content}" for doc in docs)
+        blocks = self._merge(docs)
+        removed = self._dedupe(blocks)
+
+        parts, used, truncated = [], 0, False
+        for block in sorted(blocks, key=lambda b: b["rank"]):
+            if not block["frases"]:
+                continue
+            header = f"[{block['tag']}]: "
+            budget = self.max_tokens - used - estimate_tokens(header)
+            text = header
+            for sentence, separator in block["frases"]:
+                cost = estimate_tokens(sentence + separator)
+                if cost > budget:
+                    truncated = True
+                    break
+                text += sentence + separator
+                budget -= cost
+            if text != header:
+                text = text.rstrip()
+                parts.append(text)
+                used += estimate_tokens(text + "\n\n")
+            if truncated:
+                break
+        context = "\n\n".join(parts)
+
+        tokens_original, tokens_context = estimate_tokens(original), estimate_tokens(context)
+        report = {
+            "chunks": len(docs),
+            "blocos": len(parts),
+            "mesclados": len(docs) - len(blocks),
+            "frases_removidas": removed,
+            "truncado": truncated,
+            "tokens_originais": tokens_original,
+            "tokens_contexto": tokens_context,
+            "tokens_economizados": tokens_original - tokens_context,
+        }
+        return context, report
+
+    def _merge(self, docs: List[Document]) -> List[Dict]:
+        blocks: List[Dict] = []
+        for rank, doc in enumerate(docs):
+            text = doc.page_content.strip()
+            source, page, artigo = doc.metadata.get("source"), doc.metadata.get("page"), doc.metadata.get("artigo")
+            for block in blocks:
+                if block["source"] != source:
+                    continue
+                merged = _merge_overlap(block["texto"], text) if block["page"] == page else None
+                if merged is None and artigo is not None and block["artigo"] == artigo:
+                    # Partes de um artigo longo: a parte sem o prefixo "(Art. N)" é a inicial
+                    rest = _ARTICLE_PREFIX_RE.sub("", text)
+                    merged = (block["texto"] + "\n" + rest if rest != text
+                              else text + "\n" + _ARTICLE_PREFIX_RE.sub("", block["texto"]))
+                if merged is not None:
+                    block["texto"] = merged
+                    break
+            else:
+                blocks.append({"rank": rank, "tag": _tag(doc), "source": source, "page": page,
+                               "artigo": artigo, "texto": text})
+        for block in blocks:
+            # Lista de (frase, separador seguinte)
+            pieces = _SENTENCE_RE.split(_ARTICLE_PREFIX_RE.sub("", block["texto"]))
+            block["frases"] = [(pieces[i], "\n" if i + 1 < len(pieces) and "\n" in pieces[i + 1] else " ")
+                               for i in range(0, len(pieces), 2) if pieces[i].strip()]
+        return blocks
+
+    def _signature(self, tokens: List[str]) -> np.ndarray:
+        size = min(self.shingle_size, len(tokens))
+        shingles = {" ".join(tokens[i:i + size]) for i in range(len(tokens) - size + 1)}
+        hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+        # (a·x + b) mod p para cada permutação; com a < 2^31 e x < 2^32 a conta cabe em 64 bits
+        values = (self._a[:, None] * hashes[None, :] + self._b[:, None]) % np.uint64(_PRIME)
+        return values.min(axis=1)
+
+    def _dedupe(self, blocks: List[Dict]) -> int:
+        """Remove frases quase duplicadas, percorrendo os blocos do mais para o menos relevante."""
+        kept: List[np.ndarray] = []
+        removed = 0
+        for block in sorted(blocks, key=lambda b: b["rank"]):
+            sentences = []
+            for sentence, separator in block["frases"]:
+                tokens = tokenize(sentence)
+                if len(tokens) >= self.min_sentence_tokens:
+                    signature = self._signature(tokens)
+                    if kept and (np.asarray(kept) == signature).mean(axis=1).max() >= self.similarity:
+                        removed += 1
+                        continue
+                    kept.append(signature)
+                sentences.append((sentence, separator))
+            block["frases"] = sentences
+        return removed
@@ -0,0 +1,35 @@
+import importlib
+import sys
+import time
+from typing import Callable, Dict, Iterable, Tuple
+
+def lazy_attributes(module_name: str, attributes: Dict[str, str]) -> Tuple[Callable, Callable]:
+    """Nomes de módulo importados só no primeiro acesso (PEP 562).
+
+    `attributes` mapeia cada nome ao módulo que o define. Retorna o
+    `__getattr__` a ser exposto pelo módulo e uma função `resolve(nome)` para
+    usar o nome no código; ambos respeitam valores substituídos por
+    `unittest.mock.patch("modulo.Nome")`.
+    """
+    namespace = sys.modules[module_name].__dict__
+
+    def __getattr__(name: str):
+        if name not in attributes:
+            raise AttributeError(f"module {module_name!r} has no attribute {name!r}")
+        value = getattr(importlib.import_module(attributes[name]), name)
+        namespace[name] = value
+        return value
+
+    def resolve(name: str):
+        return namespace[name] if name in namespace else __getattr__(name)
+
+    return __getattr__, resolve
+
+def preload(modules: Iterable[str]) -> Dict[str, float]:
+    """Importa os módulos informados e retorna o tempo de cada um, em ms."""
+    timings = {}
+    for module in modules:
+        start = time.perf_counter()
+        importlib.import_module(module)
+        timings[module] = (time.perf_counter() - start) * 1000
+    return timings
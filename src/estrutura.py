@@ -0,0 +1,210 @@
+import math
+import re
+from typing import Dict, Iterable, Iterator, List, Optional
+from langchain_core.documents import Document
+
+# Marcadores da estrutura da legislação brasileira, reconhecidos no início da linha.
+_HEADING_RE = re.compile(r"^(T[ÍI]TULO|CAP[ÍI]TULO|SE[ÇC][ÃA]O)\s+([IVXLCDM]+|[ÚU]NIC[OA])\b", re.IGNORECASE)
+_ARTICLE_RE = re.compile(r"^Art\.?\s*(\d+(?:\.\d{3})*)\s*[º°o]?(?:\s*-\s*([A-Z])\b)?")
+_PARAGRAPH_RE = re.compile(r"^(§\s*\d+\s*[º°]?|Par[áa]grafo\s+[úu]nico)", re.IGNORECASE)
+_INCISO_RE = re.compile(r"^[IVXLCDM]+\s*[-–—]\s")
+_ALINEA_RE = re.compile(r"^[a-z]\)\s")
+# Linhas de sumário ("CAPÍTULO I – Disposições Gerais ....... 7") não abrem um novo nível.
+_TOC_RE = re.compile(r"\.{4,}\s*\d+\s*$")
+
+# Nível de cada cabeçalho: um TÍTULO novo encerra o capítulo e a seção correntes.
+_LEVELS = {"titulo": 0, "capitulo": 1, "secao": 2}
+
+def estimate_tokens(text: str) -> int:
+    """Estimativa barata de tokens (~4 caracteres por token em português)."""
+    return math.ceil(len(text) / 4)
+
+def _heading_level(name: str) -> str:
+    folded = name.upper().replace("Í", "I").replace("Ç", "C").replace("Ã", "A")
+    return {"TITULO": "titulo", "CAPITULO": "capitulo", "SECAO": "secao"}[folded]
+
+class _Article:
+    def __init__(self, label: Optional[str], number: Optional[int], page, context: Dict[str, str]):
+        self.label = label
+        self.number = number
+        self.page = page
+        self.context = dict(context)
+        # Cada unidade é uma lista de linhas: o caput (com seus incisos) e depois cada parágrafo.
+        self.units: List[List[str]] = [[]]
+
+class LegalStructureSplitter:
+    """Chunker que segue a estrutura da legislação (Título, Capítulo, Seção, Art., §, inciso, alínea).
+
+    Emite um chunk por artigo, com metadados da hierarquia (`artigo`,
+    `artigo_inicio`, `artigo_fim`, `titulo`, `capitulo`, `secao`). Artigos
+    curtos consecutivos do mesmo capítulo são agrupados até `max_tokens`;
+    artigos longos são divididos nas suas unidades (caput, parágrafos e, se
+    preciso, incisos), sem sobreposição. Uma única passada sobre as linhas,
+    com as páginas de uma mesma fonte tratadas como um texto contínuo (um
+    artigo pode começar numa página e terminar na seguinte).
+    """
+    def __init__(self, max_tokens: int = 400):
+        self.max_tokens = max_tokens
+
+    def split_documents(self, documents: Iterable[Document]) -> Iterator[Document]:
+        """Consome as páginas em ordem e gera os chunks à medida que os artigos se fecham."""
+        state = None
+        for doc in documents:
+            source = doc.metadata.get("source")
+            if state is None or state["source"] != source:
+                if state is not None:
+                    yield from self._finish(state)
+                state = self._new_state(doc)
+            page = doc.metadata.get("page")
+            for line in doc.page_content.splitlines():
+                yield from self._feed(state, line.strip(), page)
+        if state is not None:
+            yield from self._finish(state)
+
+    # Máquina de estados
+
+    @staticmethod
+    def _new_state(doc: Document) -> Dict:
+        base = {k: v for k, v in doc.metadata.items() if k not in ("page", "chunk_id", "page_label")}
+        return {"source": doc.metadata.get("source"), "base": base, "context": {}, "naming": None,
+                "previous_context": {}, "article": None, "pack": [], "pack_tokens": 0}
+
+    def _feed(self, state: Dict, line: str, page) -> Iterator[Document]:
+        if not line:
+            return
+        heading = _HEADING_RE.match(line)
+        if heading and not _TOC_RE.search(line):
+            yield from self._close_article(state)
+            yield from self._flush_pack(state)
+            level = _heading_level(heading.group(1))
+            context = state["context"]
+            state["previous_context"] = dict(context)
+            for name, depth in _LEVELS.items():
+                if depth > _LEVELS[level]:
+                    context.pop(name, None)
+            context[level] = line
+            state["naming"] = level
+            return
+
+        article = _ARTICLE_RE.match(line)
+        if article:
+            yield from self._close_article(state)
+            number = int(article.group(1).replace(".", ""))
+            label = article.group(1) + (f"-{article.group(2)}" if article.group(2) else "")
+            state["article"] = _Article(label, number, page, state["context"])
+            state["article"].units[0].append(line)
+            state["naming"] = None
+            return
+
+        if state["naming"] is not None and state["article"] is None:
+            if _TOC_RE.search(line):
+                # Entrada de sumário quebrada em duas linhas: o cabeçalho anterior não abre um nível
+                state["context"] = state["previous_context"]
+                state["naming"] = None
+                return
+            # Linha logo após "CAPÍTULO I": é o nome do capítulo
+            level = state["naming"]
+            state["context"][level] = f"{state['context'][level]} - {line}"
+            state["naming"] = None
+            return
+
+        current = state["article"]
+        if current is None:
+            # Texto antes do primeiro artigo (ementa, preâmbulo)
+            current = state["article"] = _Article(None, None, page, state["context"])
+        if _PARAGRAPH_RE.match(line) and current.units[-1]:
+            current.units.append([])
+        current.units[-1].append(line)
+
+    def _close_article(self, state: Dict) -> Iterator[Document]:
+        article, state["article"] = state["article"], None
+        if article is None or not any(article.units):
+            return
+        text = "\n".join(line for unit in article.units for line in unit)
+        tokens = estimate_tokens(text)
+        if tokens > self.max_tokens:
+            yield from self._flush_pack(state)
+            yield from self._split_long(state, article)
+            return
+        pack = state["pack"]
+        if pack and (state["pack_tokens"] + tokens > self.max_tokens or pack[0][0].context != article.context
+                     or pack[0][0].number is None or article.number is None):
+            yield from self._flush_pack(state)
+        state["pack"].append((article, text))
+        state["pack_tokens"] += tokens
+
+    def _flush_pack(self, state: Dict) -> Iterator[Document]:
+        pack, state["pack"], state["pack_tokens"] = state["pack"], [], 0
+        if pack:
+            first, last = pack[0][0], pack[-1][0]
+            unidade = "preambulo" if first.number is None else ("artigo" if len(pack) == 1 else "artigos")
+            yield self._chunk(state, "\n".join(text for _, text in pack), first, unidade, last)
+
+    def _split_long(self, state: Dict, article: _Article) -> Iterator[Document]:
+        """Divide um artigo longo em grupos de unidades (caput, §) de até `max_tokens`."""
+        prefix = f"(Art. {article.label}) " if article.label else ""
+        pieces: List[str] = []
+        for unit in article.units:
+            if estimate_tokens("\n".join(unit)) <= self.max_tokens:
+                pieces.append("\n".join(unit))
+            else:
+                pieces.extend(self._split_unit(unit))
+        groups: List[List[str]] = []
+        size = 0
+        for piece in pieces:
+            tokens = estimate_tokens(piece)
+            if groups and size + tokens <= self.max_tokens:
+                groups[-1].append(piece)
+                size += tokens
+            else:
+                groups.append([piece])
+                size = tokens
+        for i, group in enumerate(groups):
+            text = "\n".join(group)
+            yield self._chunk(state, text if i == 0 else prefix + text, article,
+                              "parte_artigo" if article.label else "preambulo")
+
+    def _split_unit(self, lines: List[str]) -> List[str]:
+        """Agrupa as linhas de uma unidade longa, quebrando nos incisos/alíneas e, em último caso, nas palavras."""
+        pieces, current = [], []
+        for line in lines:
+            starts_item = bool(_INCISO_RE.match(line) or _ALINEA_RE.match(line))
+            candidate = "\n".join(current + [line])
+            if current and (estimate_tokens(candidate) > self.max_tokens or (starts_item and
+                                                                              estimate_tokens(candidate) > self.max_tokens * 0.8)):
+                pieces.append("\n".join(current))
+                current = []
+            current.append(line)
+        if current:
+            pieces.append("\n".join(current))
+        result = []
+        max_chars = self.max_tokens * 4
+        for piece in pieces:
+            start = 0
+            while len(piece) - start > max_chars:
+                cut = piece.rfind(" ", start, start + max_chars)
+                cut = cut if cut > start else start + max_chars
+                result.append(piece[start:cut])
+                start = cut + 1 if piece[cut:cut + 1] == " " else cut
+            if start < len(piece):
+                result.append(piece[start:])
+        return result
+
+    def _chunk(self, state: Dict, text: str, article: _Article, unidade: str,
+               last: Optional[_Article] = None) -> Document:
+        metadata = dict(state["base"])
+        metadata["page"] = article.page
+        metadata["unidade"] = unidade
+        for name in _LEVELS:
+            if name in article.context:
+                metadata[name] = article.context[name]
+        if article.number is not None:
+            last = last or article
+            metadata["artigo"] = article.label
+            metadata["artigo_inicio"] = article.number
+            metadata["artigo_fim"] = last.number
+        return Document(page_content=text, metadata=metadata)
+
+    def _finish(self, state: Dict) -> Iterator[Document]:
+        yield from self._close_article(state)
+        yield from self._flush_pack(state)
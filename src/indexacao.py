@@ -0,0 +1,120 @@
+import random
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Dict, List, Optional
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+
+class TokenBucket:
+    """Limitador de taxa (token bucket) compartilhado entre threads."""
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._last = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: float = 1.0):
+        """Bloqueia até haver `tokens` disponíveis no balde."""
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._last) * self.rate)
+                self._last = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait = (tokens - self._tokens) / self.rate
+            time.sleep(wait)
+
+# Código HTTP no início da mensagem ("429 RESOURCE_EXHAUSTED ...") ou após "HTTP"/"status"/"code"
+_STATUS_RE = re.compile(r"^\s*(\d{3})\b|\b(?:HTTP(?:/[\d.]+)?|status(?:_code)?|code)\W{0,3}(\d{3})\b", re.IGNORECASE)
+
+def status_code(error: BaseException) -> Optional[int]:
+    """Código HTTP do erro (ou da exceção que o causou), se o SDK o informar."""
+    seen = 0
+    while error is not None and seen < 5:
+        for candidate in (error, getattr(error, "response", None)):
+            for attr in ("code", "status_code"):
+                code = getattr(candidate, attr, None)
+                if isinstance(code, int) and 100 <= code < 600:
+                    return code
+        error, seen = error.__cause__, seen + 1
+    return None
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Identifica erros de cota (RESOURCE_EXHAUSTED / HTTP 429) do Gemini."""
+    message = f"{type(error).__name__} {error}"
+    if "RESOURCE_EXHAUSTED" in message or "ResourceExhausted" in message or status_code(error) == 429:
+        return True
+    # "429" só conta como código de status, não em qualquer ponto do texto
+    return any("429" in match.groups() for match in _STATUS_RE.finditer(str(error)))
+
+class EmbeddingPipeline:
+    """Estágio de embedding para ingestão em massa.
+
+    Divide os chunks em lotes de `batch_size`, envia até `max_workers` lotes em
+    paralelo respeitando `requests_per_minute` e repete com backoff exponencial
+    os lotes recusados por cota. Cada lote concluído é entregue ao `sink`
+    imediatamente; como o sink grava no banco vetorial, o próprio banco serve
+    de checkpoint e uma execução interrompida retoma apenas os lotes pendentes.
+    """
+    def __init__(self, embeddings: Embeddings, batch_size: int = 50, max_workers: int = 4,
+                 requests_per_minute: float = 60, max_retries: int = 6, base_delay: float = 2.0,
+                 max_delay: float = 60.0):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.rate_limiter = TokenBucket(rate=requests_per_minute / 60.0, capacity=max_workers)
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self._retries = 0
+        self._retries_lock = threading.Lock()
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        for attempt in range(self.max_retries + 1):
+            self.rate_limiter.acquire()
+            try:
+                return self.embeddings.embed_documents(texts)
+            except Exception as e:
+                if not is_rate_limit_error(e) or attempt == self.max_retries:
+                    raise
+                with self._retries_lock:
+                    self._retries += 1
+                delay = min(self.max_delay, self.base_delay * 2 ** attempt)
+                time.sleep(delay * random.uniform(0.5, 1.0))
+
+    def run(self, documents: List[Document],
+            sink: Callable[[List[Document], List[List[float]]], None]) -> Dict[str, float]:
+        """Embeda os documentos e repassa cada lote pronto ao `sink`. Retorna estatísticas de vazão."""
+        batches = [documents[i:i + self.batch_size] for i in range(0, len(documents), self.batch_size)]
+        self._retries = 0
+        sink_lock = threading.Lock()
+        start = time.perf_counter()
+
+        def process(batch: List[Document]):
+            vectors = self._embed_batch([doc.page_content for doc in batch])
+            with sink_lock:
+                sink(batch, vectors)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(process, batch) for batch in batches]
+            try:
+                for future in as_completed(futures):
+                    future.result()
+            except Exception:
+                for future in futures:
+                    future.cancel()
+                raise
+
+        elapsed = time.perf_counter() - start
+        return {
+            "chunks": len(documents),
+            "lotes": len(batches),
+            "retentativas": self._retries,
+            "segundos": elapsed,
+            "chunks_por_segundo": len(documents) / elapsed if elapsed > 0 else 0.0,
+        }
@@ -1,9 +1,187 @@
+import gzip
+import hashlib
+import json
+import multiprocessing
 import os
+import sqlite3
+import time
+import zlib
 from abc import ABC, abstractmethod
-from typing import List
-from langchain_community.document_loaders import PyPDFLoader
+from collections import deque
+from contextlib import closing
+from concurrent.futures import ProcessPoolExecutor
+from importlib.metadata import PackageNotFoundError, version
+from typing import Dict, Iterable, Iterator, List, Optional
 from langchain_core.documents import Document
-from langchain_text_splitters import RecursiveCharacterTextSplitter, CharacterTextSplitter
+from src.dependencias import lazy_attributes
+from src.estrutura import LegalStructureSplitter
+
+# pypdf (via langchain_community) e os splitters só são importados no primeiro uso.
+__getattr__, _lazy = lazy_attributes(__name__, {
+    "PyPDFLoader": "langchain_community.document_loaders",
+    "RecursiveCharacterTextSplitter": "langchain_text_splitters",
+    "CharacterTextSplitter": "langchain_text_splitters",
+})
+
+def file_hash(file_path: str, block_size: int = 1 << 20) -> str:
+    """Calcula o SHA-256 do conteúdo de um arquivo."""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def chunk_id(doc: Document) -> str:
+    """Gera um ID estável para o chunk a partir da origem, página e texto."""
+    key = "\0".join([
+        str(doc.metadata.get("source", "")),
+        str(doc.metadata.get("page", "")),
+        doc.page_content
+    ])
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:32]
+
+def _parser_version() -> str:
+    try:
+        return f"pypdf-{version('pypdf')}"
+    except PackageNotFoundError:
+        return "pypdf"
+
+class ParsedPDFCache:
+    """Cache persistente do texto extraído dos PDFs (páginas e metadados).
+
+    Cada arquivo é identificado por caminho, tamanho, mtime e hash do conteúdo:
+    com tamanho e mtime inalterados, o hash registrado é reaproveitado sem
+    reler o arquivo; senão o hash é recalculado e, se o conteúdo for o mesmo
+    (ex.: `touch` ou cópia), a extração existente é reaproveitada. As páginas
+    ficam em `<chave>.jsonl.gz` (uma linha JSON por página), com a chave
+    incluindo a versão do parser. Acima de `max_bytes`, as extrações usadas há
+    mais tempo são descartadas. O índice é um SQLite, seguro entre os processos
+    do pool de ingestão. Como a chave é o conteúdo, o `source` das páginas em
+    cache pode ser de outro caminho; o `LegalPDFLoader` o regrava na leitura.
+    """
+    VERSION = 1
+
+    def __init__(self, directory: str, max_bytes: int = 512 * 1024 * 1024, parser: Optional[str] = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.parser = parser or _parser_version()
+        self.hits = 0
+        self.misses = 0
+
+    def _connect(self) -> sqlite3.Connection:
+        os.makedirs(self.directory, exist_ok=True)
+        conn = sqlite3.connect(os.path.join(self.directory, "indice.sqlite3"), timeout=30)
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS arquivos (path TEXT PRIMARY KEY, tamanho INTEGER, mtime_ns INTEGER, hash TEXT);
+            CREATE TABLE IF NOT EXISTS extracoes (chave TEXT PRIMARY KEY, bytes INTEGER, acesso REAL);
+        """)
+        return conn
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.jsonl.gz")
+
+    def _blob_key(self, digest: str) -> str:
+        return hashlib.sha256(f"{self.VERSION}\0{self.parser}\0{digest}".encode("utf-8")).hexdigest()[:32]
+
+    def _key(self, conn: sqlite3.Connection, file_path: str) -> str:
+        path = os.path.abspath(file_path)
+        stat = os.stat(path)
+        row = conn.execute("SELECT tamanho, mtime_ns, hash FROM arquivos WHERE path = ?", (path,)).fetchone()
+        if row is not None and row[0] == stat.st_size and row[1] == stat.st_mtime_ns:
+            return self._blob_key(row[2])
+        digest = file_hash(path)
+        with conn:
+            conn.execute("INSERT OR REPLACE INTO arquivos (path, tamanho, mtime_ns, hash) VALUES (?, ?, ?, ?)",
+                         (path, stat.st_size, stat.st_mtime_ns, digest))
+        return self._blob_key(digest)
+
+    def get(self, file_path: str) -> Optional[List[Document]]:
+        """Páginas já extraídas do arquivo, ou None se não estiverem em cache."""
+        with closing(self._connect()) as conn:
+            key = self._key(conn, file_path)
+            try:
+                with gzip.open(self._path(key), "rt", encoding="utf-8") as f:
+                    docs = [Document(**json.loads(line)) for line in f]
+            except FileNotFoundError:
+                self.misses += 1
+                return None
+            except (OSError, EOFError, zlib.error, ValueError):
+                # Arquivo truncado ou corrompido: descarta e extrai de novo
+                self._remove(conn, key)
+                self.misses += 1
+                return None
+            with conn:
+                conn.execute("UPDATE extracoes SET acesso = ? WHERE chave = ?", (time.time(), key))
+        self.hits += 1
+        return docs
+
+    def put(self, file_path: str, documents: Iterable[Document]):
+        """Grava as páginas extraídas (de forma atômica) e aplica o limite de tamanho."""
+        for _ in self.write_through(file_path, documents):
+            pass
+
+    def write_through(self, file_path: str, documents: Iterable[Document]) -> Iterator[Document]:
+        """Repassa as páginas à medida que são extraídas, gravando-as no cache.
+
+        A extração só é registrada se todas as páginas forem consumidas.
+        """
+        with closing(self._connect()) as conn:
+            key = self._key(conn, file_path)
+            tmp_path = f"{self._path(key)}.{os.getpid()}.tmp"
+            try:
+                with gzip.open(tmp_path, "wt", encoding="utf-8", compresslevel=6) as f:
+                    for doc in documents:
+                        f.write(json.dumps({"page_content": doc.page_content, "metadata": doc.metadata},
+                                           ensure_ascii=False) + "\n")
+                        yield doc
+                os.replace(tmp_path, self._path(key))
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+            with conn:
+                conn.execute("INSERT OR REPLACE INTO extracoes (chave, bytes, acesso) VALUES (?, ?, ?)",
+                             (key, os.path.getsize(self._path(key)), time.time()))
+            self._evict(conn, keep=key)
+
+    def _remove(self, conn: sqlite3.Connection, key: str):
+        if os.path.exists(self._path(key)):
+            os.remove(self._path(key))
+        with conn:
+            conn.execute("DELETE FROM extracoes WHERE chave = ?", (key,))
+
+    def _evict(self, conn: sqlite3.Connection, keep: str):
+        total = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM extracoes").fetchone()[0]
+        for key, size in conn.execute("SELECT chave, bytes FROM extracoes WHERE chave != ? ORDER BY acesso",
+                                      (keep,)).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._remove(conn, key)
+            total -= size
+
+    def invalidate(self, file_path: Optional[str] = None):
+        """Descarta a extração de um arquivo (ou todo o cache, sem argumento)."""
+        with closing(self._connect()) as conn:
+            if file_path is None:
+                keys = [row[0] for row in conn.execute("SELECT chave FROM extracoes")]
+                paths = [None]
+            else:
+                path = os.path.abspath(file_path)
+                row = conn.execute("SELECT hash FROM arquivos WHERE path = ?", (path,)).fetchone()
+                keys = [self._blob_key(row[0])] if row is not None else []
+                paths = [path]
+            for key in keys:
+                self._remove(conn, key)
+            with conn:
+                if file_path is None:
+                    conn.execute("DELETE FROM arquivos")
+                else:
+                    conn.execute("DELETE FROM arquivos WHERE path = ?", paths)
+
+    def stats(self) -> Dict[str, int]:
+        """Extrações em disco, bytes ocupados e acertos/erros desta instância."""
+        with closing(self._connect()) as conn:
+            count, size = conn.execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM extracoes").fetchone()
+        return {"extracoes": count, "bytes": size, "hits": self.hits, "misses": self.misses}
 
 class DocumentLoader(ABC):
     """Interface para carregadores de documentos."""
@@ -11,58 +189,240 @@ class DocumentLoader(ABC):
     def load(self) -> List[Document]:
         pass
 
+    def lazy_load(self) -> Iterator[Document]:
+        """Gera as páginas sob demanda (por padrão, a partir de `load`)."""
+        yield from self.load()
+
 class LegalPDFLoader(DocumentLoader):
-    """Carregador especializado para PDFs jurídicos com metadados de fonte."""
-    def __init__(self, file_path: str, source_label: str):
+    """Carregador especializado para PDFs jurídicos com metadados de fonte.
+
+    Com um `ParsedPDFCache`, arquivos já extraídos não passam de novo pelo pypdf.
+    `lazy_load` entrega cada página assim que o pypdf a extrai.
+    """
+    def __init__(self, file_path: str, source_label: str, cache: Optional[ParsedPDFCache] = None):
         self.file_path = file_path
         self.source_label = source_label
+        self.cache = cache
 
     def load(self) -> List[Document]:
+        return list(self.lazy_load())
+
+    def lazy_load(self) -> Iterator[Document]:
         if not os.path.exists(self.file_path):
             raise FileNotFoundError(f"Arquivo não encontrado: {self.file_path}")
-        
-        loader = PyPDFLoader(self.file_path)
-        docs = loader.load()
-        
+
+        docs = self.cache.get(self.file_path) if self.cache is not None else None
+        if docs is None:
+            docs = _lazy("PyPDFLoader")(self.file_path).lazy_load()
+            if self.cache is not None:
+                docs = self.cache.write_through(self.file_path, docs)
+
+        # A extração em cache pode vir de uma cópia ou de um nome antigo do mesmo conteúdo
         for doc in docs:
+            doc.metadata["source"] = self.file_path
             doc.metadata["fonte"] = self.source_label
-            
-        return docs
+            yield doc
 
 class DocumentProcessor:
     """Classe responsável pelo processamento (chunking) de documentos."""
     def __init__(self):
         pass
 
+    def assign_ids(self, chunks: List[Document]) -> List[Document]:
+        """Atribui IDs estáveis (`metadata["chunk_id"]`) e remove chunks duplicados."""
+        seen = set()
+        unique = []
+        for chunk in chunks:
+            cid = chunk_id(chunk)
+            if cid in seen:
+                continue
+            seen.add(cid)
+            chunk.id = cid
+            chunk.metadata["chunk_id"] = cid
+            unique.append(chunk)
+        return unique
+
     def split_recursive(self, documents: List[Document], chunk_size: int = 500, chunk_overlap: int = 100) -> List[Document]:
-        splitter = RecursiveCharacterTextSplitter(
+        splitter = _lazy("RecursiveCharacterTextSplitter")(
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap
         )
-        return splitter.split_documents(documents)
+        return self.assign_ids(splitter.split_documents(documents))
+
+    def split_stream(self, documents: Iterable[Document], chunk_size: int = 500, chunk_overlap: int = 100,
+                     batch_size: int = 500) -> Iterator[List[Document]]:
+        """Versão em streaming de `split_recursive`: gera lotes de até `batch_size` chunks."""
+        splitter = _lazy("RecursiveCharacterTextSplitter")(
+            chunk_size=chunk_size,
+            chunk_overlap=chunk_overlap
+        )
+        batch = []
+        for doc in documents:
+            batch.extend(splitter.split_documents([doc]))
+            if len(batch) >= batch_size:
+                yield self.assign_ids(batch)
+                batch = []
+        if batch:
+            yield self.assign_ids(batch)
+
+    def split_legal(self, documents: List[Document], max_tokens: int = 400) -> List[Document]:
+        """Chunking pela estrutura da lei: um chunk por artigo, com metadados da hierarquia."""
+        return self.assign_ids(list(LegalStructureSplitter(max_tokens).split_documents(documents)))
+
+    def split_legal_stream(self, documents: Iterable[Document], max_tokens: int = 400,
+                           batch_size: int = 500) -> Iterator[List[Document]]:
+        """Versão em streaming de `split_legal`: gera lotes de até `batch_size` chunks."""
+        batch = []
+        for chunk in LegalStructureSplitter(max_tokens).split_documents(documents):
+            batch.append(chunk)
+            if len(batch) >= batch_size:
+                yield self.assign_ids(batch)
+                batch = []
+        if batch:
+            yield self.assign_ids(batch)
 
     def split_by_paragraph(self, documents: List[Document], chunk_size: int = 500, chunk_overlap: int = 0) -> List[Document]:
-        splitter = CharacterTextSplitter(
+        splitter = _lazy("CharacterTextSplitter")(
             separator="\n\n",
             chunk_size=chunk_size,
             chunk_overlap=chunk_overlap
         )
-        return splitter.split_documents(documents)
+        return self.assign_ids(splitter.split_documents(documents))
+
+class IngestionManifest:
+    """Registro em JSON do hash de cada arquivo já indexado no banco vetorial."""
+    def __init__(self, path: str):
+        self.path = path
+        self.files: Dict[str, Dict[str, str]] = {}
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                self.files = json.load(f).get("arquivos", {})
+
+    def is_unchanged(self, file_path: str, digest: str) -> bool:
+        entry = self.files.get(file_path)
+        return entry is not None and entry.get("hash") == digest
+
+    def update(self, file_path: str, digest: str, source_label: str):
+        self.files[file_path] = {"hash": digest, "fonte": source_label}
+
+    def remove(self, file_path: str):
+        self.files.pop(file_path, None)
+
+    def save(self):
+        """Grava o manifesto de forma atômica."""
+        os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"arquivos": self.files}, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.path)
+
+# Páginas extraídas aguardando o consumidor, por arquivo em voo (o worker espera quando a fila enche).
+PAGE_QUEUE_SIZE = 32
+
+def _stream_pages(loader: DocumentLoader, pages) -> None:
+    """Executado nos processos do pool: envia as páginas de um arquivo à medida que são extraídas."""
+    try:
+        for doc in loader.lazy_load():
+            pages.put(doc)
+    finally:
+        pages.put(None)
 
 class IngestionManager:
-    """Fachada para gerenciar o processo completo de ingestão."""
-    def __init__(self, loaders: List[LegalPDFLoader]):
+    """Fachada para gerenciar o processo completo de ingestão.
+
+    Com um `IngestionManifest`, arquivos cujo hash não mudou desde a última
+    indexação são ignorados sem serem lidos pelo parser de PDF.
+    """
+    def __init__(self, loaders: List[LegalPDFLoader], manifest: Optional[IngestionManifest] = None):
         self.loaders = loaders
+        self.manifest = manifest
         self.all_documents = []
+        self.loaded_files: Dict[str, str] = {}
+        self.stats: Dict[str, int] = {}
+        self._pending: List[LegalPDFLoader] = []
+
+    def plan(self) -> List[str]:
+        """Define quais arquivos serão lidos (consultando o manifesto) e os retorna."""
+        self.loaded_files = {}
+        self._pending = []
+        self.stats = {"total": 0}
+        skipped = 0
+        for loader in self.loaders:
+            digest = ""
+            if self.manifest is not None:
+                digest = file_hash(loader.file_path)
+                if self.manifest.is_unchanged(loader.file_path, digest):
+                    skipped += 1
+                    continue
+            self.loaded_files[loader.file_path] = digest
+            self._pending.append(loader)
+        if self.manifest is not None:
+            self.stats["total_ignorados"] = skipped
+        return list(self.loaded_files)
+
+    def iter_documents(self, max_workers: Optional[int] = 1) -> Iterator[Document]:
+        """Gera as páginas dos arquivos planejados, sem materializar o corpus inteiro.
+
+        Com `max_workers` diferente de 1, o parsing roda em um pool de processos
+        (`None` usa todos os núcleos) com no máximo `max_workers` arquivos em voo.
+        Cada worker envia as páginas por uma fila limitada (`PAGE_QUEUE_SIZE`)
+        à medida que o pypdf as extrai, então nem um PDF grande fica inteiro na
+        memória. As estatísticas ficam em `self.stats` ao final.
+        """
+        if not self.stats:
+            self.plan()
+        if max_workers == 1 or len(self._pending) <= 1:
+            for loader in self._pending:
+                yield from self._emit(loader, loader.lazy_load())
+            return
+
+        workers = max_workers or os.cpu_count() or 1
+        with ProcessPoolExecutor(max_workers=workers) as executor, multiprocessing.Manager() as sync:
+            try:
+                in_flight = deque()
+                for loader in self._pending:
+                    pages = sync.Queue(maxsize=PAGE_QUEUE_SIZE)
+                    in_flight.append((loader, pages, executor.submit(_stream_pages, loader, pages)))
+                    if len(in_flight) >= workers:
+                        yield from self._drain(*in_flight.popleft())
+                while in_flight:
+                    yield from self._drain(*in_flight.popleft())
+            finally:
+                # Consumo interrompido: descarta os arquivos que não começaram; as filas fecham com o Manager
+                executor.shutdown(wait=False, cancel_futures=True)
+
+    def _drain(self, loader: LegalPDFLoader, pages, future) -> Iterator[Document]:
+        # Arquivos em ordem: as páginas dos seguintes esperam nas suas filas
+        yield from self._emit(loader, iter(pages.get, None))
+        future.result()  # repassa erros do parsing
+
+    def _emit(self, loader: LegalPDFLoader, docs: Iterable[Document]) -> Iterator[Document]:
+        self.stats.setdefault(loader.source_label, 0)
+        for doc in docs:
+            self.stats[loader.source_label] += 1
+            self.stats["total"] += 1
+            yield doc
 
     def load_all(self):
         """Carrega todos os documentos e retorna os documentos e estatísticas."""
-        self.all_documents = []
-        stats = {}
-        for loader in self.loaders:
-            loader_docs = loader.load()
-            self.all_documents.extend(loader_docs)
-            stats[loader.source_label] = len(loader_docs)
-        
-        stats["total"] = len(self.all_documents)
-        return self.all_documents, stats
+        self.plan()
+        self.all_documents = list(self.iter_documents())
+        return self.all_documents, self.stats
+
+    def removed_files(self) -> List[str]:
+        """Arquivos presentes no manifesto que não fazem mais parte da ingestão."""
+        if self.manifest is None:
+            return []
+        current = {loader.file_path for loader in self.loaders}
+        return [path for path in self.manifest.files if path not in current]
+
+    def commit(self):
+        """Registra no manifesto os arquivos carregados e esquece os removidos."""
+        if self.manifest is None:
+            return
+        labels = {loader.file_path: loader.source_label for loader in self.loaders}
+        for file_path, digest in self.loaded_files.items():
+            self.manifest.update(file_path, digest, labels[file_path])
+        for file_path in self.removed_files():
+            self.manifest.remove(file_path)
+        self.manifest.save()
@@ -0,0 +1,175 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+import unicodedata
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+from langchain_core.documents import Document
+
+# Stopwords do português já sem acentos (a tokenização faz o accent folding antes do filtro).
+STOPWORDS = frozenset("""
+a ao aos aquela aquelas aquele aqueles aquilo as ate com como da das de dela delas dele deles
+depois do dos e ela elas ele eles em entre era essa essas esse esses esta estas este estes eu
+foi ha isso isto ja lhe lhes mais mas me mesmo meu meus minha minhas muito na nao nas nem no
+nos nossa nossas nosso nossos num numa o os ou para pela pelas pelo pelos por qual quando que
+quem se sem ser seu seus sua suas so tambem te tem teu tua um uma uns umas voce voces
+""".split())
+
+# Versão da tokenização gravada no índice (PRAGMA user_version); ao mudá-la, índices antigos são reconstruídos.
+TOKENIZER_VERSION = 2
+
+_TOKEN_RE = re.compile(r"§|\w+")
+_ORDINAL_RE = re.compile(r"(\d+)[º°ª]")
+
+def fold_accents(text: str) -> str:
+    """Remove acentos e cedilha (ex.: "proteção" -> "protecao")."""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c))
+
+def _normalize_plural(token: str) -> str:
+    if token.isdigit() or len(token) <= 3:
+        return token
+    if token.endswith(("oes", "aes")):
+        return token[:-3] + "ao"
+    if token.endswith("ns"):
+        return token[:-2] + "m"
+    if token.endswith("es") and token[-3] in "rzls":
+        return token[:-2]  # consumidores -> consumidor, vezes -> vez, controles -> control
+    if token.endswith("s") and token[-2] in "aeo":
+        return token[:-1]
+    if token.endswith("e") and token[-2] in "rzls":
+        return token[:-1]  # controle -> control, classe -> class: casa com o plural acima
+    return token
+
+def tokenize(text: str) -> List[str]:
+    """Tokenização para textos jurídicos em português.
+
+    Faz caixa baixa, accent folding, remove stopwords, reduz plurais simples e
+    preserva números de artigos e o símbolo de parágrafo ("Art. 18º, § 3º" ->
+    ["art", "18", "§", "3"]).
+    """
+    text = _ORDINAL_RE.sub(r"\1", text.casefold())
+    tokens = []
+    for token in _TOKEN_RE.findall(fold_accents(text)):
+        if token in STOPWORDS or token == "_":
+            continue
+        tokens.append(_normalize_plural(token))
+    return tokens
+
+class BM25Index:
+    """Índice invertido BM25 persistido em SQLite.
+
+    Guarda apenas postings (termo, chunk, frequência), o tamanho e a `fonte`
+    de cada chunk; o texto continua no banco vetorial e é buscado pelos IDs
+    retornados.
+    """
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.Lock()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS docs (chunk_id TEXT PRIMARY KEY, length INTEGER, fonte TEXT);
+                CREATE TABLE IF NOT EXISTS postings (term TEXT, chunk_id TEXT, tf INTEGER, PRIMARY KEY (term, chunk_id)) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS postings_chunk ON postings (chunk_id);
+            """)
+            # Índices criados antes do roteamento por fonte não têm a coluna
+            columns = [row[1] for row in self._conn.execute("PRAGMA table_info(docs)")]
+            if "fonte" not in columns:
+                self._conn.execute("ALTER TABLE docs ADD COLUMN fonte TEXT")
+            if self._conn.execute("SELECT 1 FROM docs LIMIT 1").fetchone() is None:
+                self._conn.execute(f"PRAGMA user_version = {TOKENIZER_VERSION}")
+        return self._conn
+
+    def outdated(self) -> bool:
+        """True se o índice foi gerado por outra versão da tokenização (precisa ser reconstruído)."""
+        with self._lock:
+            return self._connection().execute("PRAGMA user_version").fetchone()[0] != TOKENIZER_VERSION
+
+    def add(self, documents: Iterable[Document]):
+        """Indexa (ou reindexa) os chunks, identificados por `metadata["chunk_id"]`."""
+        rows_docs = []
+        rows_postings = []
+        for doc in documents:
+            cid = doc.metadata["chunk_id"]
+            counts = Counter(tokenize(doc.page_content))
+            rows_docs.append((cid, sum(counts.values()), doc.metadata.get("fonte")))
+            rows_postings.extend((term, cid, tf) for term, tf in counts.items())
+        with self._lock:
+            conn = self._connection()
+            conn.executemany("DELETE FROM postings WHERE chunk_id = ?", [(cid,) for cid, _, _ in rows_docs])
+            conn.executemany("INSERT OR REPLACE INTO docs (chunk_id, length, fonte) VALUES (?, ?, ?)", rows_docs)
+            conn.executemany("INSERT INTO postings (term, chunk_id, tf) VALUES (?, ?, ?)", rows_postings)
+            conn.commit()
+
+    def delete(self, chunk_ids: Iterable[str]):
+        rows = [(cid,) for cid in chunk_ids]
+        with self._lock:
+            conn = self._connection()
+            conn.executemany("DELETE FROM postings WHERE chunk_id = ?", rows)
+            conn.executemany("DELETE FROM docs WHERE chunk_id = ?", rows)
+            conn.commit()
+
+    def clear(self):
+        with self._lock:
+            conn = self._connection()
+            conn.execute("DELETE FROM postings")
+            conn.execute("DELETE FROM docs")
+            conn.execute(f"PRAGMA user_version = {TOKENIZER_VERSION}")
+            conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM docs").fetchone()[0]
+
+    def search(self, query: str, k: int = 5, fontes: Optional[List[str]] = None) -> List[Tuple[str, float]]:
+        """Retorna até `k` pares (chunk_id, score BM25) em ordem decrescente de score.
+
+        Com `fontes`, considera apenas chunks dessas fontes.
+        """
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        placeholders = ",".join("?" * len(terms))
+        source_filter = ""
+        if fontes:
+            source_filter = f" AND d.fonte IN ({','.join('?' * len(fontes))})"
+        with self._lock:
+            conn = self._connection()
+            total, avgdl = conn.execute("SELECT COUNT(*), AVG(length) FROM docs").fetchone()
+            if not total:
+                return []
+            rows = conn.execute(
+                f"SELECT p.term, p.chunk_id, p.tf, d.length FROM postings p JOIN docs d USING (chunk_id) "
+                f"WHERE p.term IN ({placeholders}){source_filter}", terms + list(fontes or [])
+            ).fetchall()
+
+        df = Counter(term for term, _, _, _ in rows)
+        scores: Dict[str, float] = {}
+        for term, cid, tf, length in rows:
+            idf = math.log(1 + (total - df[term] + 0.5) / (df[term] + 0.5))
+            norm = tf + self.k1 * (1 - self.b + self.b * length / (avgdl or 1))
+            scores[cid] = scores.get(cid, 0.0) + idf * tf * (self.k1 + 1) / norm
+        return sorted(scores.items(), key=lambda item: item[1], reverse=True)[:k]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+def reciprocal_rank_fusion(rankings: List[List[str]], k: int = 60) -> List[str]:
+    """Combina rankings de IDs por Reciprocal Rank Fusion (score = soma de 1 / (k + posição))."""
+    scores: Dict[str, float] = {}
+    for ranking in rankings:
+        for rank, cid in enumerate(ranking, start=1):
+            scores[cid] = scores.get(cid, 0.0) + 1.0 / (k + rank)
+    return sorted(scores, key=lambda cid: scores[cid], reverse=True)
@@ -0,0 +1,263 @@
+import bisect
+import cProfile
+import io
+import json
+import pstats
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# Limites (em segundos) dos buckets dos histogramas, no estilo Prometheus.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+# Atributos numéricos que não se somam entre spans (similaridades, tamanhos de lote pedidos...):
+# viram médias (`medias` no JSON, gauge `rag_stage_<atributo>_media` no Prometheus) em vez de contadores.
+GAUGES = frozenset({"similaridade", "margem", "candidatos", "k", "fontes_filtradas", "linhas"})
+
+class Span:
+    """Uma medição de etapa do pipeline; atributos extras entram via `set`."""
+    def __init__(self, name: str, attributes: Dict):
+        self.name = name
+        self.attributes = dict(attributes)
+        self.duration = 0.0
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+class _Histogram:
+    def __init__(self, max_samples: int):
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.samples = deque(maxlen=max_samples)
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, List[float]] = {}  # atributo -> [soma, nº de observações]
+
+    def observe(self, duration: float, attributes: Dict):
+        self.count += 1
+        self.total += duration
+        self.buckets[bisect.bisect_left(BUCKETS, duration)] += 1
+        self.samples.append(duration)
+        for key, value in attributes.items():
+            if not isinstance(value, (int, float)) or isinstance(value, bool):
+                continue
+            if key in GAUGES:
+                gauge = self.gauges.setdefault(key, [0.0, 0])
+                gauge[0] += value
+                gauge[1] += 1
+            else:
+                self.counters[key] = self.counters.get(key, 0) + value
+
+    def means(self) -> Dict[str, float]:
+        return {key: total / n for key, (total, n) in self.gauges.items()}
+
+    def percentile(self, q: float) -> float:
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+class Tracer:
+    """Registra spans por etapa do pipeline e agrega histogramas de latência.
+
+    Os agregados são exportáveis como JSON (`to_json`) ou texto Prometheus
+    (`to_prometheus`), gravados em arquivo (`dump`) ou servidos via HTTP
+    local (`serve`). Atributos numéricos dos spans (tokens, caracteres do
+    prompt, nº de chunks) são somados como contadores por etapa; os que não
+    se acumulam (`GAUGES`) são exportados como médias.
+    """
+    def __init__(self, max_samples: int = 1000, keep_spans: int = 200):
+        self.max_samples = max_samples
+        self.spans = deque(maxlen=keep_spans)
+        self._histograms: Dict[str, _Histogram] = {}
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Span]:
+        span = Span(name, attributes)
+        start = time.perf_counter()
+        try:
+            yield span
+        finally:
+            span.duration = time.perf_counter() - start
+            self._observe(span)
+
+    def record(self, name: str, duration: float, **attributes):
+        """Registra uma etapa medida externamente (duração em segundos)."""
+        span = Span(name, attributes)
+        span.duration = duration
+        self._observe(span)
+
+    def _observe(self, span: Span):
+        with self._lock:
+            histogram = self._histograms.setdefault(span.name, _Histogram(self.max_samples))
+            histogram.observe(span.duration, span.attributes)
+            self.spans.append({"nome": span.name, "duracao_ms": span.duration * 1000, **span.attributes})
+
+    def reset(self):
+        with self._lock:
+            self._histograms.clear()
+            self.spans.clear()
+
+    def to_json(self) -> Dict[str, Dict]:
+        with self._lock:
+            return {
+                name: {
+                    "contagem": h.count,
+                    "total_ms": h.total * 1000,
+                    "media_ms": h.total / h.count * 1000 if h.count else 0.0,
+                    "p50_ms": h.percentile(0.50) * 1000,
+                    "p95_ms": h.percentile(0.95) * 1000,
+                    "p99_ms": h.percentile(0.99) * 1000,
+                    "contadores": dict(h.counters),
+                    "medias": h.means(),
+                }
+                for name, h in self._histograms.items()
+            }
+
+    def to_prometheus(self) -> str:
+        lines = [
+            "# HELP rag_stage_duration_seconds Duração das etapas do pipeline RAG.",
+            "# TYPE rag_stage_duration_seconds histogram",
+        ]
+        counters: Dict[str, List[str]] = {}
+        gauges: Dict[str, List[str]] = {}
+        with self._lock:
+            for name, h in sorted(self._histograms.items()):
+                cumulative = 0
+                for bound, count in zip(BUCKETS, h.buckets):
+                    cumulative += count
+                    lines.append(f'rag_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'rag_stage_duration_seconds_bucket{{stage="{name}",le="+Inf"}} {h.count}')
+                lines.append(f'rag_stage_duration_seconds_sum{{stage="{name}"}} {h.total}')
+                lines.append(f'rag_stage_duration_seconds_count{{stage="{name}"}} {h.count}')
+                for key, value in h.counters.items():
+                    counters.setdefault(f"rag_stage_{key}_total", []).append(f'{{stage="{name}"}} {value}')
+                for key, value in h.means().items():
+                    gauges.setdefault(f"rag_stage_{key}_media", []).append(f'{{stage="{name}"}} {value}')
+        # Uma linha TYPE por família, seguida das séries de cada etapa
+        for kind, families in (("counter", counters), ("gauge", gauges)):
+            for family, series in sorted(families.items()):
+                lines.append(f"# TYPE {family} {kind}")
+                lines.extend(family + serie for serie in series)
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str):
+        """Grava as métricas em `path`: texto Prometheus se terminar em .prom, JSON caso contrário."""
+        with open(path, "w", encoding="utf-8") as f:
+            if path.endswith(".prom"):
+                f.write(self.to_prometheus())
+            else:
+                json.dump({"etapas": self.to_json(), "spans_recentes": list(self.spans)}, f, ensure_ascii=False, indent=2)
+
+    def serve(self, port: int = 9464, host: str = "127.0.0.1") -> ThreadingHTTPServer:
+        """Serve `/metrics` (Prometheus) e `/metrics.json` em uma thread daemon."""
+        tracer = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, content_type = tracer.to_prometheus(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, content_type = json.dumps(tracer.to_json(), ensure_ascii=False), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                data = body.encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+    def timed_iter(self, name: str, iterable: Iterable, exclude: Optional["TimedIterator"] = None) -> "TimedIterator":
+        """Envolve um iterador e registra, ao final, o tempo gasto produzindo seus itens."""
+        return TimedIterator(self, name, iterable, exclude)
+
+class TimedIterator:
+    """Iterador que mede o tempo gasto dentro de `next()`.
+
+    Com `exclude`, desconta o tempo de um iterador interno (ex.: o tempo de
+    leitura dos PDFs dentro do chunking), medindo só a etapa exclusiva.
+    """
+    def __init__(self, tracer: Tracer, name: str, iterable: Iterable, exclude: Optional["TimedIterator"] = None):
+        self.tracer = tracer
+        self.name = name
+        self.elapsed = 0.0
+        self.items = 0
+        self._iterator = iter(iterable)
+        self._exclude = exclude
+        self._done = False
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            item = next(self._iterator)
+        except StopIteration:
+            self.elapsed += time.perf_counter() - start
+            self._finish()
+            raise
+        self.elapsed += time.perf_counter() - start
+        self.items += 1
+        return item
+
+    def exclusive_elapsed(self) -> float:
+        return self.elapsed - (self._exclude.elapsed if self._exclude is not None else 0.0)
+
+    def _finish(self):
+        if not self._done:
+            self._done = True
+            self.tracer.record(self.name, self.exclusive_elapsed(), itens=self.items)
+
+@contextmanager
+def profile(output_path: Optional[str] = None, engine: str = "cprofile") -> Iterator[Dict[str, str]]:
+    """Perfila o bloco (uma única requisição) com cProfile ou pyinstrument (opcional).
+
+    O relatório em texto fica em `result["relatorio"]`; com `output_path`, o
+    cProfile grava o .prof (para snakeviz/pstats) e o pyinstrument grava HTML.
+    """
+    result: Dict[str, str] = {}
+    if engine == "pyinstrument":
+        try:
+            from pyinstrument import Profiler
+        except ImportError:
+            raise ImportError("pyinstrument não está instalado; use engine='cprofile' ou `pip install pyinstrument`.")
+        profiler = Profiler()
+        profiler.start()
+        try:
+            yield result
+        finally:
+            profiler.stop()
+            result["relatorio"] = profiler.output_text()
+            if output_path:
+                with open(output_path, "w", encoding="utf-8") as f:
+                    f.write(profiler.output_html())
+        return
+
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield result
+    finally:
+        profiler.disable()
+        stream = io.StringIO()
+        pstats.Stats(profiler, stream=stream).sort_stats("cumulative").print_stats(30)
+        result["relatorio"] = stream.getvalue()
+        if output_path:
+            profiler.dump_stats(output_path)
+
+# Tracer padrão do processo, compartilhado pelos managers.
+tracer = Tracer()
@@ -1,56 +1,479 @@
+import asyncio
+import json
 import os
+import shutil
+import sqlite3
+import tempfile
+import threading
+import time
+import numpy as np
 from dotenv import load_dotenv
-from langchain_google_genai import GoogleGenerativeAIEmbeddings, ChatGoogleGenerativeAI
-from langchain_chroma import Chroma
 from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models import BaseChatModel
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_core.runnables import RunnablePassthrough
 from langchain_core.output_parsers import StrOutputParser
-from typing import List
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Type, Union
+from src.cache import AnswerCache, CachedEmbeddings, normalize_query
+from src.clientes import ResilientChatModel
+from src.confianca import ConfidencePolicy
+from src.contexto import ContextPacker
+from src.dependencias import lazy_attributes
+from src.indexacao import EmbeddingPipeline
+from src.ingestao import DocumentProcessor
+from src.lexico import BM25Index, reciprocal_rank_fusion
+from src.metricas import Tracer, tracer as default_tracer
+from src.reranking import LLMReranker, LocalReranker, Reranker
+from src.roteamento import QueryRouter
+from src.snapshot import Snapshot, SnapshotError, export_snapshot
+from src.vetores import VectorBackend, resolve_backend
+
+# O SDK do Gemini só é importado quando um cliente é criado sem injeção (testes e benchmarks não pagam o custo).
+__getattr__, _lazy = lazy_attributes(__name__, {
+    "ChatGoogleGenerativeAI": "langchain_google_genai",
+    "GoogleGenerativeAIEmbeddings": "langchain_google_genai",
+})
+
+def _usage(message) -> Dict[str, int]:
+    """Extrai a contagem de tokens de uma resposta do LLM, quando o provedor a informa."""
+    usage = getattr(message, "usage_metadata", None) or {}
+    if not usage:
+        return {}
+    return {"tokens_entrada": usage.get("input_tokens", 0), "tokens_saida": usage.get("output_tokens", 0)}
 
 class VectorDatabaseManager:
-    """Gerencia o banco de dados vetorial Chroma com Google Gemini Embeddings."""
-    def __init__(self, persist_directory: str = "./chroma_db", embedding_model: str = "models/gemini-embedding-001"):
+    """Gerencia o banco de dados vetorial com Google Gemini Embeddings.
+
+    O armazenamento é plugável (`src/vetores.py`): "chroma" (padrão) ou
+    "mmap", a matriz quantizada memory-mapped; `backend_options` é repassado
+    ao construtor do backend (ex.: `{"dtype": "int8"}`).
+    Mantém um único handle do banco por instância, aberto sob demanda e
+    compartilhado entre threads. Use `close()` (ou `with`) para liberar o banco.
+    Os embeddings de consulta passam por um cache LRU persistido em SQLite
+    ao lado do diretório do banco (desative com `query_cache_size=0`).
+    Um índice léxico BM25 (`bm25.sqlite3`) é mantido em sincronia com a coleção
+    e habilita os modos de busca "lexical" e "hybrid".
+    """
+    # Arquivos auxiliares do diretório do banco que acompanham o snapshot (além do índice BM25)
+    SNAPSHOT_FILES = ["centroides.json", "confianca.json", "ingestao_manifest.json"]
+
+    def __init__(self, persist_directory: str = "./chroma_db", embedding_model: str = "models/gemini-embedding-001",
+                 embeddings: Optional[Embeddings] = None, query_cache_size: int = 1024,
+                 tracer: Optional[Tracer] = None, backend: Union[str, Type[VectorBackend]] = "chroma",
+                 backend_options: Optional[Dict] = None):
         load_dotenv()
+        self.tracer = tracer if tracer is not None else default_tracer
         self.persist_directory = persist_directory
-        self.embeddings = GoogleGenerativeAIEmbeddings(model=embedding_model)
+        self.embedding_model = embedding_model
+        base_embeddings = embeddings if embeddings is not None else _lazy("GoogleGenerativeAIEmbeddings")(model=embedding_model)
+        if query_cache_size > 0:
+            cache_path = os.path.join(os.path.dirname(os.path.abspath(persist_directory)), "embedding_cache.sqlite3")
+            self.embeddings = CachedEmbeddings(base_embeddings, embedding_model, cache_path, max_size=query_cache_size)
+        else:
+            self.embeddings = base_embeddings
+        self.lexical_index = BM25Index(os.path.join(persist_directory, "bm25.sqlite3"))
+        self.backend_class = resolve_backend(backend)
+        self.backend_options = backend_options or {}
+        self._backend: Optional[VectorBackend] = None
+        self._lock = threading.RLock()
+
+    @property
+    def backend(self) -> VectorBackend:
+        """Retorna o backend vetorial, abrindo o banco na primeira chamada."""
+        backend = self._backend
+        if backend is None:
+            with self._lock:
+                if self._backend is None:
+                    self._backend = self.backend_class(self.persist_directory, self.embeddings, **self.backend_options)
+                    # Índice BM25 gravado com outra tokenização: os termos não casam mais com os da consulta
+                    if os.path.exists(self.lexical_index.path) and self.lexical_index.outdated():
+                        self.rebuild_lexical_index()
+                backend = self._backend
+        return backend
+
+    @property
+    def vectorstore(self):
+        """VectorStore do LangChain do backend aberto (o handle do Chroma, no padrão)."""
+        return self.backend.store
+
+    def close(self):
+        """Fecha o banco; a próxima busca o reabre."""
+        with self._lock:
+            backend, self._backend = self._backend, None
+        if backend is not None:
+            backend.close()
+        if isinstance(self.embeddings, CachedEmbeddings):
+            self.embeddings.close()
+        self.lexical_index.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
 
     def create_or_update(self, documents: List[Document], force_recreate: bool = False):
         """Cria um novo banco ou carrega o existente."""
         exists = os.path.exists(self.persist_directory)
         if exists and not force_recreate:
-            vectorstore = Chroma(persist_directory=self.persist_directory, embedding_function=self.embeddings)
-            return vectorstore, False # False indica que não foi criado do zero
-        
-        vectorstore = Chroma.from_documents(
-            documents=documents,
-            embedding=self.embeddings,
-            persist_directory=self.persist_directory
-        )
-        return vectorstore, True # True indica que foi criado do zero
+            return self.vectorstore, False # False indica que não foi criado do zero
+
+        # IDs por conteúdo (`chunk_id`): o `sync_documents` seguinte reconhece os chunks já gravados
+        documents = DocumentProcessor().assign_ids(documents)
+        with self._lock:
+            self.close()
+            self._backend = self.backend_class.create(
+                self.persist_directory, self.embeddings, documents, **self.backend_options
+            )
+            self.rebuild_lexical_index()
+            return self.vectorstore, True # True indica que foi criado do zero
+
+    def sync_documents(self, documents: List[Document], sources: List[str], batch_size: int = 100,
+                       pipeline: Optional[EmbeddingPipeline] = None) -> Dict[str, float]:
+        """Sincroniza incrementalmente os chunks das fontes informadas.
+
+        Os chunks precisam de `metadata["chunk_id"]` (ver `DocumentProcessor.assign_ids`).
+        Apenas IDs novos são embedados; IDs que sumiram das fontes são removidos.
+        A inserção é feita em lotes, então uma execução interrompida é retomada
+        sem reembedar o que já foi gravado. Com um `EmbeddingPipeline`, os lotes
+        são embedados em paralelo e com limite de taxa.
+        """
+        batches = (documents[i:i + batch_size] for i in range(0, len(documents), batch_size))
+        return self.sync_stream(batches, sources, pipeline=pipeline)
+
+    def sync_stream(self, batches: Iterable[List[Document]], sources: List[str],
+                    pipeline: Optional[EmbeddingPipeline] = None) -> Dict[str, float]:
+        """Como `sync_documents`, mas consumindo lotes de chunks sob demanda.
+
+        Apenas os IDs ficam em memória; os chunks de cada lote são descartados
+        assim que gravados. Os IDs obsoletos são removidos ao final.
+        """
+        backend = self.backend
+        existing = set(backend.ids_for_sources(sources))
+
+        seen = set()
+        result = {"adicionados": 0, "removidos": 0, "inalterados": 0}
+        if pipeline is not None:
+            result.update({"chunks": 0, "lotes": 0, "retentativas": 0, "segundos": 0.0})
+        for batch in batches:
+            pending = []
+            for doc in batch:
+                cid = doc.metadata["chunk_id"]
+                if cid in seen:
+                    continue
+                seen.add(cid)
+                if cid in existing:
+                    result["inalterados"] += 1
+                else:
+                    pending.append(doc)
+            if not pending:
+                continue
+            result["adicionados"] += len(pending)
+            if pipeline is not None:
+                stats = pipeline.run(pending, sink=self._upsert_embedded)
+                for key in ("chunks", "lotes", "retentativas", "segundos"):
+                    result[key] += stats[key]
+            else:
+                backend.add_documents(pending)
+                self.lexical_index.add(pending)
+
+        stale = existing - seen
+        if stale:
+            backend.delete(stale)
+            self.lexical_index.delete(stale)
+        result["removidos"] = len(stale)
+        backend.optimize()
+        if result["adicionados"] or result["removidos"]:
+            self._invalidate_centroids()
+        if pipeline is not None:
+            segundos = result["segundos"]
+            result["chunks_por_segundo"] = result["chunks"] / segundos if segundos > 0 else 0.0
+        return result
+
+    def _upsert_embedded(self, documents: List[Document], vectors: List[List[float]]):
+        """Grava chunks já embedados diretamente na coleção, sem nova chamada ao modelo."""
+        self.backend.upsert(documents, vectors)
+        self.lexical_index.add(documents)
+
+    def delete_sources(self, sources: List[str]) -> int:
+        """Remove todos os chunks das fontes informadas. Retorna quantos foram apagados."""
+        backend = self.backend
+        removed = 0
+        for source in sources:
+            ids = backend.ids_for_sources([source])
+            if ids:
+                backend.delete(ids)
+                self.lexical_index.delete(ids)
+                removed += len(ids)
+        if removed:
+            self._invalidate_centroids()
+        return removed
+
+    def export_snapshot(self, path: str, dtype: str = "int8") -> Dict:
+        """Exporta chunks, metadados e vetores para um único arquivo (ver `src/snapshot.py`).
+
+        Acompanham o snapshot o índice BM25 e os arquivos de `SNAPSHOT_FILES`
+        presentes no diretório do banco. Retorna o cabeçalho gravado.
+        """
+        with tempfile.TemporaryDirectory() as tmp:
+            files = {name: os.path.join(self.persist_directory, name) for name in self.SNAPSHOT_FILES
+                     if os.path.exists(os.path.join(self.persist_directory, name))}
+            if os.path.exists(self.lexical_index.path):
+                # Cópia consistente do SQLite, mesmo com o índice aberto
+                files["bm25.sqlite3"] = os.path.join(tmp, "bm25.sqlite3")
+                with sqlite3.connect(self.lexical_index.path) as source, sqlite3.connect(files["bm25.sqlite3"]) as copy:
+                    source.backup(copy)
+            with self.tracer.span("snapshot.exportar") as span:
+                header = export_snapshot(self.backend, path, dtype=dtype, files=files,
+                                         info={"modelo_embedding": self.embedding_model})
+                span.set(linhas=header["linhas"])
+        return header
+
+    def import_snapshot(self, path: str, verify: bool = True) -> Dict:
+        """Substitui o banco pelo conteúdo de um snapshot, sem chamar o modelo de embeddings.
+
+        O snapshot é validado (modelo de embedding e, com `verify`, o sha256 de
+        cada seção) antes de tocar no banco atual. O novo banco é montado ao
+        lado e trocado pelo atual só no fim. Retorna o cabeçalho do snapshot.
+        """
+        snapshot = Snapshot(path)
+        model = snapshot.header["info"].get("modelo_embedding")
+        if model and model != self.embedding_model:
+            raise SnapshotError(f"Snapshot gerado com {model}; este banco usa {self.embedding_model}.")
+        with self.tracer.span("snapshot.importar", linhas=snapshot.rows):
+            if verify:
+                snapshot.verify()
+            staging = os.path.abspath(self.persist_directory) + ".importando"
+            shutil.rmtree(staging, ignore_errors=True)
+            self.backend_class.from_snapshot(staging, self.embeddings, snapshot, **self.backend_options).close()
+            for name in snapshot.files:
+                snapshot.extract(name, os.path.join(staging, name))
+
+            with self._lock:
+                current, self._backend = self._backend, None
+                if current is not None:
+                    current.close()
+                self.lexical_index.close()
+                shutil.rmtree(self.persist_directory, ignore_errors=True)
+                os.replace(staging, self.persist_directory)
+                if "bm25.sqlite3" not in snapshot.files:
+                    self.rebuild_lexical_index()
+        return snapshot.header
+
+    def rebuild_lexical_index(self, batch_size: int = 1000) -> int:
+        """Reconstrói o índice BM25 a partir da coleção (útil para bancos antigos). Retorna o total indexado."""
+        self.lexical_index.clear()
+        total = 0
+        for docs, _ in self.backend.iter_batches(batch_size):
+            self.lexical_index.add(
+                Document(page_content=doc.page_content, metadata={"chunk_id": doc.id, "fonte": doc.metadata.get("fonte")})
+                for doc in docs
+            )
+            total += len(docs)
+        return total
+
+    def source_centroids(self, batch_size: int = 1000) -> Dict[str, List[float]]:
+        """Centroide dos vetores de cada `fonte` (usado pelo `QueryRouter`).
+
+        O cálculo percorre a coleção uma vez e fica em cache em
+        `centroides.json`, invalidado quando uma sincronização altera o banco.
+        """
+        path = os.path.join(self.persist_directory, "centroides.json")
+        if os.path.exists(path):
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)
+        sums: Dict[str, np.ndarray] = {}
+        for docs, vectors in self.backend.iter_batches(batch_size, include_vectors=True):
+            for doc, vector in zip(docs, vectors):
+                fonte = doc.metadata.get("fonte")
+                if fonte is not None:
+                    vector = np.asarray(vector, dtype=np.float32)
+                    sums[fonte] = sums.get(fonte, 0.0) + vector / (np.linalg.norm(vector) or 1.0)
+        centroids = {fonte: total.tolist() for fonte, total in sums.items()}
+        if centroids:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(centroids, f)
+        return centroids
+
+    def _invalidate_centroids(self):
+        path = os.path.join(self.persist_directory, "centroides.json")
+        if os.path.exists(path):
+            os.remove(path)
+
+    def get_article(self, numero: int, fontes: Optional[List[str]] = None) -> List[Document]:
+        """Busca exata de um artigo pelos metadados do `LegalStructureSplitter`, sem embedding.
+
+        Retorna os chunks que contêm o artigo (o próprio, o grupo em que foi
+        agrupado ou as partes de um artigo longo), em ordem de fonte e página.
+        """
+        docs = self.backend.find_article(numero, fontes)
+        return sorted(docs, key=lambda d: (str(d.metadata.get("fonte", "")), d.metadata.get("page") or 0))
+
+    def get_embeddings(self, ids: List[str]) -> Dict[str, List[float]]:
+        """Retorna os vetores já armazenados para os IDs informados."""
+        return self.backend.get_vectors(ids)
+
+    def local_reranker(self, lexical_weight: float = 0.3) -> LocalReranker:
+        """Cria um `LocalReranker` que reaproveita os vetores armazenados no banco."""
+        return LocalReranker(self.embeddings, vector_lookup=self.get_embeddings, lexical_weight=lexical_weight)
 
     def get_retriever(self, k: int = 5):
         """Retorna um objeto retriever para busca semântica."""
-        vectorstore = Chroma(
-            persist_directory=self.persist_directory,
-            embedding_function=self.embeddings
-        )
-        return vectorstore.as_retriever(search_kwargs={"k": k})
-
-    def search(self, query: str, k: int = 5) -> List[Document]:
-        """Realiza busca semântica no banco de dados vetorial."""
-        vectorstore = Chroma(
-            persist_directory=self.persist_directory,
-            embedding_function=self.embeddings
-        )
-        return vectorstore.similarity_search(query, k=k)
+        return self.vectorstore.as_retriever(search_kwargs={"k": k})
+
+    def search(self, query: str, k: int = 5, mode: str = "vector", fontes: Optional[List[str]] = None) -> List[Document]:
+        """Realiza busca no banco: "vector" (semântica), "lexical" (BM25) ou "hybrid" (ambas com RRF).
+
+        Com `fontes`, a busca considera apenas os chunks dessas fontes. Os
+        chunks vindos da busca vetorial trazem o cosseno em `metadata["similaridade"]`.
+        """
+        with self.tracer.span("search", k=k, mode=mode, fontes_filtradas=len(fontes or [])) as span:
+            if mode == "lexical":
+                docs = self.lexical_search(query, k=k, fontes=fontes)
+            else:
+                with self.tracer.span("embedding"):
+                    embedding = self.embeddings.embed_query(query)
+                docs = self._search_by_vector(query, embedding, k, mode, fontes)
+            span.set(resultados=len(docs))
+        return docs
+
+    async def asearch(self, query: str, k: int = 5, mode: str = "vector", fontes: Optional[List[str]] = None) -> List[Document]:
+        """Versão assíncrona de `search`: o embedding da pergunta é aguardado sem bloquear
+        o event loop e a consulta ao banco roda em uma thread."""
+        with self.tracer.span("search", k=k, mode=mode, fontes_filtradas=len(fontes or [])) as span:
+            if mode == "lexical":
+                docs = await asyncio.to_thread(self.lexical_search, query, k, fontes)
+            else:
+                with self.tracer.span("embedding"):
+                    embedding = await self.embeddings.aembed_query(query)
+                docs = await asyncio.to_thread(self._search_by_vector, query, embedding, k, mode, fontes)
+            span.set(resultados=len(docs))
+        return docs
+
+    @staticmethod
+    def _where(fontes: Optional[List[str]]) -> Optional[Dict]:
+        """Filtro de metadados (sintaxe do Chroma) para as fontes informadas."""
+        if not fontes:
+            return None
+        return {"fonte": fontes[0]} if len(fontes) == 1 else {"fonte": {"$in": list(fontes)}}
+
+    @staticmethod
+    def _with_similarity(hits) -> List[Document]:
+        """Docs dos hits com a similaridade de cosseno em `metadata["similaridade"]`.
+
+        Os backends retornam a distância L2 ao quadrado, que para vetores
+        normalizados (Gemini, `HashEmbeddings`) vale 2 - 2·cos. Os docs são
+        copiados porque um mesmo chunk pode aparecer em várias consultas do lote.
+        """
+        return [Document(page_content=doc.page_content, id=doc.id,
+                         metadata={**doc.metadata, "similaridade": 1.0 - distance / 2.0})
+                for doc, distance in hits]
+
+    def _search_by_vector(self, query: str, embedding: List[float], k: int, mode: str,
+                          fontes: Optional[List[str]] = None) -> List[Document]:
+        if mode == "hybrid":
+            return self.hybrid_search(query, k=k, embedding=embedding, fontes=fontes)
+        return self._with_similarity(self.backend.query([embedding], k, where=self._where(fontes))[0])
+
+    def _get_by_ids(self, ids: List[str]) -> List[Document]:
+        """Busca chunks pelos IDs preservando a ordem pedida."""
+        if not ids:
+            return []
+        by_id = {doc.id: doc for doc in self.backend.get_by_ids(ids)}
+        return [by_id[cid] for cid in ids if cid in by_id]
+
+    def lexical_search(self, query: str, k: int = 5, fontes: Optional[List[str]] = None) -> List[Document]:
+        """Busca léxica BM25 local, sem chamada ao modelo de embeddings."""
+        if not os.path.exists(self.lexical_index.path):
+            return []
+        return self._get_by_ids([cid for cid, _ in self.lexical_index.search(query, k=k, fontes=fontes)])
+
+    def hybrid_search(self, query: str, k: int = 5, candidates: int = 20, rrf_k: int = 60,
+                      embedding: Optional[List[float]] = None, fontes: Optional[List[str]] = None) -> List[Document]:
+        """Combina busca vetorial e BM25 por Reciprocal Rank Fusion."""
+        if embedding is None:
+            embedding = self.embeddings.embed_query(query)
+        vector_docs = self._with_similarity(self.backend.query([embedding], candidates, where=self._where(fontes))[0])
+        return self._fuse(query, vector_docs, k, candidates, rrf_k, fontes)
+
+    def _fuse(self, query: str, vector_docs: List[Document], k: int, candidates: int, rrf_k: int,
+              fontes: Optional[List[str]] = None) -> List[Document]:
+        lexical_ids = []
+        if os.path.exists(self.lexical_index.path):
+            lexical_ids = [cid for cid, _ in self.lexical_index.search(query, k=candidates, fontes=fontes)]
+        if not lexical_ids:
+            return vector_docs[:k]
+
+        docs_by_id = {doc.id: doc for doc in vector_docs}
+        fused = reciprocal_rank_fusion([[doc.id for doc in vector_docs], lexical_ids], k=rrf_k)[:k]
+        missing = [cid for cid in fused if cid not in docs_by_id]
+        docs_by_id.update({doc.id: doc for doc in self._get_by_ids(missing)})
+        return [docs_by_id[cid] for cid in fused if cid in docs_by_id]
+
+    def search_many(self, queries: List[str], k: int = 5, mode: str = "vector", candidates: int = 20,
+                    fontes: Optional[List[str]] = None) -> List[List[Document]]:
+        """Busca em lote: embeda todas as perguntas em uma chamada e consulta o banco uma única vez."""
+        with self.tracer.span("search_many", perguntas=len(queries), k=k, mode=mode, fontes_filtradas=len(fontes or [])):
+            return self._search_many(queries, k, mode, candidates, fontes)
+
+    def _search_many(self, queries: List[str], k: int, mode: str, candidates: int,
+                     fontes: Optional[List[str]] = None) -> List[List[Document]]:
+        if not queries:
+            return []
+        if mode == "lexical":
+            return [self.lexical_search(query, k=k, fontes=fontes) for query in queries]
+
+        with self.tracer.span("embedding", perguntas=len(queries)):
+            if isinstance(self.embeddings, CachedEmbeddings):
+                embeddings = self.embeddings.embed_queries(queries)
+            else:
+                embeddings = [self.embeddings.embed_query(query) for query in queries]
+        n_results = candidates if mode == "hybrid" else k
+        all_docs = [self._with_similarity(hits) for hits in self.backend.query(embeddings, n_results, where=self._where(fontes))]
+
+        if mode == "hybrid":
+            return [self._fuse(query, docs, k, candidates, 60, fontes) for query, docs in zip(queries, all_docs)]
+        return all_docs
 
 class RAGChainManager:
     """Gerencia o pipeline RAG com Reranking (Prompt + LLM + Retrieval)."""
+
+    # Incrementar ao alterar o template principal: invalida respostas em cache.
+    PROMPT_VERSION = "2"
+
+    # Prazo (s) de cada tentativa nas etapas que chamam o LLM (ver `ResilientChatModel`)
+    STAGE_TIMEOUTS = {"rerank": 10.0, "geracao": 30.0}
     
-    def __init__(self, vectorstore_manager: VectorDatabaseManager, model_name: str = "gemini-flash-latest"):
-        self.llm = ChatGoogleGenerativeAI(model=model_name, temperature=0)
+    def __init__(self, vectorstore_manager: VectorDatabaseManager, model_name: str = "gemini-flash-latest",
+                 search_mode: str = "hybrid", reranker: Optional[Reranker] = None,
+                 answer_cache: Optional[AnswerCache] = None, tracer: Optional[Tracer] = None,
+                 llm: Optional[BaseChatModel] = None, router: Optional[QueryRouter] = None,
+                 context_packer: Optional[ContextPacker] = None, confidence_policy: Optional[ConfidencePolicy] = None,
+                 fallback_model_name: Optional[str] = "gemini-flash-lite-latest"):
+        self.tracer = tracer if tracer is not None else default_tracer
+        if llm is None:
+            # Um cliente por modelo, compartilhado pelas etapas (pool de conexões do SDK). As
+            # retentativas, o hedge e o fallback ficam com o ResilientChatModel de cada etapa.
+            clients = [_lazy("ChatGoogleGenerativeAI")(model=name, temperature=0, max_retries=0,
+                                                       timeout=max(self.STAGE_TIMEOUTS.values()))
+                       for name in dict.fromkeys(filter(None, [model_name, fallback_model_name]))]
+            self.llm = clients[0]
+            self.stage_llms = {stage: ResilientChatModel(models=clients, stage=stage, timeout=timeout, tracer=self.tracer)
+                               for stage, timeout in self.STAGE_TIMEOUTS.items()}
+        else:
+            # LLM injetado (testes, benchmarks, um ResilientChatModel próprio): usado como está
+            self.llm = llm
+            self.stage_llms = {stage: llm for stage in self.STAGE_TIMEOUTS}
+        self.model_name = model_name
+        self.answer_cache = answer_cache
         self.vectorstore_manager = vectorstore_manager
+        self.search_mode = search_mode
+        self.reranker = reranker if reranker is not None else LLMReranker(self.stage_llms["rerank"], tracer=self.tracer)
+        self.router = router
+        self.context_packer = context_packer if context_packer is not None else ContextPacker()
+        # Profundidade da busca e rerank decididos pela confiança da busca vetorial
+        self.confidence_policy = confidence_policy if confidence_policy is not None else ConfidencePolicy()
         
         # Template de Prompt Principal
         template = """
@@ -86,67 +509,226 @@ class RAGChainManager:
         self.rerank_prompt = ChatPromptTemplate.from_template(rerank_template)
 
     def _format_docs(self, docs):
-        formatted = []
-        for doc in docs:
-            fonte = doc.metadata.get("fonte", "desconhecida").upper()
-            formatted.append(f"[{fonte}]: {doc.page_content}")
-        return "\n\n".join(formatted)
+        return self._pack_context(docs)[0]
+
+    def _pack_context(self, docs: List[Document]):
+        """Monta o contexto com o `context_packer` e retorna (contexto, relatório de economia de tokens)."""
+        with self.tracer.span("format_docs", chunks=len(docs)) as span:
+            context, report = self.context_packer.pack(docs)
+            span.set(caracteres=len(context), tokens_contexto=report["tokens_contexto"],
+                     tokens_economizados=report["tokens_economizados"], frases_removidas=report["frases_removidas"])
+        return context, report
 
     def rerank(self, question: str, docs: List[Document], k: int = 4) -> List[Document]:
-        """Usa o LLM para reordenar docs por relevância em lote (Batch Reranking)."""
-        if not docs:
-            return []
-            
-        # Prepara o contexto com IDs
-        context_parts = []
-        for i, doc in enumerate(docs):
-            context_parts.append(f"ID {i}: {doc.page_content}")
-        
-        batch_context = "\n\n".join(context_parts)
-        
-        template = """
-        Abaixo estão vários fragmentos de texto (chunks) e uma pergunta. 
-        Analise todos os fragmentos e selecione os {k} IDs dos fragmentos mais relevantes para responder à pergunta.
-        Retorne APENAS os IDs separados por vírgula, em ordem de relevância (do mais relevante para o menos).
-        Exemplo de retorno: 2, 5, 1, 0
-        
-        Pergunta: {question}
-        
-        Fragmentos:
-        {context}
-        
-        IDs dos {k} mais relevantes:"""
-        
-        try:
-            prompt = ChatPromptTemplate.from_template(template)
-            chain = prompt | self.llm | StrOutputParser()
-            response = chain.invoke({"question": question, "context": batch_context, "k": k})
-            
-            # Limpa e extrai os IDs
-            ids = [int(id_str.strip()) for id_str in response.split(",") if id_str.strip().isdigit()]
-            
-            # Retorna os documentos correspondentes (limitado a k e garantindo que os IDs são válidos)
-            reranked_docs = []
-            for idx in ids:
-                if 0 <= idx < len(docs):
-                    reranked_docs.append(docs[idx])
-            
-            return reranked_docs[:k] if reranked_docs else docs[:k]
-        except Exception as e:
-            print(f"Erro no reranking: {e}")
-            return docs[:k]
+        """Reordena os docs por relevância usando a estratégia configurada (LLM por padrão)."""
+        with self.tracer.span("rerank", candidatos=len(docs), estrategia=type(self.reranker).__name__):
+            return self.reranker.rerank(question, docs, k=k)
+
+    async def arerank(self, question: str, docs: List[Document], k: int = 4) -> List[Document]:
+        with self.tracer.span("rerank", candidatos=len(docs), estrategia=type(self.reranker).__name__):
+            return await self.reranker.arerank(question, docs, k=k)
+
+    def _generate(self, question: str, context: str) -> str:
+        prompt_value = self.prompt.invoke({"context": context, "question": question})
+        with self.tracer.span("generation", caracteres_prompt=len(prompt_value.to_string())) as span:
+            message = self.stage_llms["geracao"].invoke(prompt_value)
+            span.set(**_usage(message))
+        return StrOutputParser().invoke(message)
+
+    async def _agenerate(self, question: str, context: str) -> str:
+        prompt_value = await self.prompt.ainvoke({"context": context, "question": question})
+        with self.tracer.span("generation", caracteres_prompt=len(prompt_value.to_string())) as span:
+            message = await self.stage_llms["geracao"].ainvoke(prompt_value)
+            span.set(**_usage(message))
+        return StrOutputParser().invoke(message)
+
+    async def _astream_generate(self, question: str, context: str) -> AsyncIterator[str]:
+        prompt_value = await self.prompt.ainvoke({"context": context, "question": question})
+        parser = StrOutputParser()
+        with self.tracer.span("generation", caracteres_prompt=len(prompt_value.to_string())) as span:
+            start = time.perf_counter()
+            full = None
+            async for chunk in self.stage_llms["geracao"].astream(prompt_value):
+                if full is None:
+                    self.tracer.record("generation.primeiro_token", time.perf_counter() - start)
+                full = chunk if full is None else full + chunk
+                token = parser.invoke(chunk)
+                if token:
+                    yield token
+            span.set(**_usage(full))
+
+    def _route(self, question: str) -> Optional[List[str]]:
+        """Fontes a pesquisar segundo o `router` (None = todas); a decisão é registrada no tracer."""
+        if self.router is None:
+            return None
+        with self.tracer.span("roteamento") as span:
+            decision = self.router.route(question, embed_query=self.vectorstore_manager.embeddings.embed_query)
+            span.set(motivo=decision["motivo"], fontes=",".join(decision["fontes"] or ["todas"]))
+        return decision["fontes"]
+
+    def _candidates(self, use_reranking: bool) -> int:
+        # Com reranking, recupera o máximo da política (20); ela decide quantos seguem (ver `_plan`)
+        return self.confidence_policy.max_candidates if use_reranking else 4
+
+    def _plan(self, docs: List[Document], use_reranking: bool):
+        """Aplica a `confidence_policy` aos candidatos: retorna (candidatos, usar rerank, decisão).
+
+        A decisão (ação, similaridade do melhor candidato e margem) é registrada no tracer.
+        """
+        if not use_reranking:
+            return docs, False, None
+        with self.tracer.span("confianca") as span:
+            docs, decision = self.confidence_policy.apply(docs)
+            span.set(acao=decision["acao"], candidatos=decision["candidatos"],
+                     rerank_evitado=int(not decision["rerank"]))
+            if decision["similaridade"] is not None:
+                span.set(similaridade=decision["similaridade"], margem=decision["margem"])
+        return docs, decision["rerank"], decision
+
+    def _retrieve(self, question: str, use_reranking: bool) -> List[Document]:
+        k = self._candidates(use_reranking)
+        fontes = self._route(question)
+        docs = self.vectorstore_manager.search(question, k=k, mode=self.search_mode, fontes=fontes)
+        if fontes and len(docs) < k:
+            # Partição vazia ou pequena demais (roteamento errado): volta à busca global
+            docs = self.vectorstore_manager.search(question, k=k, mode=self.search_mode)
+        return docs
+
+    async def _aretrieve(self, question: str, use_reranking: bool) -> List[Document]:
+        k = self._candidates(use_reranking)
+        fontes = await asyncio.to_thread(self._route, question)
+        docs = await self.vectorstore_manager.asearch(question, k=k, mode=self.search_mode, fontes=fontes)
+        if fontes and len(docs) < k:
+            docs = await self.vectorstore_manager.asearch(question, k=k, mode=self.search_mode)
+        return docs
+
+    def _cached_answer(self, question: str, docs: List[Document], use_reranking: bool):
+        """Retorna (fingerprint, resposta em cache ou None); fingerprint é None sem cache."""
+        if self.answer_cache is None:
+            return None, None
+        fingerprint = self._fingerprint(docs, use_reranking)
+        return fingerprint, self.answer_cache.get(question, self.model_name, self.PROMPT_VERSION, fingerprint)
 
     def ask(self, question: str, use_reranking: bool = True) -> str:
-        """Processa uma pergunta via RAG, opcionalmente usando reranking."""
-        if use_reranking:
-            # 1. Recupera k=10 candidatos (reduzido de 15 para caber no contexto do prompt de reranking)
-            initial_docs = self.vectorstore_manager.search(question, k=10)
-            # 2. Rerank para pegar os Top 4
-            final_docs = self.rerank(question, initial_docs, k=4)
-        else:
-            final_docs = self.vectorstore_manager.search(question, k=4)
+        """Processa uma pergunta via RAG, opcionalmente usando reranking.
+
+        Com `answer_cache`, a chave inclui a impressão digital dos candidatos
+        recuperados: um acerto reaproveita a resposta sem rerank nem geração.
+        A `confidence_policy` pode pular o rerank ou mudar o número de candidatos.
+        """
+        # 1. Recuperação
+        initial_docs, use_reranking, _ = self._plan(self._retrieve(question, use_reranking), use_reranking)
+        fingerprint, cached = self._cached_answer(question, initial_docs, use_reranking)
+        if cached is not None:
+            return cached
+
+        # 2. Rerank para pegar os Top 4
+        final_docs = self.rerank(question, initial_docs, k=4) if use_reranking else initial_docs
             
         context = self._format_docs(final_docs)
         
-        chain = self.prompt | self.llm | StrOutputParser()
-        return chain.invoke({"context": context, "question": question})
+        answer = self._generate(question, context)
+        if fingerprint is not None:
+            self.answer_cache.put(question, self.model_name, self.PROMPT_VERSION, fingerprint, answer)
+        return answer
+
+    async def astream(self, question: str, use_reranking: bool = True) -> AsyncIterator[str]:
+        """Versão assíncrona de `ask` que gera os tokens da resposta à medida que o LLM os produz."""
+        initial_docs, use_reranking, _ = self._plan(await self._aretrieve(question, use_reranking), use_reranking)
+        # A busca por perguntas similares embeda a pergunta: fora do event loop
+        fingerprint, cached = await asyncio.to_thread(self._cached_answer, question, initial_docs, use_reranking)
+        if cached is not None:
+            yield cached
+            return
+
+        final_docs = await self.arerank(question, initial_docs, k=4) if use_reranking else initial_docs
+        context = self._format_docs(final_docs)
+
+        parts = []
+        async for token in self._astream_generate(question, context):
+            parts.append(token)
+            yield token
+        if fingerprint is not None:
+            self.answer_cache.put(question, self.model_name, self.PROMPT_VERSION, fingerprint, "".join(parts))
+
+    async def aask(self, question: str, use_reranking: bool = True) -> str:
+        """Versão assíncrona de `ask`."""
+        return "".join([token async for token in self.astream(question, use_reranking)])
+
+    def ask_many(self, questions: List[str], concurrency: int = 4, use_reranking: bool = True) -> List[Dict]:
+        """Responde várias perguntas de uma vez (avaliação offline e cargas em lote).
+
+        Perguntas repetidas (após normalização) são processadas uma única vez.
+        Todas as perguntas são embedadas em uma única chamada e buscadas em lote
+        no Chroma; rerank e geração rodam com no máximo `concurrency` perguntas
+        simultâneas. Cada resultado traz a resposta, os chunks citados, os
+        tempos de cada etapa (a busca em lote é compartilhada por todas) e a
+        decisão da `confidence_policy` (`confianca`).
+        """
+        return asyncio.run(self.aask_many(questions, concurrency=concurrency, use_reranking=use_reranking))
+
+    async def aask_many(self, questions: List[str], concurrency: int = 4, use_reranking: bool = True) -> List[Dict]:
+        unique = list(dict.fromkeys(normalize_query(q) for q in questions))
+        first_question = {}
+        for question in questions:
+            first_question.setdefault(normalize_query(question), question)
+        originals = [first_question[key] for key in unique]
+
+        start = time.perf_counter()
+        all_docs = await asyncio.to_thread(self._retrieve_many, originals, use_reranking)
+        search_ms = (time.perf_counter() - start) * 1000
+
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def answer(question: str, retrieved: List[Document]) -> Dict:
+            async with semaphore:
+                timings = {"busca_lote_ms": search_ms, "rerank_ms": 0.0, "geracao_ms": 0.0}
+                initial_docs, rerank, decision = self._plan(retrieved, use_reranking)
+                fingerprint, cached = await asyncio.to_thread(self._cached_answer, question, initial_docs, rerank)
+                if cached is not None:
+                    # Sem rerank e geração, cita a evidência cuja impressão digital casou com a do cache
+                    return {"pergunta": question, "resposta": cached, "chunks": self._chunk_refs(initial_docs),
+                            "cache": True, "tempos_ms": timings, "confianca": decision}
+
+                start = time.perf_counter()
+                final_docs = await self.arerank(question, initial_docs, k=4) if rerank else initial_docs
+                timings["rerank_ms"] = (time.perf_counter() - start) * 1000
+
+                start = time.perf_counter()
+                context, report = self._pack_context(final_docs)
+                resposta = await self._agenerate(question, context)
+                timings["geracao_ms"] = (time.perf_counter() - start) * 1000
+                if fingerprint is not None:
+                    self.answer_cache.put(question, self.model_name, self.PROMPT_VERSION, fingerprint, resposta)
+                return {"pergunta": question, "resposta": resposta, "chunks": self._chunk_refs(final_docs), "cache": False,
+                        "tempos_ms": timings, "contexto": report, "confianca": decision}
+
+        results = await asyncio.gather(*(answer(q, docs) for q, docs in zip(originals, all_docs)))
+        by_key = dict(zip(unique, results))
+        return [{**by_key[normalize_query(q)], "pergunta": q} for q in questions]
+
+    def _retrieve_many(self, questions: List[str], use_reranking: bool) -> List[List[Document]]:
+        """Busca em lote agrupando as perguntas pela rota: uma consulta ao banco por grupo de fontes."""
+        k = self._candidates(use_reranking)
+        groups: Dict[tuple, List[int]] = {}
+        for i, question in enumerate(questions):
+            groups.setdefault(tuple(self._route(question) or ()), []).append(i)
+        all_docs: List[List[Document]] = [[] for _ in questions]
+        for fontes, positions in groups.items():
+            batch = [questions[i] for i in positions]
+            results = self.vectorstore_manager.search_many(batch, k, self.search_mode, fontes=list(fontes) or None)
+            for i, docs in zip(positions, results):
+                if fontes and len(docs) < k:
+                    docs = self.vectorstore_manager.search(questions[i], k=k, mode=self.search_mode)
+                all_docs[i] = docs
+        return all_docs
+
+    @staticmethod
+    def _chunk_refs(docs: List[Document]) -> List[Dict]:
+        """Referências dos chunks citados na saída do modo lote."""
+        return [{"id": doc.id, "fonte": doc.metadata.get("fonte"), "pagina": doc.metadata.get("page")} for doc in docs]
+
+    @staticmethod
+    def _fingerprint(docs: List[Document], use_reranking: bool) -> str:
+        ids = [doc.id or doc.metadata.get("chunk_id") or doc.page_content for doc in docs]
+        return AnswerCache.fingerprint([f"rerank={use_reranking}"] + ids)
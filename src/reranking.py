@@ -0,0 +1,167 @@
+import asyncio
+import time
+from abc import ABC, abstractmethod
+from typing import Callable, Dict, List, Optional, Sequence
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+from src.lexico import tokenize
+from src.metricas import Tracer, tracer as default_tracer
+
+class Reranker(ABC):
+    """Interface para estratégias de reranking dos candidatos recuperados."""
+    @abstractmethod
+    def rerank(self, question: str, docs: List[Document], k: int = 4) -> List[Document]:
+        pass
+
+    async def arerank(self, question: str, docs: List[Document], k: int = 4) -> List[Document]:
+        """Versão assíncrona; por padrão executa `rerank` em uma thread."""
+        return await asyncio.to_thread(self.rerank, question, docs, k)
+
+class LLMReranker(Reranker):
+    """Usa o LLM para reordenar docs por relevância em lote (Batch Reranking)."""
+
+    template = """
+        Abaixo estão vários fragmentos de texto (chunks) e uma pergunta.
+        Analise todos os fragmentos e selecione os {k} IDs dos fragmentos mais relevantes para responder à pergunta.
+        Retorne APENAS os IDs separados por vírgula, em ordem de relevância (do mais relevante para o menos).
+        Exemplo de retorno: 2, 5, 1, 0
+
+        Pergunta: {question}
+
+        Fragmentos:
+        {context}
+
+        IDs dos {k} mais relevantes:"""
+
+    def __init__(self, llm, tracer: Optional[Tracer] = None):
+        self.llm = llm
+        self.tracer = tracer if tracer is not None else default_tracer
+
+    def _context(self, docs: List[Document]) -> str:
+        # Prepara o contexto com IDs
+        context_parts = []
+        for i, doc in enumerate(docs):
+            context_parts.append(f"ID {i}: {doc.page_content}")
+
+        return "\n\n".join(context_parts)
+
+    def _select(self, response: str, docs: List[Document], k: int) -> List[Document]:
+        # Limpa e extrai os IDs
+        ids = [int(id_str.strip()) for id_str in response.split(",") if id_str.strip().isdigit()]
+
+        # Retorna os documentos correspondentes (limitado a k e garantindo que os IDs são válidos)
+        reranked_docs = []
+        for idx in ids:
+            if 0 <= idx < len(docs):
+                reranked_docs.append(docs[idx])
+
+        return reranked_docs[:k] if reranked_docs else docs[:k]
+
+    def _fallback(self, error: Exception):
+        # Mantém a ordem da busca, mas deixa a falha visível nas métricas (`rerank.fallback`)
+        print(f"Erro no reranking: {error}")
+        self.tracer.record("rerank.fallback", 0.0, erro=type(error).__name__)
+
+    def _chain(self):
+        prompt = ChatPromptTemplate.from_template(self.template)
+        return prompt | self.llm | StrOutputParser()
+
+    def rerank(self, question: str, docs: List[Document], k: int = 4) -> List[Document]:
+        if not docs:
+            return []
+        try:
+            response = self._chain().invoke({"question": question, "context": self._context(docs), "k": k})
+            return self._select(response, docs, k)
+        except Exception as e:
+            self._fallback(e)
+            return docs[:k]
+
+    async def arerank(self, question: str, docs: List[Document], k: int = 4) -> List[Document]:
+        if not docs:
+            return []
+        try:
+            response = await self._chain().ainvoke({"question": question, "context": self._context(docs), "k": k})
+            return self._select(response, docs, k)
+        except Exception as e:
+            self._fallback(e)
+            return docs[:k]
+
+class LocalReranker(Reranker):
+    """Reranker local (CPU), sem chamada ao LLM.
+
+    Pontua todos os candidatos de uma vez: similaridade de cosseno entre a
+    pergunta e a matriz de embeddings dos chunks, combinada com a cobertura
+    léxica dos termos da pergunta. Os embeddings dos chunks vêm do banco
+    vetorial via `vector_lookup` (IDs -> vetores), então não há reembedding;
+    chunks sem vetor disponível são embedados em uma única chamada.
+    """
+    def __init__(self, embeddings: Embeddings,
+                 vector_lookup: Optional[Callable[[List[str]], Dict[str, Sequence[float]]]] = None,
+                 lexical_weight: float = 0.3):
+        self.embeddings = embeddings
+        self.vector_lookup = vector_lookup
+        self.lexical_weight = lexical_weight
+
+    def _doc_matrix(self, docs: List[Document]) -> np.ndarray:
+        vectors: Dict[str, Sequence[float]] = {}
+        ids = [doc.id for doc in docs if doc.id]
+        if self.vector_lookup is not None and ids:
+            vectors = self.vector_lookup(ids)
+        missing = [i for i, doc in enumerate(docs) if doc.id not in vectors]
+        rows: List[Sequence[float]] = [vectors.get(doc.id) for doc in docs]
+        if missing:
+            embedded = self.embeddings.embed_documents([docs[i].page_content for i in missing])
+            for i, vector in zip(missing, embedded):
+                rows[i] = vector
+        return np.asarray(rows, dtype=np.float32)
+
+    def scores(self, question: str, docs: List[Document]) -> np.ndarray:
+        """Retorna o score de cada candidato (maior é mais relevante)."""
+        query = np.asarray(self.embeddings.embed_query(question), dtype=np.float32)
+        matrix = self._doc_matrix(docs)
+        norms = np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0)
+        cosine = matrix @ query / np.where(norms == 0, 1.0, norms)
+
+        query_terms = set(tokenize(question))
+        if not query_terms:
+            return cosine
+        overlap = np.fromiter(
+            (len(query_terms.intersection(tokenize(doc.page_content))) for doc in docs),
+            dtype=np.float32, count=len(docs)
+        ) / len(query_terms)
+        return (1 - self.lexical_weight) * cosine + self.lexical_weight * overlap
+
+    def rerank(self, question: str, docs: List[Document], k: int = 4) -> List[Document]:
+        if not docs:
+            return []
+        order = np.argsort(-self.scores(question, docs), kind="stable")[:k]
+        return [docs[i] for i in order]
+
+def top_k_agreement(reference: List[Document], candidate: List[Document]) -> float:
+    """Fração dos documentos do ranking de referência presentes no ranking candidato."""
+    if not reference:
+        return 1.0
+    ref_keys = {doc.id or doc.page_content for doc in reference}
+    cand_keys = {doc.id or doc.page_content for doc in candidate}
+    return len(ref_keys & cand_keys) / len(ref_keys)
+
+def compare_rerankers(questions: List[str], retrieve: Callable[[str], List[Document]],
+                      rerankers: Dict[str, Reranker], reference: str, k: int = 4) -> Dict[str, Dict[str, float]]:
+    """Compara latência média e concordância top-k de cada reranker com o de referência."""
+    results = {name: {"latencia_media_ms": 0.0, "concordancia_top_k": 0.0} for name in rerankers}
+    for question in questions:
+        candidates = retrieve(question)
+        rankings = {}
+        for name, reranker in rerankers.items():
+            start = time.perf_counter()
+            rankings[name] = reranker.rerank(question, candidates, k=k)
+            results[name]["latencia_media_ms"] += (time.perf_counter() - start) * 1000
+        for name in rerankers:
+            results[name]["concordancia_top_k"] += top_k_agreement(rankings[reference], rankings[name])
+    for metrics in results.values():
+        metrics["latencia_media_ms"] /= max(len(questions), 1)
+        metrics["concordancia_top_k"] /= max(len(questions), 1)
+    return results
@@ -0,0 +1,108 @@
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+import numpy as np
+from src.lexico import tokenize
+
+# Nomes explícitos de cada fonte: uma menção basta para restringir a busca a ela.
+DEFAULT_ALIASES: Dict[str, List[str]] = {
+    "cdc": ["cdc", "código de defesa do consumidor", "lei 8.078", "lei nº 8.078"],
+    "lgpd": ["lgpd", "lei geral de proteção de dados", "lei 13.709", "lei nº 13.709", "anpd"],
+    "cc": ["código civil", "lei 10.406"],
+    "clt": ["clt", "consolidação das leis do trabalho"],
+    "ctn": ["ctn", "código tributário nacional"],
+}
+
+# Termos típicos de cada fonte (pontuam, mas não decidem sozinhos).
+DEFAULT_KEYWORDS: Dict[str, List[str]] = {
+    "cdc": ["consumidor", "fornecedor", "produto", "serviço", "compra", "vício", "defeito", "garantia",
+            "publicidade", "oferta", "fabricante", "comerciante", "arrependimento", "desistência", "reparação",
+            "abusiva", "cobrança", "troca", "devolução", "recall"],
+    "lgpd": ["dados", "pessoal", "titular", "controlador", "operador", "tratamento", "consentimento",
+             "encarregado", "privacidade", "anonimização", "sensível", "vazamento", "incidente",
+             "portabilidade", "compartilhamento", "finalidade"],
+    "cc": ["contrato", "obrigação", "posse", "propriedade", "herança", "sucessão", "casamento", "usucapião"],
+    "clt": ["empregado", "empregador", "salário", "férias", "jornada", "rescisão", "aviso prévio", "fgts"],
+    "ctn": ["tributo", "imposto", "contribuinte", "lançamento", "crédito tributário", "fisco", "taxa"],
+}
+
+def _phrases(terms: Iterable[str]) -> List[tuple]:
+    return [tuple(tokenize(term)) for term in terms if tokenize(term)]
+
+def _count(tokens: List[str], phrases: List[tuple]) -> int:
+    """Conta ocorrências das frases (sequências de tokens) na pergunta."""
+    hits = 0
+    for phrase in phrases:
+        size = len(phrase)
+        hits += sum(1 for i in range(len(tokens) - size + 1) if tuple(tokens[i:i + size]) == phrase)
+    return hits
+
+class QueryRouter:
+    """Roteia a pergunta para a(s) fonte(s) mais prováveis antes da busca.
+
+    A decisão é barata e local, em três níveis: (1) menção explícita à fonte
+    ("LGPD", "Código de Defesa do Consumidor"); (2) palavras-chave típicas de
+    cada fonte, ficando as fontes com pelo menos `keyword_ratio` da melhor
+    pontuação; (3) sem palavras-chave, similaridade entre o embedding da
+    pergunta e o centroide dos vetores de cada fonte (`centroids`), ficando as
+    fontes a até `margin` da mais similar. Quando nenhuma regra restringe a
+    busca (ou todas as fontes empatam), `fontes` é None e a busca é global.
+    Fontes ausentes do índice são ignoradas quando os centroides são conhecidos.
+    """
+    def __init__(self, aliases: Optional[Dict[str, List[str]]] = None,
+                 keywords: Optional[Dict[str, List[str]]] = None,
+                 centroids: Optional[Callable[[], Dict[str, Sequence[float]]]] = None,
+                 keyword_ratio: float = 0.5, margin: float = 0.02):
+        self.aliases = {fonte: _phrases(terms) for fonte, terms in (aliases or DEFAULT_ALIASES).items()}
+        self.keywords = {fonte: _phrases(terms) for fonte, terms in (keywords or DEFAULT_KEYWORDS).items()}
+        self._centroid_loader = centroids
+        self._centroids: Optional[Dict[str, np.ndarray]] = None
+        self.keyword_ratio = keyword_ratio
+        self.margin = margin
+
+    @property
+    def centroids(self) -> Dict[str, np.ndarray]:
+        """Centroides normalizados por fonte, carregados na primeira pergunta."""
+        if self._centroids is None:
+            raw = self._centroid_loader() if self._centroid_loader is not None else {}
+            self._centroids = {}
+            for fonte, vector in raw.items():
+                vector = np.asarray(vector, dtype=np.float32)
+                self._centroids[fonte] = vector / (np.linalg.norm(vector) or 1.0)
+        return self._centroids
+
+    def reset(self):
+        """Descarta os centroides em memória (após uma nova ingestão)."""
+        self._centroids = None
+
+    def _known(self, fontes: List[str]) -> List[str]:
+        indexed = self.centroids
+        return [f for f in fontes if f in indexed] if indexed else fontes
+
+    def route(self, question: str, embed_query: Optional[Callable[[str], Sequence[float]]] = None) -> Dict:
+        """Retorna {"fontes": lista ou None (todas), "motivo": regra aplicada}.
+
+        `embed_query` só é chamado quando as regras léxicas não decidem.
+        """
+        tokens = tokenize(question)
+        named = self._known([fonte for fonte, phrases in self.aliases.items() if _count(tokens, phrases)])
+        if named:
+            return self._decision(named, "mencao")
+
+        scores = {fonte: _count(tokens, phrases) for fonte, phrases in self.keywords.items()}
+        known = self._known([fonte for fonte, score in scores.items() if score])
+        scores = {fonte: scores[fonte] for fonte in known}
+        if scores:
+            best = max(scores.values())
+            return self._decision([f for f, s in scores.items() if s >= best * self.keyword_ratio], "palavras_chave")
+
+        if embed_query is not None and self.centroids:
+            query = np.asarray(embed_query(question), dtype=np.float32)
+            query = query / (np.linalg.norm(query) or 1.0)
+            similarity = {fonte: float(centroid @ query) for fonte, centroid in self.centroids.items()}
+            best = max(similarity.values())
+            return self._decision([f for f, s in similarity.items() if s >= best - self.margin], "centroide")
+        return {"fontes": None, "motivo": "sem_sinal"}
+
+    def _decision(self, fontes: List[str], motivo: str) -> Dict:
+        if self.centroids and set(fontes) >= set(self.centroids):
+            return {"fontes": None, "motivo": motivo}
+        return {"fontes": sorted(fontes), "motivo": motivo}
@@ -0,0 +1,250 @@
+import asyncio
+import json
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Dict, List, Optional, Tuple
+from langchain_core.embeddings import Embeddings
+from src.cache import CachedEmbeddings, embed_query_batch, normalize_query
+from src.metricas import Tracer, tracer as default_tracer
+
+class EmbeddingBatcher(Embeddings):
+    """Micro-batcher de embeddings de consulta.
+
+    Chamadas concorrentes de `embed_query`/`aembed_query` (de threads ou
+    corrotinas) que chegam dentro de `max_wait` segundos vão ao modelo numa
+    única chamada em lote de até `max_batch` textos; textos repetidos na mesma
+    janela são embedados uma vez. Uma thread daemon faz o agrupamento.
+    """
+    def __init__(self, embeddings: Embeddings, max_batch: int = 32, max_wait: float = 0.005):
+        self.embeddings = embeddings
+        self.max_batch = max_batch
+        self.max_wait = max_wait
+        self.calls = 0
+        self.texts = 0
+        self._queue: "queue.Queue" = queue.Queue()
+        self._worker: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def _submit(self, text: str) -> Future:
+        future: Future = Future()
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+                self._worker.start()
+        self._queue.put((text, future))
+        return future
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            batch = [item]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=remaining)
+                except queue.Empty:
+                    break
+                if item is None:
+                    self._queue.put(None)
+                    break
+                batch.append(item)
+            self._flush(batch)
+
+    def _flush(self, batch: List[Tuple[str, Future]]):
+        unique = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            vectors = dict(zip(unique, embed_query_batch(self.embeddings, unique)))
+        except Exception as exc:
+            for _, future in batch:
+                future.set_exception(exc)
+            return
+        self.calls += 1
+        self.texts += len(unique)
+        for text, future in batch:
+            future.set_result(vectors[text])
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._submit(text).result()
+
+    async def aembed_query(self, text: str) -> List[float]:
+        return await asyncio.wrap_future(self._submit(text))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embeddings.embed_documents(texts)
+
+    def stats(self) -> Dict[str, float]:
+        """Chamadas ao modelo e média de textos por chamada."""
+        return {"chamadas": self.calls, "textos": self.texts,
+                "textos_por_chamada": self.texts / self.calls if self.calls else 0.0}
+
+    def close(self):
+        """Encerra a thread de agrupamento; uma nova consulta a recria."""
+        with self._lock:
+            worker, self._worker = self._worker, None
+        if worker is not None:
+            self._queue.put(None)
+            worker.join()
+
+def batch_query_embeddings(db_manager, max_batch: int = 32, max_wait: float = 0.005) -> EmbeddingBatcher:
+    """Insere um `EmbeddingBatcher` no `VectorDatabaseManager`, abaixo do cache de consultas."""
+    if isinstance(db_manager.embeddings, CachedEmbeddings):
+        batcher = EmbeddingBatcher(db_manager.embeddings.embeddings, max_batch, max_wait)
+        db_manager.embeddings.embeddings = batcher
+    else:
+        batcher = EmbeddingBatcher(db_manager.embeddings, max_batch, max_wait)
+        db_manager.embeddings = batcher
+    return batcher
+
+class ServerOverloaded(RuntimeError):
+    """A fila de perguntas está cheia (HTTP 503)."""
+
+async def _read_body(receive) -> bytes:
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+async def _send(send, status: int, body, content_type: str = "application/json", headers: Optional[List] = None):
+    data = (json.dumps(body, ensure_ascii=False) if content_type == "application/json" else body).encode("utf-8")
+    await send({"type": "http.response.start", "status": status,
+                "headers": [(b"content-type", content_type.encode()), (b"content-length", str(len(data)).encode())]
+                + (headers or [])})
+    await send({"type": "http.response.body", "body": data})
+
+class RAGServer:
+    """Aplicação ASGI que serve um único `RAGChainManager` a vários usuários.
+
+    Todas as requisições compartilham o mesmo banco vetorial, cliente do LLM e
+    caches. No máximo `max_concurrency` perguntas são processadas ao mesmo
+    tempo e até `max_queue` aguardam; além disso a resposta é 503 com
+    `Retry-After` (backpressure). Perguntas idênticas (após normalização) em
+    andamento são coalescidas: as repetidas aguardam a computação da primeira,
+    sem ocupar a fila.
+
+    Rotas: `POST /perguntar` ({"pergunta": "...", "rerank": true}),
+    `GET /saude` e `GET /metrics` (Prometheus).
+    """
+    def __init__(self, rag_manager, max_concurrency: int = 8, max_queue: int = 64, use_reranking: bool = True,
+                 tracer: Optional[Tracer] = None):
+        self.rag_manager = rag_manager
+        self.max_concurrency = max_concurrency
+        self.max_queue = max_queue
+        self.use_reranking = use_reranking
+        self.tracer = tracer if tracer is not None else default_tracer
+        self.pending = 0
+        self.running = 0
+        self.coalesced = 0
+        self.rejected = 0
+        self._inflight: Dict[Tuple[str, bool], asyncio.Future] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    async def answer(self, question: str, use_reranking: Optional[bool] = None) -> Tuple[str, bool]:
+        """Retorna (resposta, coalescida); levanta `ServerOverloaded` com a fila cheia.
+
+        A computação roda numa task própria, que todos os interessados aguardam
+        via `shield`: cancelar quem a iniciou (cliente desconectado) não afeta as
+        perguntas coalescidas nela.
+        """
+        use_reranking = self.use_reranking if use_reranking is None else use_reranking
+        key = (normalize_query(question), use_reranking)
+        task = self._inflight.get(key)
+        coalesced = task is not None
+        if coalesced:
+            self.coalesced += 1
+        else:
+            if self.pending >= self.max_concurrency + self.max_queue:
+                self.rejected += 1
+                raise ServerOverloaded(f"{self.pending} perguntas em andamento")
+            if self._slots is None:
+                self._slots = asyncio.Semaphore(self.max_concurrency)
+            self.pending += 1
+            task = self._inflight[key] = asyncio.ensure_future(self._compute(key, question, use_reranking))
+            # Lê a exceção mesmo que ninguém mais a aguarde (evita o aviso de exceção não lida)
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+        try:
+            return await asyncio.shield(task), coalesced
+        except asyncio.CancelledError:
+            if task.cancelled() and not asyncio.current_task().cancelling():
+                # A computação foi cancelada (ex.: desligamento), não quem espera: responde 503
+                raise ServerOverloaded("pergunta cancelada no servidor")
+            raise
+
+    async def _compute(self, key: Tuple[str, bool], question: str, use_reranking: bool) -> str:
+        try:
+            async with self._slots:
+                self.running += 1
+                try:
+                    return await self.rag_manager.aask(question, use_reranking=use_reranking)
+                finally:
+                    self.running -= 1
+        finally:
+            self.pending -= 1
+            del self._inflight[key]
+
+    def status(self) -> Dict[str, int]:
+        return {"em_execucao": self.running, "na_fila": self.pending - self.running, "coalescidas": self.coalesced,
+                "rejeitadas": self.rejected}
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "lifespan":
+            while True:
+                message = await receive()
+                if message["type"] == "lifespan.startup":
+                    await send({"type": "lifespan.startup.complete"})
+                elif message["type"] == "lifespan.shutdown":
+                    await send({"type": "lifespan.shutdown.complete"})
+                    return
+        if scope["type"] != "http":
+            return
+
+        route = (scope["method"], scope["path"])
+        if route == ("POST", "/perguntar"):
+            await self._perguntar(receive, send)
+        elif route == ("GET", "/saude"):
+            await _send(send, 200, {"status": "ok", **self.status()})
+        elif route == ("GET", "/metrics"):
+            await _send(send, 200, self.tracer.to_prometheus(), content_type="text/plain; version=0.0.4")
+        else:
+            await _send(send, 404, {"erro": "rota não encontrada"})
+
+    async def _perguntar(self, receive, send):
+        try:
+            payload = json.loads(await _read_body(receive) or b"{}")
+            question = payload["pergunta"]
+            if not isinstance(question, str) or not question.strip():
+                raise ValueError
+        except (ValueError, KeyError, TypeError):
+            await _send(send, 400, {"erro": 'envie um JSON com o campo "pergunta"'})
+            return
+
+        start = time.perf_counter()
+        with self.tracer.span("servidor.pergunta") as span:
+            try:
+                answer, coalesced = await self.answer(question, payload.get("rerank"))
+            except ServerOverloaded:
+                span.set(rejeitada=1)
+                await _send(send, 503, {"erro": "servidor ocupado, tente novamente"}, headers=[(b"retry-after", b"1")])
+                return
+            except Exception as exc:
+                await _send(send, 500, {"erro": str(exc)})
+                return
+            span.set(coalescida=int(coalesced))
+        await _send(send, 200, {"pergunta": question, "resposta": answer, "coalescida": coalesced,
+                                "tempo_ms": (time.perf_counter() - start) * 1000})
+
+def serve(app: RAGServer, host: str = "127.0.0.1", port: int = 8000):
+    """Sobe o servidor ASGI com o uvicorn (dependência opcional), em um único processo."""
+    try:
+        import uvicorn
+    except ImportError:
+        raise ImportError("uvicorn não está instalado; `pip install uvicorn` para usar o modo servidor.")
+    uvicorn.run(app, host=host, port=port, log_level="warning")
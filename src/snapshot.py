@@ -0,0 +1,249 @@
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import time
+import zlib
+from typing import BinaryIO, Dict, Iterator, List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+
+# Layout do arquivo (little-endian):
+#   preâmbulo de 64 bytes: MAGIC, versão (u32), reservado (u32), offset e tamanho do cabeçalho (u64, u64),
+#                          sha256 do cabeçalho (32 bytes);
+#   seções alinhadas em 64 bytes: "vetores" (matriz int8/float16 crua, mapeável com np.memmap),
+#                                 "escalas" (float32 por linha, em int8), "chunks" (JSONL comprimido com zlib)
+#                                 e "arquivos/<nome>" (arquivos auxiliares comprimidos, ex.: o índice BM25);
+#   cabeçalho JSON no fim: dimensão, dtype, linhas, fontes, offset/tamanho/sha256 de cada seção e `info`.
+MAGIC = b"RAGSNAP\0"
+VERSION = 1
+_PREAMBLE = struct.Struct("<8sIIQQ32s")
+_ALIGN = 64
+
+class SnapshotError(ValueError):
+    """Snapshot inválido, corrompido ou de uma versão não suportada."""
+
+def _pad(f: BinaryIO):
+    f.write(b"\0" * (-f.tell() % _ALIGN))
+
+def _encode(matrix: np.ndarray, dtype: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """Mesma codificação do `MmapVectorStore` (int8 com escala por linha ou float16)."""
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    matrix = matrix / np.where(norms == 0, 1.0, norms)
+    if dtype == "int8":
+        scales = np.abs(matrix).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+    return matrix.astype(np.float16), None
+
+def _write_compressed(source: BinaryIO, f: BinaryIO, digest) -> int:
+    """Copia `source` comprimido com zlib para `f`; retorna o nº de bytes gravados."""
+    compressor = zlib.compressobj(6)
+    written = 0
+    while True:
+        block = source.read(1 << 20)
+        data = compressor.compress(block) if block else compressor.flush()
+        f.write(data)
+        digest.update(data)
+        written += len(data)
+        if not block:
+            return written
+
+def export_snapshot(backend, path: str, dtype: str = "int8", batch_size: int = 1000,
+                    info: Optional[Dict] = None, files: Optional[Dict[str, str]] = None) -> Dict:
+    """Grava todos os chunks (IDs, textos, metadados e vetores) de um `VectorBackend` em um único arquivo.
+
+    `files` ({nome: caminho}) acrescenta arquivos auxiliares, recuperáveis
+    com `Snapshot.extract`. A escrita é feita em streaming (um lote por vez)
+    num arquivo temporário, renomeado ao final. Retorna o cabeçalho gravado.
+    """
+    if dtype not in ("int8", "float16"):
+        raise ValueError("dtype deve ser 'int8' ou 'float16'.")
+    directory = os.path.dirname(os.path.abspath(path))
+    os.makedirs(directory, exist_ok=True)
+    header = {"versao": VERSION, "criado_em": time.strftime("%Y-%m-%dT%H:%M:%S"), "dtype": dtype, "dim": None,
+              "linhas": 0, "fontes": {}, "secoes": {}, "info": info or {}}
+    hashes = {name: hashlib.sha256() for name in ("vetores", "escalas", "chunks")}
+    scales: List[np.ndarray] = []
+    compressor = zlib.compressobj(6)
+    fd, tmp = tempfile.mkstemp(dir=directory, suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w+b") as f, tempfile.TemporaryFile() as chunks:
+            f.write(b"\0" * _PREAMBLE.size)
+            _pad(f)
+            start = f.tell()
+            for docs, vectors in backend.iter_batches(batch_size, include_vectors=True):
+                if not docs:
+                    continue
+                matrix, batch_scales = _encode(np.asarray(vectors, dtype=np.float32), dtype)
+                if header["dim"] is None:
+                    header["dim"] = matrix.shape[1]
+                data = matrix.tobytes()
+                f.write(data)
+                hashes["vetores"].update(data)
+                if batch_scales is not None:
+                    scales.append(batch_scales)
+                lines = "".join(json.dumps({"id": doc.id, "texto": doc.page_content, "metadados": doc.metadata},
+                                           ensure_ascii=False) + "\n" for doc in docs).encode("utf-8")
+                chunks.write(compressor.compress(lines))
+                for doc in docs:
+                    fonte = str(doc.metadata.get("fonte", ""))
+                    header["fontes"][fonte] = header["fontes"].get(fonte, 0) + 1
+                header["linhas"] += len(docs)
+            chunks.write(compressor.flush())
+            header["secoes"]["vetores"] = {"offset": start, "bytes": f.tell() - start}
+
+            if scales:
+                _pad(f)
+                data = np.concatenate(scales).astype("<f4").tobytes()
+                header["secoes"]["escalas"] = {"offset": f.tell(), "bytes": len(data)}
+                f.write(data)
+                hashes["escalas"].update(data)
+
+            _pad(f)
+            header["secoes"]["chunks"] = {"offset": f.tell(), "bytes": chunks.tell(), "compressao": "zlib"}
+            chunks.seek(0)
+            while True:
+                block = chunks.read(1 << 20)
+                if not block:
+                    break
+                f.write(block)
+                hashes["chunks"].update(block)
+
+            for name, file_path in (files or {}).items():
+                _pad(f)
+                section = header["secoes"][f"arquivos/{name}"] = {"offset": f.tell(), "compressao": "zlib"}
+                hashes[f"arquivos/{name}"] = hashlib.sha256()
+                with open(file_path, "rb") as source:
+                    section["bytes"] = _write_compressed(source, f, hashes[f"arquivos/{name}"])
+
+            for name, section in header["secoes"].items():
+                section["sha256"] = hashes[name].hexdigest()
+            data = json.dumps(header, ensure_ascii=False).encode("utf-8")
+            offset = f.tell()
+            f.write(data)
+            f.seek(0)
+            f.write(_PREAMBLE.pack(MAGIC, VERSION, 0, offset, len(data), hashlib.sha256(data).digest()))
+        os.replace(tmp, path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+    return header
+
+class Snapshot:
+    """Leitura de um snapshot gravado por `export_snapshot`.
+
+    Abrir lê e valida apenas o preâmbulo e o cabeçalho; `vectors` mapeia a
+    matriz do arquivo sem copiá-la para a RAM e `verify()` confere o sha256 de
+    cada seção.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        with open(path, "rb") as f:
+            preamble = f.read(_PREAMBLE.size)
+            if len(preamble) < _PREAMBLE.size:
+                raise SnapshotError(f"{path}: arquivo truncado.")
+            magic, version, _, offset, size, digest = _PREAMBLE.unpack(preamble)
+            if magic != MAGIC:
+                raise SnapshotError(f"{path}: não é um snapshot do índice.")
+            if version > VERSION:
+                raise SnapshotError(f"{path}: versão {version} não suportada (até {VERSION}).")
+            f.seek(offset)
+            data = f.read(size)
+        if len(data) != size or hashlib.sha256(data).digest() != digest:
+            raise SnapshotError(f"{path}: cabeçalho corrompido.")
+        self.header = json.loads(data)
+
+    @property
+    def rows(self) -> int:
+        return self.header["linhas"]
+
+    @property
+    def dtype(self) -> str:
+        return self.header["dtype"]
+
+    def _memmap(self, name: str, dtype, shape) -> Optional[np.memmap]:
+        section = self.header["secoes"].get(name)
+        if not self.rows or section is None:
+            return None
+        return np.memmap(self.path, dtype=dtype, mode="r", offset=section["offset"], shape=shape)
+
+    @property
+    def vectors(self) -> Optional[np.memmap]:
+        """Matriz codificada (int8 ou float16), uma linha por chunk, mapeada do arquivo."""
+        dtype = np.int8 if self.dtype == "int8" else np.float16
+        return self._memmap("vetores", dtype, (self.rows, self.header["dim"]))
+
+    @property
+    def scales(self) -> Optional[np.memmap]:
+        return self._memmap("escalas", "<f4", (self.rows,))
+
+    def decode(self, start: int, stop: int) -> np.ndarray:
+        """Vetores float32 (normalizados) das linhas `start`..`stop`."""
+        vectors = np.asarray(self.vectors[start:stop], dtype=np.float32)
+        if self.scales is not None:
+            vectors *= self.scales[start:stop][:, None]
+        return vectors
+
+    def _section_blocks(self, name: str, block_size: int = 1 << 20) -> Iterator[bytes]:
+        section = self.header["secoes"][name]
+        with open(self.path, "rb") as f:
+            f.seek(section["offset"])
+            remaining = section["bytes"]
+            while remaining:
+                block = f.read(min(block_size, remaining))
+                if not block:
+                    raise SnapshotError(f"{self.path}: seção {name} truncada.")
+                remaining -= len(block)
+                yield block
+
+    def verify(self):
+        """Confere o sha256 de todas as seções; levanta `SnapshotError` na primeira divergente."""
+        for name, section in self.header["secoes"].items():
+            digest = hashlib.sha256()
+            for block in self._section_blocks(name):
+                digest.update(block)
+            if digest.hexdigest() != section["sha256"]:
+                raise SnapshotError(f"{self.path}: checksum da seção {name} não confere.")
+
+    @property
+    def files(self) -> List[str]:
+        """Nomes dos arquivos auxiliares gravados no snapshot."""
+        return [name.split("/", 1)[1] for name in self.header["secoes"] if name.startswith("arquivos/")]
+
+    def extract(self, name: str, destination: str):
+        """Descomprime o arquivo auxiliar `name` em `destination`."""
+        decompressor = zlib.decompressobj()
+        with open(destination, "wb") as f:
+            for block in self._section_blocks(f"arquivos/{name}"):
+                f.write(decompressor.decompress(block))
+            f.write(decompressor.flush())
+
+    def iter_chunks(self, batch_size: int = 1000) -> Iterator[List[Dict]]:
+        """Registros {"id", "texto", "metadados"} em lotes, na ordem das linhas da matriz."""
+        decompressor = zlib.decompressobj()
+        pending, batch = b"", []
+        for block in self._section_blocks("chunks"):
+            lines = (pending + decompressor.decompress(block)).split(b"\n")
+            pending = lines.pop()
+            for line in lines:
+                batch.append(json.loads(line))
+                if len(batch) >= batch_size:
+                    yield batch
+                    batch = []
+        pending += decompressor.flush()
+        if pending.strip():
+            batch.append(json.loads(pending))
+        if batch:
+            yield batch
+
+    def iter_batches(self, batch_size: int = 1000) -> Iterator[Tuple[List[Document], np.ndarray]]:
+        """Lotes de (chunks, vetores float32), como `VectorBackend.iter_batches`."""
+        start = 0
+        for records in self.iter_chunks(batch_size):
+            docs = [Document(page_content=r["texto"], metadata={**r["metadados"], "chunk_id": r["id"]}, id=r["id"])
+                    for r in records]
+            yield docs, self.decode(start, start + len(records))
+            start += len(records)
@@ -0,0 +1,718 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+import uuid
+from abc import ABC, abstractmethod
+from typing import TYPE_CHECKING, Any, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple, Type, Union
+import numpy as np
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from src.dependencias import lazy_attributes
+
+# langchain_chroma/chromadb só são importados quando o backend Chroma é aberto.
+__getattr__, _lazy = lazy_attributes(__name__, {"Chroma": "langchain_chroma"})
+if TYPE_CHECKING:
+    from langchain_chroma import Chroma
+
+# Resultado de busca: (chunk, distância); menor distância é mais relevante.
+Hit = Tuple[Document, float]
+
+def _contains_article(metadata: Dict, numero: int, fontes: Optional[Sequence[str]]) -> bool:
+    if fontes and metadata.get("fonte") not in fontes:
+        return False
+    inicio, fim = metadata.get("artigo_inicio"), metadata.get("artigo_fim")
+    return inicio is not None and fim is not None and inicio <= numero <= fim
+
+class VectorBackend(ABC):
+    """Operações de armazenamento vetorial usadas pelo `VectorDatabaseManager`.
+
+    Os chunks são identificados por `metadata["chunk_id"]`. As distâncias
+    retornadas por `query` seguem a convenção do Chroma (L2 ao quadrado
+    entre vetores normalizados, ou seja, 2 - 2·cosseno).
+    """
+    @classmethod
+    def create(cls, persist_directory: str, embeddings: Embeddings, documents: List[Document], **options) -> "VectorBackend":
+        """Cria o banco do zero a partir dos documentos (usado por `create_or_update`)."""
+        backend = cls(persist_directory, embeddings, **options)
+        backend.add_documents(documents)
+        return backend
+
+    @classmethod
+    def from_snapshot(cls, persist_directory: str, embeddings: Embeddings, snapshot, batch_size: int = 1000,
+                      **options) -> "VectorBackend":
+        """Cria o banco a partir de um `Snapshot` (`src/snapshot.py`), gravando os vetores sem chamar o modelo."""
+        backend = cls(persist_directory, embeddings, **options)
+        for docs, vectors in snapshot.iter_batches(batch_size):
+            backend.upsert(docs, list(vectors))
+        backend.optimize()
+        return backend
+
+    @property
+    @abstractmethod
+    def store(self) -> VectorStore:
+        """VectorStore do LangChain (usado por `get_retriever`)."""
+
+    @abstractmethod
+    def ids_for_sources(self, sources: Iterable[str]) -> List[str]:
+        """IDs de todos os chunks cujo `metadata["source"]` está em `sources`."""
+
+    @abstractmethod
+    def add_documents(self, documents: List[Document]):
+        """Embeda e grava os chunks."""
+
+    @abstractmethod
+    def upsert(self, documents: List[Document], vectors: List[List[float]]):
+        """Grava chunks já embedados, substituindo IDs existentes."""
+
+    @abstractmethod
+    def delete(self, ids: Iterable[str]):
+        pass
+
+    @abstractmethod
+    def get_by_ids(self, ids: Sequence[str]) -> List[Document]:
+        pass
+
+    @abstractmethod
+    def get_vectors(self, ids: Sequence[str]) -> Dict[str, Sequence[float]]:
+        pass
+
+    @abstractmethod
+    def count(self) -> int:
+        pass
+
+    @abstractmethod
+    def iter_batches(self, batch_size: int = 1000,
+                     include_vectors: bool = False) -> Iterator[Tuple[List[Document], Optional[List[Sequence[float]]]]]:
+        """Percorre a coleção inteira em lotes de (chunks, vetores ou None)."""
+
+    @abstractmethod
+    def query(self, vectors: List[List[float]], k: int, where: Optional[Dict] = None) -> List[List[Hit]]:
+        """Top-k de cada vetor de consulta, com filtro opcional de metadados (ex.: `{"fonte": "cdc"}`)."""
+
+    def find_article(self, numero: int, fontes: Optional[Sequence[str]] = None) -> List[Document]:
+        """Chunks cujo intervalo `artigo_inicio`..`artigo_fim` contém o artigo `numero`.
+
+        Padrão: varredura dos metadados; os backends sobrescrevem com um filtro nativo.
+        """
+        found = []
+        for docs, _ in self.iter_batches():
+            found.extend(doc for doc in docs if _contains_article(doc.metadata, numero, fontes))
+        return found
+
+    def optimize(self):
+        """Manutenção após uma sincronização (ex.: reconstruir índices). Padrão: nada."""
+
+    def close(self):
+        pass
+
+class ChromaBackend(VectorBackend):
+    """Backend padrão: Chroma persistido em SQLite com índice HNSW."""
+    def __init__(self, persist_directory: str, embeddings: Embeddings, store: Optional["Chroma"] = None):
+        self._store = store if store is not None else _lazy("Chroma")(
+            persist_directory=persist_directory,
+            embedding_function=embeddings
+        )
+
+    @classmethod
+    def create(cls, persist_directory: str, embeddings: Embeddings, documents: List[Document], **options) -> "ChromaBackend":
+        # Recria a coleção (em vez de acrescentar a ela) e grava com os IDs por conteúdo, como no upsert
+        backend = cls(persist_directory, embeddings)
+        backend.store.reset_collection()
+        if documents:
+            backend.add_documents(documents)
+        return backend
+
+    @property
+    def store(self) -> "Chroma":
+        return self._store
+
+    def ids_for_sources(self, sources: Iterable[str]) -> List[str]:
+        ids = []
+        for source in sources:
+            ids.extend(self._store.get(where={"source": source}, include=[])["ids"])
+        return ids
+
+    def add_documents(self, documents: List[Document]):
+        self._store.add_documents(documents, ids=[doc.metadata["chunk_id"] for doc in documents])
+
+    def upsert(self, documents: List[Document], vectors: List[List[float]]):
+        self._store._collection.upsert(
+            ids=[doc.metadata["chunk_id"] for doc in documents],
+            embeddings=vectors,
+            documents=[doc.page_content for doc in documents],
+            metadatas=[doc.metadata for doc in documents]
+        )
+
+    def delete(self, ids: Iterable[str]):
+        ids = list(ids)
+        if ids:
+            self._store.delete(ids=ids)
+
+    def get_by_ids(self, ids: Sequence[str]) -> List[Document]:
+        return self._store.get_by_ids(list(ids))
+
+    def get_vectors(self, ids: Sequence[str]) -> Dict[str, Sequence[float]]:
+        results = self._store._collection.get(ids=list(ids), include=["embeddings"])
+        return dict(zip(results["ids"], results["embeddings"]))
+
+    def count(self) -> int:
+        return self._store._collection.count()
+
+    def iter_batches(self, batch_size: int = 1000, include_vectors: bool = False):
+        collection = self._store._collection
+        include = ["documents", "metadatas"] + (["embeddings"] if include_vectors else [])
+        for offset in range(0, collection.count(), batch_size):
+            results = collection.get(include=include, limit=batch_size, offset=offset)
+            docs = [Document(page_content=text or "", metadata=metadata or {}, id=cid)
+                    for cid, text, metadata in zip(results["ids"], results["documents"], results["metadatas"])]
+            yield docs, (list(results["embeddings"]) if include_vectors else None)
+
+    def query(self, vectors: List[List[float]], k: int, where: Optional[Dict] = None) -> List[List[Hit]]:
+        results = self._store._collection.query(
+            query_embeddings=vectors, n_results=k, where=where or None,
+            include=["documents", "metadatas", "distances"]
+        )
+        hits = []
+        for texts, metadatas, ids, distances in zip(results["documents"], results["metadatas"],
+                                                    results["ids"], results["distances"]):
+            hits.append([(Document(page_content=text, metadata=metadata or {}, id=cid), distance)
+                         for text, metadata, cid, distance in zip(texts, metadatas, ids, distances)
+                         if text is not None])
+        return hits
+
+    def find_article(self, numero: int, fontes: Optional[Sequence[str]] = None) -> List[Document]:
+        conditions = [{"artigo_inicio": {"$lte": numero}}, {"artigo_fim": {"$gte": numero}}]
+        if fontes:
+            conditions.append({"fonte": {"$in": list(fontes)}})
+        results = self._store._collection.get(where={"$and": conditions}, include=["documents", "metadatas"])
+        return [Document(page_content=text or "", metadata=metadata or {}, id=cid)
+                for cid, text, metadata in zip(results["ids"], results["documents"], results["metadatas"])]
+
+    def close(self):
+        client = getattr(self._store, "_client", None)
+        if client is not None and hasattr(client, "close"):
+            client.close()
+
+def _normalize(matrix: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    return matrix / np.where(norms == 0, 1.0, norms)
+
+class MmapVectorStore(VectorStore, VectorBackend):
+    """Banco vetorial nativo: matriz memory-mapped em int8 (padrão) ou float16 + sidecar de metadados.
+
+    Layout em `persist_directory`:
+      - `indice.json`: dimensão, tipo da matriz, nº de linhas, tabela de fontes e estado do IVF;
+      - `vetores.bin` (+ `escalas.bin` em int8): vetores normalizados, uma linha por chunk;
+      - `fontes.bin`: código int16 da `fonte` de cada linha (-1 = linha apagada);
+      - `metadados.sqlite3`: ID, linha, texto e metadados de cada chunk.
+
+    Abrir o banco só lê o cabeçalho e mapeia os arquivos, sem carregar a
+    matriz na RAM. A busca é exata (força bruta em blocos) em coleções
+    pequenas; com `optimize()` acima de `ivf_min_rows` linhas é construído um
+    índice IVF (k-means esférico) e só as `nprobe` listas mais próximas são
+    varridas. Escritas são append-only: substituições e remoções viram
+    linhas apagadas, recuperadas por `compact()`.
+
+    O int8 (quantização por linha) ocupa metade do float16 e é convertido
+    para float32 bem mais rápido na varredura; use `dtype="float16"` quando a
+    fidelidade dos scores importar mais que a latência.
+    """
+    BLOCK_ROWS = 65536
+
+    def __init__(self, persist_directory: str, embeddings: Embeddings, dtype: str = "int8",
+                 ivf_min_rows: int = 50_000, nprobe: Optional[int] = None):
+        if dtype not in ("float16", "int8"):
+            raise ValueError("dtype deve ser 'float16' ou 'int8'.")
+        self.persist_directory = persist_directory
+        self.embedding = embeddings
+        self.ivf_min_rows = ivf_min_rows
+        self.nprobe = nprobe
+        self._lock = threading.RLock()
+        self._conn: Optional[sqlite3.Connection] = None
+        os.makedirs(persist_directory, exist_ok=True)
+        self._header = self._read_header() or {"versao": 1, "dim": None, "dtype": dtype, "linhas": 0,
+                                               "fontes": [], "ivf": None}
+        self._remap()
+
+    # Arquivos e cabeçalho
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.persist_directory, name)
+
+    def _read_header(self) -> Optional[Dict]:
+        if not os.path.exists(self._path("indice.json")):
+            return None
+        with open(self._path("indice.json"), encoding="utf-8") as f:
+            return json.load(f)
+
+    def _write_header(self):
+        tmp = self._path("indice.json.tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self._header, f)
+        os.replace(tmp, self._path("indice.json"))
+
+    @property
+    def _dtype(self):
+        return np.int8 if self._header["dtype"] == "int8" else np.float16
+
+    def _remap(self):
+        """(Re)mapeia os arquivos para o nº de linhas do cabeçalho."""
+        rows, dim = self._header["linhas"], self._header["dim"]
+        self._matrix = self._scales = self._codes = None
+        if not rows:
+            return
+        self._matrix = np.memmap(self._path("vetores.bin"), dtype=self._dtype, mode="r", shape=(rows, dim))
+        self._codes = np.memmap(self._path("fontes.bin"), dtype=np.int16, mode="r+", shape=(rows,))
+        if self._header["dtype"] == "int8":
+            self._scales = np.memmap(self._path("escalas.bin"), dtype=np.float32, mode="r", shape=(rows,))
+
+    def _append(self, name: str, data: np.ndarray, row_size: int):
+        # Descarta bytes de uma escrita interrompida além do nº de linhas do cabeçalho.
+        path = self._path(name)
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            f.seek(self._header["linhas"] * row_size)
+            f.write(np.ascontiguousarray(data).tobytes())
+            f.truncate()
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self._path("metadados.sqlite3"), check_same_thread=False)
+            self._conn.executescript("""
+                CREATE TABLE IF NOT EXISTS chunks (id TEXT PRIMARY KEY, row INTEGER UNIQUE, source TEXT, text TEXT, metadata TEXT);
+                CREATE INDEX IF NOT EXISTS chunks_source ON chunks (source);
+            """)
+        return self._conn
+
+    def _fonte_code(self, fonte: str) -> int:
+        fontes = self._header["fontes"]
+        if fonte not in fontes:
+            fontes.append(fonte)
+        return fontes.index(fonte)
+
+    # Codificação dos vetores
+
+    def _encode(self, matrix: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        if self._header["dtype"] == "int8":
+            scales = np.abs(matrix).max(axis=1) / 127.0
+            scales[scales == 0] = 1.0
+            return np.round(matrix / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+        return matrix.astype(np.float16), None
+
+    def _decode(self, rows: Union[np.ndarray, slice]) -> np.ndarray:
+        vectors = np.asarray(self._matrix[rows], dtype=np.float32)
+        if self._scales is not None:
+            vectors *= self._scales[rows][:, None]
+        return vectors
+
+    # VectorBackend
+
+    @property
+    def store(self) -> "MmapVectorStore":
+        return self
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self.embedding
+
+    @classmethod
+    def create(cls, persist_directory: str, embeddings: Embeddings, documents: List[Document], **options) -> "MmapVectorStore":
+        shutil.rmtree(persist_directory, ignore_errors=True)
+        return super().create(persist_directory, embeddings, documents, **options)
+
+    @classmethod
+    def from_snapshot(cls, persist_directory: str, embeddings: Embeddings, snapshot, batch_size: int = 10000,
+                      **options) -> "MmapVectorStore":
+        """Com o mesmo dtype, copia a matriz e as escalas do snapshot byte a byte (sem decodificar)."""
+        dtype = options.pop("dtype", snapshot.dtype)
+        if dtype != snapshot.dtype:
+            return super().from_snapshot(persist_directory, embeddings, snapshot, dtype=dtype, **options)
+        shutil.rmtree(persist_directory, ignore_errors=True)
+        store = cls(persist_directory, embeddings, dtype=dtype, **options)
+        with store._lock:
+            if snapshot.rows:
+                np.asarray(snapshot.vectors).tofile(store._path("vetores.bin"))
+                if snapshot.scales is not None:
+                    np.asarray(snapshot.scales, dtype=np.float32).tofile(store._path("escalas.bin"))
+                conn = store._connection()
+                codes = np.empty(snapshot.rows, dtype=np.int16)
+                row = 0
+                for records in snapshot.iter_chunks(batch_size):
+                    conn.executemany(
+                        "INSERT INTO chunks (id, row, source, text, metadata) VALUES (?, ?, ?, ?, ?)",
+                        [(r["id"], row + i, r["metadados"].get("source"), r["texto"],
+                          json.dumps({**r["metadados"], "chunk_id": r["id"]}, ensure_ascii=False))
+                         for i, r in enumerate(records)]
+                    )
+                    for r in records:
+                        codes[row] = store._fonte_code(str(r["metadados"].get("fonte", "")))
+                        row += 1
+                conn.commit()
+                codes.tofile(store._path("fontes.bin"))
+                store._header.update(dim=snapshot.header["dim"], linhas=snapshot.rows)
+                store._write_header()
+                store._remap()
+        store.optimize()
+        return store
+
+    def ids_for_sources(self, sources: Iterable[str]) -> List[str]:
+        ids = []
+        with self._lock:
+            conn = self._connection()
+            for source in sources:
+                ids.extend(row[0] for row in conn.execute("SELECT id FROM chunks WHERE source = ?", (source,)))
+        return ids
+
+    def add_documents(self, documents: List[Document], **kwargs) -> List[str]:
+        if not documents:
+            return []
+        vectors = self.embedding.embed_documents([doc.page_content for doc in documents])
+        return self.upsert(documents, vectors, ids=kwargs.get("ids"))
+
+    def upsert(self, documents: List[Document], vectors: List[List[float]], ids: Optional[List[str]] = None) -> List[str]:
+        if ids is None:
+            ids = [doc.metadata.get("chunk_id") or doc.id or uuid.uuid4().hex for doc in documents]
+        matrix = _normalize(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            if self._header["dim"] is None:
+                self._header["dim"] = matrix.shape[1]
+            elif matrix.shape[1] != self._header["dim"]:
+                raise ValueError(f"Dimensão {matrix.shape[1]} diferente da do banco ({self._header['dim']}).")
+            conn = self._connection()
+            old_rows = self._rows_for(conn, ids)
+            start = self._header["linhas"]
+            encoded, scales = self._encode(matrix)
+            codes = np.array([self._fonte_code(str(doc.metadata.get("fonte", ""))) for doc in documents], dtype=np.int16)
+            self._append("vetores.bin", encoded, encoded.itemsize * matrix.shape[1])
+            if scales is not None:
+                self._append("escalas.bin", scales, 4)
+            self._append("fontes.bin", codes, 2)
+            conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, row, source, text, metadata) VALUES (?, ?, ?, ?, ?)",
+                [(cid, start + i, doc.metadata.get("source"), doc.page_content,
+                  json.dumps(doc.metadata, ensure_ascii=False)) for i, (cid, doc) in enumerate(zip(ids, documents))]
+            )
+            conn.commit()
+            self._header["linhas"] = start + len(documents)
+            self._write_header()
+            self._remap()
+            # IDs repetidos no próprio lote: vale a última ocorrência
+            live = set(self._rows_for(conn, ids))
+            stale = [row for row in old_rows + list(range(start, self._header["linhas"])) if row not in live]
+            self._tombstone(stale)
+        return ids
+
+    def add_texts(self, texts: Iterable[str], metadatas: Optional[List[Dict]] = None, *,
+                  ids: Optional[List[str]] = None, **kwargs: Any) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        return self.add_documents([Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas)], ids=ids)
+
+    @staticmethod
+    def _rows_for(conn: sqlite3.Connection, ids: Sequence[str]) -> List[int]:
+        rows = []
+        for i in range(0, len(ids), 900):
+            chunk = ids[i:i + 900]
+            rows.extend(r[0] for r in conn.execute(
+                f"SELECT row FROM chunks WHERE id IN ({','.join('?' * len(chunk))})", chunk))
+        return rows
+
+    def _tombstone(self, rows: List[int]):
+        if rows and self._codes is not None:
+            self._codes[np.asarray(rows, dtype=np.int64)] = -1
+            self._codes.flush()
+
+    def delete(self, ids: Optional[Iterable[str]] = None, **kwargs) -> bool:
+        ids = list(ids or [])
+        with self._lock:
+            conn = self._connection()
+            rows = self._rows_for(conn, ids)
+            conn.executemany("DELETE FROM chunks WHERE id = ?", [(cid,) for cid in ids])
+            conn.commit()
+            self._tombstone(rows)
+        return True
+
+    def _docs_for_rows(self, rows: Sequence[int]) -> Dict[int, Document]:
+        docs = {}
+        with self._lock:
+            conn = self._connection()
+            for i in range(0, len(rows), 900):
+                chunk = [int(r) for r in rows[i:i + 900]]
+                for row, cid, text, metadata in conn.execute(
+                        f"SELECT row, id, text, metadata FROM chunks WHERE row IN ({','.join('?' * len(chunk))})", chunk):
+                    docs[row] = Document(page_content=text, metadata=json.loads(metadata), id=cid)
+        return docs
+
+    def get_by_ids(self, ids: Sequence[str], /) -> List[Document]:
+        ids = list(ids)
+        docs = []
+        with self._lock:
+            conn = self._connection()
+            for i in range(0, len(ids), 900):
+                chunk = ids[i:i + 900]
+                for cid, text, metadata in conn.execute(
+                        f"SELECT id, text, metadata FROM chunks WHERE id IN ({','.join('?' * len(chunk))})", chunk):
+                    docs.append(Document(page_content=text, metadata=json.loads(metadata), id=cid))
+        return docs
+
+    def get_vectors(self, ids: Sequence[str]) -> Dict[str, Sequence[float]]:
+        ids = list(ids)
+        with self._lock:
+            conn = self._connection()
+            pairs = []
+            for i in range(0, len(ids), 900):
+                chunk = ids[i:i + 900]
+                pairs.extend(conn.execute(
+                    f"SELECT id, row FROM chunks WHERE id IN ({','.join('?' * len(chunk))})", chunk).fetchall())
+            if not pairs:
+                return {}
+            vectors = self._decode(np.asarray([row for _, row in pairs], dtype=np.int64))
+        return {cid: vector for (cid, _), vector in zip(pairs, vectors)}
+
+    def count(self) -> int:
+        with self._lock:
+            return self._connection().execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+
+    def find_article(self, numero: int, fontes: Optional[Sequence[str]] = None) -> List[Document]:
+        sql = ("SELECT id, text, metadata FROM chunks WHERE json_extract(metadata, '$.artigo_inicio') <= ? "
+               "AND json_extract(metadata, '$.artigo_fim') >= ?")
+        params: List[Any] = [numero, numero]
+        if fontes:
+            sql += f" AND json_extract(metadata, '$.fonte') IN ({','.join('?' * len(fontes))})"
+            params.extend(fontes)
+        with self._lock:
+            rows = self._connection().execute(sql + " ORDER BY row", params).fetchall()
+        return [Document(page_content=text, metadata=json.loads(metadata), id=cid) for cid, text, metadata in rows]
+
+    def iter_batches(self, batch_size: int = 1000, include_vectors: bool = False):
+        last_row = -1
+        while True:
+            with self._lock:
+                rows = self._connection().execute(
+                    "SELECT row, id, text, metadata FROM chunks WHERE row > ? ORDER BY row LIMIT ?", (last_row, batch_size)
+                ).fetchall()
+                if not rows:
+                    return
+                vectors = self._decode(np.asarray([r[0] for r in rows], dtype=np.int64)) if include_vectors else None
+            last_row = rows[-1][0]
+            docs = [Document(page_content=text, metadata=json.loads(metadata), id=cid) for _, cid, text, metadata in rows]
+            yield docs, (list(vectors) if vectors is not None else None)
+
+    # Busca
+
+    def _allowed_codes(self, where: Optional[Dict]) -> Optional[np.ndarray]:
+        """Converte o filtro em códigos de fonte aceitos (None = todos)."""
+        if not where:
+            return None
+        if set(where) != {"fonte"}:
+            raise ValueError("O backend mmap só filtra por 'fonte'.")
+        condition = where["fonte"]
+        if isinstance(condition, dict):
+            if set(condition) != {"$in"}:
+                raise ValueError("Filtro de 'fonte' aceita um valor ou {'$in': [...]}.")
+            values = condition["$in"]
+        else:
+            values = [condition]
+        fontes = self._header["fontes"]
+        return np.array([fontes.index(v) for v in values if v in fontes], dtype=np.int16)
+
+    def _valid(self, codes: np.ndarray, allowed: Optional[np.ndarray]) -> np.ndarray:
+        return codes >= 0 if allowed is None else np.isin(codes, allowed)
+
+    @staticmethod
+    def _merge(best_scores: np.ndarray, best_rows: np.ndarray, scores: np.ndarray, rows: np.ndarray, k: int):
+        """Mantém os k maiores scores de cada consulta (linhas da matriz `scores`)."""
+        scores = np.concatenate([best_scores, scores], axis=1)
+        rows = np.concatenate([best_rows, np.broadcast_to(rows, (scores.shape[0], rows.shape[-1]))], axis=1)
+        if scores.shape[1] > k:
+            top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+            scores = np.take_along_axis(scores, top, axis=1)
+            rows = np.take_along_axis(rows, top, axis=1)
+        return scores, rows
+
+    def _brute_force(self, queries: np.ndarray, k: int, allowed: Optional[np.ndarray]):
+        best_scores = np.full((len(queries), 0), -np.inf, dtype=np.float32)
+        best_rows = np.zeros((len(queries), 0), dtype=np.int64)
+        total = self._header["linhas"]
+        for start in range(0, total, self.BLOCK_ROWS):
+            end = min(total, start + self.BLOCK_ROWS)
+            valid = self._valid(self._codes[start:end], allowed)
+            if valid.all():
+                # Bloco sem filtro nem linhas apagadas: fatia contígua, sem cópia por indexação
+                block, rows = slice(start, end), np.arange(start, end, dtype=np.int64)
+            else:
+                block = rows = np.nonzero(valid)[0] + start
+            if len(rows):
+                scores = queries @ self._decode(block).T
+                best_scores, best_rows = self._merge(best_scores, best_rows, scores, rows, k)
+        return best_scores, best_rows
+
+    def _ivf_search(self, queries: np.ndarray, k: int, allowed: Optional[np.ndarray]):
+        ivf = self._header["ivf"]
+        centroids = np.load(self._path("ivf_centroides.npy"), mmap_mode="r")
+        offsets = np.load(self._path("ivf_offsets.npy"), mmap_mode="r")
+        lists = np.load(self._path("ivf_linhas.npy"), mmap_mode="r")
+        nprobe = self.nprobe or max(8, ivf["nlist"] // 50)
+        probes = np.argsort(-(queries @ np.asarray(centroids).T), axis=1)[:, :nprobe]
+        tail = np.arange(ivf["linhas"], self._header["linhas"], dtype=np.int64)
+        all_scores, all_rows = [], []
+        for query, probe in zip(queries, probes):
+            rows = np.concatenate([np.asarray(lists[offsets[p]:offsets[p + 1]]) for p in probe] + [tail])
+            rows = np.sort(rows)
+            rows = rows[self._valid(self._codes[rows], allowed)]
+            if len(rows) < k:
+                # Filtro muito seletivo para as listas sondadas: volta à busca exata
+                scores, found = self._brute_force(query[None, :], k, allowed)
+            else:
+                scores, found = self._merge(np.full((1, 0), -np.inf, dtype=np.float32), np.zeros((1, 0), dtype=np.int64),
+                                            (self._decode(rows) @ query)[None, :], rows, k)
+            all_scores.append(scores[0])
+            all_rows.append(found[0])
+        return all_scores, all_rows
+
+    def _search(self, vectors: List[List[float]], k: int, where: Optional[Dict] = None,
+                exact: bool = False) -> List[List[Tuple[int, float]]]:
+        queries = _normalize(np.asarray(vectors, dtype=np.float32))
+        with self._lock:
+            if not self._header["linhas"] or k <= 0:
+                return [[] for _ in vectors]
+            allowed = self._allowed_codes(where)
+            if self._header["ivf"] and not exact:
+                scores, rows = self._ivf_search(queries, k, allowed)
+            else:
+                scores, rows = self._brute_force(queries, k, allowed)
+        results = []
+        for query_scores, query_rows in zip(scores, rows):
+            order = np.argsort(-query_scores, kind="stable")
+            results.append([(int(query_rows[i]), float(query_scores[i])) for i in order])
+        return results
+
+    def query(self, vectors: List[List[float]], k: int, where: Optional[Dict] = None, exact: bool = False) -> List[List[Hit]]:
+        results = self._search(vectors, k, where, exact)
+        docs = self._docs_for_rows(sorted({row for hits in results for row, _ in hits}))
+        return [[(docs[row], 2.0 - 2.0 * score) for row, score in hits if row in docs] for hits in results]
+
+    # Interface VectorStore (retriever do LangChain)
+
+    def similarity_search_by_vector(self, embedding: List[float], k: int = 4, filter: Optional[Dict] = None,
+                                    **kwargs: Any) -> List[Document]:
+        return [doc for doc, _ in self.query([embedding], k, where=filter)[0]]
+
+    def similarity_search_with_score(self, query: str, k: int = 4, filter: Optional[Dict] = None,
+                                     **kwargs: Any) -> List[Tuple[Document, float]]:
+        return self.query([self.embedding.embed_query(query)], k, where=filter)[0]
+
+    def similarity_search(self, query: str, k: int = 4, filter: Optional[Dict] = None, **kwargs: Any) -> List[Document]:
+        return self.similarity_search_by_vector(self.embedding.embed_query(query), k, filter=filter)
+
+    def _select_relevance_score_fn(self):
+        return self._euclidean_relevance_score_fn
+
+    @classmethod
+    def from_texts(cls, texts: List[str], embedding: Embeddings, metadatas: Optional[List[Dict]] = None, *,
+                   ids: Optional[List[str]] = None, persist_directory: str = "./mmap_db", **kwargs: Any) -> "MmapVectorStore":
+        store = cls(persist_directory, embedding, **kwargs)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+    # Manutenção
+
+    def optimize(self):
+        """Compacta linhas apagadas e (re)constrói o IVF quando a coleção passa de `ivf_min_rows`."""
+        with self._lock:
+            total = self._header["linhas"]
+            if not total:
+                return
+            alive = int((self._codes >= 0).sum())
+            if alive < total * 0.75:
+                self.compact()
+            ivf = self._header["ivf"]
+            if alive >= self.ivf_min_rows and (ivf is None or self._header["linhas"] - ivf["linhas"] > ivf["linhas"] * 0.2):
+                self.build_ivf()
+
+    def compact(self):
+        """Reescreve os arquivos sem as linhas apagadas."""
+        with self._lock:
+            conn = self._connection()
+            rows = np.nonzero(np.asarray(self._codes) >= 0)[0] if self._codes is not None else np.zeros(0, dtype=np.int64)
+            matrix = np.asarray(self._matrix[rows]) if len(rows) else None
+            scales = np.asarray(self._scales[rows]) if self._scales is not None and len(rows) else None
+            codes = np.asarray(self._codes[rows]) if len(rows) else None
+            self._matrix = self._scales = self._codes = None
+            self._header["linhas"] = 0
+            self._header["ivf"] = None
+            for name, data in (("vetores.bin", matrix), ("escalas.bin", scales), ("fontes.bin", codes)):
+                if data is not None:
+                    self._append(name, data, 0)
+                elif os.path.exists(self._path(name)):
+                    os.remove(self._path(name))
+            conn.execute("CREATE TEMP TABLE IF NOT EXISTS remap (old INTEGER PRIMARY KEY, new INTEGER)")
+            conn.execute("DELETE FROM remap")
+            conn.executemany("INSERT INTO remap (old, new) VALUES (?, ?)", [(int(old), new) for new, old in enumerate(rows)])
+            conn.execute("UPDATE chunks SET row = -1 - (SELECT new FROM remap WHERE old = chunks.row)")
+            conn.execute("UPDATE chunks SET row = -1 - row")
+            conn.commit()
+            self._header["linhas"] = len(rows)
+            self._write_header()
+            self._remap()
+
+    def build_ivf(self, nlist: Optional[int] = None, iterations: int = 10, sample_size: int = 100_000, seed: int = 0):
+        """Treina centroides por k-means esférico e agrupa as linhas por lista invertida."""
+        with self._lock:
+            rows = np.nonzero(np.asarray(self._codes) >= 0)[0]
+            nlist = nlist or max(1, int(np.sqrt(len(rows))))
+            rng = np.random.default_rng(seed)
+            sample = self._decode(np.sort(rng.choice(rows, size=min(sample_size, len(rows)), replace=False)))
+            centroids = sample[rng.choice(len(sample), size=min(nlist, len(sample)), replace=False)]
+            for _ in range(iterations):
+                assignment = np.argmax(sample @ centroids.T, axis=1)
+                sums = np.zeros_like(centroids)
+                np.add.at(sums, assignment, sample)
+                counts = np.bincount(assignment, minlength=len(centroids))
+                empty = counts == 0
+                sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+                centroids = _normalize(sums)
+
+            assignment = np.empty(len(rows), dtype=np.int64)
+            for start in range(0, len(rows), self.BLOCK_ROWS):
+                block = rows[start:start + self.BLOCK_ROWS]
+                assignment[start:start + len(block)] = np.argmax(self._decode(block) @ centroids.T, axis=1)
+            order = np.argsort(assignment, kind="stable")
+            offsets = np.concatenate([[0], np.cumsum(np.bincount(assignment, minlength=len(centroids)))])
+            np.save(self._path("ivf_centroides.npy"), centroids.astype(np.float32))
+            np.save(self._path("ivf_linhas.npy"), rows[order].astype(np.int64))
+            np.save(self._path("ivf_offsets.npy"), offsets.astype(np.int64))
+            self._header["ivf"] = {"nlist": len(centroids), "linhas": self._header["linhas"]}
+            self._write_header()
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+            self._matrix = self._scales = self._codes = None
+
+BACKENDS: Dict[str, Type[VectorBackend]] = {
+    "chroma": ChromaBackend,
+    "mmap": MmapVectorStore,
+}
+
+def resolve_backend(backend: Union[str, Type[VectorBackend]]) -> Type[VectorBackend]:
+    """Aceita o nome de um backend registrado em `BACKENDS` ou a própria classe."""
+    if isinstance(backend, str):
+        if backend not in BACKENDS:
+            raise ValueError(f"Backend desconhecido: {backend}. Opções: {', '.join(BACKENDS)}.")
+        return BACKENDS[backend]
+    return backend
+
+def copy_vectors(source: VectorBackend, target: VectorBackend, batch_size: int = 1000) -> int:
+    """Copia chunks e vetores entre backends sem chamar o modelo de embeddings. Retorna o total copiado."""
+    total = 0
+    for docs, vectors in source.iter_batches(batch_size, include_vectors=True):
+        for doc in docs:
+            doc.metadata.setdefault("chunk_id", doc.id)
+        target.upsert(docs, vectors)
+        total += len(docs)
+    return total
@@ -0,0 +1,97 @@
+from unittest.mock import MagicMock, patch
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from src.cache import AnswerCache
+from src.rag import RAGChainManager, VectorDatabaseManager
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && pytest tests/test_answer_cache.py
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+class FixedEmbeddings:
+    """Embeddings de brinquedo com vetores definidos por pergunta."""
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_query(self, text):
+        return self.vectors[text]
+
+FP = AnswerCache.fingerprint(["a", "b"])
+
+def test_chave_depende_da_evidencia():
+    cache = AnswerCache()
+    cache.put("O consentimento é obrigatório?", "modelo", "1", FP, "resposta")
+    assert cache.get("o consentimento é OBRIGATÓRIO?", "modelo", "1", FP) == "resposta"
+    assert cache.get("O consentimento é obrigatório?", "modelo", "1", AnswerCache.fingerprint(["a", "c"])) is None
+    assert cache.get("O consentimento é obrigatório?", "modelo", "2", FP) is None
+    assert cache.stats()["hits"] == 1
+
+def test_ttl_expira_entradas():
+    clock = FakeClock()
+    cache = AnswerCache(ttl=10, clock=clock)
+    cache.put("pergunta", "m", "1", FP, "resposta")
+    clock.now = 11
+    assert cache.get("pergunta", "m", "1", FP) is None
+
+def test_limite_de_tamanho_descarta_lru():
+    cache = AnswerCache(max_size=2)
+    for pergunta in ["p1", "p2"]:
+        cache.put(pergunta, "m", "1", FP, pergunta)
+    cache.get("p1", "m", "1", FP)
+    cache.put("p3", "m", "1", FP, "p3")
+    assert cache.get("p2", "m", "1", FP) is None
+    assert cache.get("p1", "m", "1", FP) == "p1"
+
+def test_perguntas_quase_identicas():
+    """Perguntas similares acima do limiar, com a mesma evidência, reaproveitam a resposta."""
+    embeddings = FixedEmbeddings({
+        "posso desistir da compra?": [1.0, 0.0],
+        "posso desistir de uma compra?": [0.99, 0.05],
+        "o que é dado sensível?": [0.0, 1.0],
+    })
+    cache = AnswerCache(similarity_threshold=0.95, embeddings=embeddings)
+    cache.put("posso desistir da compra?", "m", "1", FP, "Sim, em 7 dias (CDC).")
+    assert cache.get("posso desistir de uma compra?", "m", "1", FP) == "Sim, em 7 dias (CDC)."
+    assert cache.get("o que é dado sensível?", "m", "1", FP) is None
+    assert cache.stats()["similar_hits"] == 1
+
+def test_busca_similar_acompanha_descarte_e_ttl():
+    """Entradas descartadas (LRU ou TTL) saem da matriz de vetores do escopo."""
+    clock = FakeClock()
+    embeddings = FixedEmbeddings({"p1": [1.0, 0.0], "p2": [0.0, 1.0], "p3": [0.7, 0.7], "q1": [0.99, 0.1]})
+    cache = AnswerCache(max_size=2, ttl=10, similarity_threshold=0.95, embeddings=embeddings, clock=clock)
+    cache.put("p1", "m", "1", FP, "r1")
+    assert cache.get("q1", "m", "1", FP) == "r1"
+    cache.put("p2", "m", "1", FP, "r2")
+    cache.put("p3", "m", "1", FP, "r3")  # descarta p1
+    assert cache.get("q1", "m", "1", FP) is None
+    clock.now = 11
+    assert cache.get("p3", "m", "1", FP) is None and cache.stats()["size"] == 0
+    cache.put("p1", "m", "1", FP, "r1")
+    assert cache.get("q1", "m", "1", FP) == "r1"
+    assert cache.stats()["size"] == 1
+
+def test_ask_reaproveita_resposta_sem_rerank_nem_geracao():
+    """Um acerto no cache não deve chamar o reranker nem o LLM."""
+    docs = [Document(page_content=f"Art. {i}", metadata={"fonte": "cdc"}, id=f"id{i}") for i in range(10)]
+    db_manager = MagicMock(spec=VectorDatabaseManager)
+    db_manager.search.return_value = docs
+    llm = FakeListChatModel(responses=["Resposta (CDC)."])
+    with patch("src.rag.ChatGoogleGenerativeAI", return_value=llm):
+        manager = RAGChainManager(db_manager, answer_cache=AnswerCache(), reranker=MagicMock())
+    manager.reranker.rerank.return_value = docs[:4]
+
+    assert manager.ask("Quais as responsabilidades do fornecedor?") == "Resposta (CDC)."
+    llm.responses = []  # uma nova geração falharia
+    assert manager.ask("quais as responsabilidades do fornecedor?") == "Resposta (CDC)."
+    assert manager.reranker.rerank.call_count == 1
+
+    db_manager.search.return_value = docs[1:]  # índice mudou: evidência diferente
+    llm.responses = ["Nova resposta."]
+    llm.i = 0
+    assert manager.ask("Quais as responsabilidades do fornecedor?") == "Nova resposta."
@@ -0,0 +1,58 @@
+import asyncio
+import pytest
+from unittest.mock import MagicMock, patch
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from src.cache import AnswerCache, CachedEmbeddings
+from src.ingestao import DocumentProcessor
+from src.rag import RAGChainManager, VectorDatabaseManager
+from src.reranking import LLMReranker
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && pytest tests/test_async.py
+
+DOCS = [Document(page_content=f"Art. {i}º do CDC.", metadata={"fonte": "cdc"}, id=f"id{i}") for i in range(10)]
+
+@pytest.fixture
+def rag_manager():
+    db_manager = MagicMock(spec=VectorDatabaseManager)
+    db_manager.asearch.return_value = DOCS
+    llm = FakeListChatModel(responses=["3, 1", "O consumidor tem direito (CDC)."])
+    with patch("src.rag.ChatGoogleGenerativeAI", return_value=llm):
+        return RAGChainManager(db_manager, answer_cache=AnswerCache())
+
+def test_astream_gera_tokens_incrementalmente(rag_manager):
+    """A resposta deve chegar em vários pedaços e usar o rerank assíncrono do LLM."""
+    async def coletar():
+        return [token async for token in rag_manager.astream("Quais os direitos do consumidor?")]
+
+    tokens = asyncio.run(coletar())
+    assert len(tokens) > 1
+    assert "".join(tokens) == "O consumidor tem direito (CDC)."
+    rag_manager.vectorstore_manager.asearch.assert_awaited_once()
+
+def test_aask_usa_cache_de_respostas(rag_manager):
+    resposta = asyncio.run(rag_manager.aask("Quais os direitos do consumidor?"))
+    rag_manager.llm.responses = []
+    assert asyncio.run(rag_manager.aask("quais os direitos do consumidor?")) == resposta
+
+def test_arerank_llm_seleciona_ids():
+    reranker = LLMReranker(FakeListChatModel(responses=["2, 0"]))
+    docs = asyncio.run(reranker.arerank("pergunta", DOCS[:3], k=2))
+    assert [d.id for d in docs] == ["id2", "id0"]
+
+def test_asearch_equivale_a_search(tmp_path):
+    """A busca assíncrona deve retornar os mesmos chunks da busca síncrona."""
+    db_manager = VectorDatabaseManager(persist_directory=str(tmp_path / "chroma_db"),
+                                       embeddings=DeterministicFakeEmbedding(size=16))
+    docs = DocumentProcessor().assign_ids([
+        Document(page_content=f"Art. {i}º texto.", metadata={"source": "cdc.pdf", "page": i}) for i in range(5)
+    ])
+    db_manager.sync_documents(docs, sources=["cdc.pdf"])
+    for mode in ["vector", "hybrid", "lexical"]:
+        sync = db_manager.search("Art. 3º", k=3, mode=mode)
+        assincrono = asyncio.run(db_manager.asearch("Art. 3º", k=3, mode=mode))
+        assert [d.id for d in assincrono] == [d.id for d in sync]
+    assert isinstance(db_manager.embeddings, CachedEmbeddings)
+    assert db_manager.embeddings.stats()["hits"] >= 2
+    db_manager.close()
@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+from benchmarks.bench_offline import compare, parse_size, run_benchmark
+from benchmarks.sintetico import FakeLegalLLM, HashEmbeddings, synthetic_corpus, synthetic_questions
+from src.reranking import LLMReranker
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && pytest tests/test_benchmark_offline.py
+
+def test_hash_embeddings_deterministicos_e_semanticos():
+    embeddings = HashEmbeddings(size=128)
+    a = np.array(embeddings.embed_query("direitos do consumidor"))
+    assert np.allclose(a, embeddings.embed_documents(["direitos do consumidor"])[0])
+    parecido = np.array(embeddings.embed_query("direito do consumidor à reparação"))
+    diferente = np.array(embeddings.embed_query("anonimização dos dados pessoais"))
+    assert a @ parecido > a @ diferente
+
+def test_corpus_sintetico_gera_ids_unicos_em_lotes():
+    lotes = list(synthetic_corpus(250, batch_size=100))
+    assert [len(lote) for lote in lotes] == [100, 100, 50]
+    ids = {doc.metadata["chunk_id"] for lote in lotes for doc in lote}
+    assert len(ids) == 250
+    assert {doc.metadata["fonte"] for doc in lotes[0]} == {"cdc", "lgpd"}
+
+def test_perguntas_sinteticas_repetem_para_o_cache():
+    perguntas = synthetic_questions(100, repeat_ratio=0.5)
+    assert len(set(perguntas)) < len(perguntas)
+    assert perguntas == synthetic_questions(100, repeat_ratio=0.5)
+
+def test_fake_llm_responde_ao_prompt_de_rerank():
+    docs = [doc for lote in synthetic_corpus(6) for doc in lote]
+    reranked = LLMReranker(FakeLegalLLM()).rerank("pergunta", docs, k=2)
+    assert reranked == docs[:2]
+
+def test_parse_size():
+    assert parse_size("1k") == 1000
+    assert parse_size("100K") == 100_000
+    assert parse_size("1m") == 1_000_000
+    assert parse_size("250") == 250
+
+def test_compare_acusa_regressoes():
+    baseline = {"resultados": {"1k": {"busca": {"vector": {"p50_ms": 10.0}},
+                                      "ingestao": {"chunks_por_segundo": 1000.0, "chunks": 1000},
+                                      "cache": {"respostas_hit_ratio": 0.3}}}}
+    atual = {"resultados": {"1k": {"busca": {"vector": {"p50_ms": 10.5}},
+                                   "ingestao": {"chunks_por_segundo": 700.0, "chunks": 1000},
+                                   "cache": {"respostas_hit_ratio": 0.3}}}}
+    regressoes = compare(atual, baseline, tolerancia=0.15)
+    assert [r["metrica"] for r in regressoes] == ["1k.ingestao.chunks_por_segundo"]
+    assert regressoes[0]["piora"] == pytest.approx(0.3)
+
+def test_run_benchmark_em_corpus_pequeno(tmp_path):
+    resultado = run_benchmark(200, questions=20, workdir=str(tmp_path))
+    assert resultado["ingestao"]["chunks"] == 200
+    assert set(resultado["busca"]) == {"vector", "lexical", "hybrid"}
+    assert resultado["busca"]["hybrid"]["p99_ms"] >= resultado["busca"]["hybrid"]["p50_ms"]
+    assert set(resultado["rerank"]) == {"local", "llm"}
+    assert 0 < resultado["cache"]["respostas_hit_ratio"] < 1
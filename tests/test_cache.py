@@ -0,0 +1,84 @@
+import pytest
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from src.cache import CachedEmbeddings, LRUCache, normalize_query
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && pytest tests/test_cache.py
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """Embeddings falsos que contam as chamadas ao "modelo remoto"."""
+    calls: int = 0
+
+    def embed_query(self, text: str):
+        self.calls += 1
+        return super().embed_query(text)
+
+@pytest.fixture
+def cache_path(tmp_path):
+    return str(tmp_path / "embedding_cache.sqlite3")
+
+def test_normalizacao_da_pergunta():
+    """Perguntas que diferem só em caixa/espaços devem gerar a mesma chave."""
+    assert normalize_query("  O consentimento   é OBRIGATÓRIO? ") == "o consentimento é obrigatório?"
+
+def test_lru_descarta_menos_usado():
+    """O LRU deve respeitar o limite e descartar o item menos usado."""
+    lru = LRUCache(max_size=2)
+    lru.put("a", 1)
+    lru.put("b", 2)
+    lru.get("a")
+    lru.put("c", 3)
+    assert lru.get("b") is None
+    assert lru.get("a") == 1
+    assert len(lru) == 2
+
+def test_consulta_repetida_nao_chama_modelo(cache_path):
+    """Consultas repetidas devem ser servidas pelo cache em memória."""
+    base = CountingEmbeddings(size=16)
+    cache = CachedEmbeddings(base, "fake-model", cache_path)
+
+    v1 = cache.embed_query("O consentimento é obrigatório?")
+    v2 = cache.embed_query("o consentimento é obrigatório?  ")
+
+    assert base.calls == 1
+    assert v1 == v2
+    assert cache.stats()["hits"] == 1
+    assert cache.stats()["misses"] == 1
+
+def test_cache_persistido_em_disco(cache_path):
+    """Uma nova instância deve reaproveitar os vetores gravados no SQLite."""
+    primeiro = CachedEmbeddings(CountingEmbeddings(size=16), "fake-model", cache_path)
+    esperado = primeiro.embed_query("direito de arrependimento")
+    primeiro.close()
+
+    base = CountingEmbeddings(size=16)
+    segundo = CachedEmbeddings(base, "fake-model", cache_path)
+    vetor = segundo.embed_query("Direito de arrependimento")
+
+    assert base.calls == 0
+    assert segundo.stats()["disk_hits"] == 1
+    assert vetor == pytest.approx(esperado, rel=1e-6)
+
+def test_chave_inclui_modelo(cache_path):
+    """O mesmo texto com outro modelo de embedding não deve acertar o cache."""
+    CachedEmbeddings(CountingEmbeddings(size=16), "modelo-a", cache_path).embed_query("LGPD")
+    base = CountingEmbeddings(size=16)
+    CachedEmbeddings(base, "modelo-b", cache_path).embed_query("LGPD")
+    assert base.calls == 1
+
+def test_sqlite_descarta_os_vetores_usados_ha_mais_tempo(cache_path):
+    """O SQLite não deve passar de `max_disk_rows` vetores, descartando os menos usados."""
+    cache = CachedEmbeddings(CountingEmbeddings(size=16), "fake-model", cache_path, max_size=1, max_disk_rows=2)
+    cache.embed_query("CDC")
+    cache.embed_query("LGPD")
+    cache.embed_query("CDC")  # acerto em disco: passa a ser o mais recente
+    cache.embed_query("Marco Civil")
+    assert cache.disk_size() == 2
+    cache.close()
+
+    base = CountingEmbeddings(size=16)
+    novo = CachedEmbeddings(base, "fake-model", cache_path, max_disk_rows=2)
+    novo.embed_query("CDC")
+    novo.embed_query("Marco Civil")
+    assert base.calls == 0
+    novo.embed_query("LGPD")
+    assert base.calls == 1
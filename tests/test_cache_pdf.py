@@ -0,0 +1,114 @@
+import os
+import pytest
+from unittest.mock import patch
+from langchain_core.documents import Document
+from benchmarks.sintetico import HashEmbeddings
+from src.ingestao import DocumentProcessor, IngestionManager, IngestionManifest, LegalPDFLoader, ParsedPDFCache
+from src.rag import VectorDatabaseManager
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && pytest tests/test_cache_pdf.py
+
+def _pdf(tmp_path, nome="cdc.pdf", conteudo=b"%PDF-1.4 conteudo"):
+    caminho = tmp_path / nome
+    caminho.write_bytes(conteudo)
+    return str(caminho)
+
+@pytest.fixture
+def parser():
+    """Substitui o pypdf, contando quantas vezes o parsing é feito."""
+    with patch("src.ingestao.PyPDFLoader") as loader:
+        loader.return_value.lazy_load.side_effect = lambda: (
+            Document(page_content=f"Art. {i}º Texto com acentuação.", metadata={"source": loader.call_args.args[0], "page": i})
+            for i in range(3)
+        )
+        yield loader
+
+def test_segunda_leitura_vem_do_cache(tmp_path, parser):
+    cache = ParsedPDFCache(str(tmp_path / "cache"))
+    caminho = _pdf(tmp_path)
+    primeira = LegalPDFLoader(caminho, "cdc", cache=cache).load()
+    segunda = LegalPDFLoader(caminho, "lgpd", cache=cache).load()
+
+    assert parser.call_count == 1
+    assert [d.page_content for d in segunda] == [d.page_content for d in primeira]
+    assert segunda[2].metadata == {"source": caminho, "page": 2, "fonte": "lgpd"}
+    assert cache.stats()["hits"] == 1 and cache.stats()["extracoes"] == 1
+
+def test_invalidacao_por_conteudo_e_nao_por_mtime(tmp_path, parser):
+    cache = ParsedPDFCache(str(tmp_path / "cache"))
+    caminho = _pdf(tmp_path)
+    cache.put(caminho, LegalPDFLoader(caminho, "cdc").load())
+
+    # Mesmo conteúdo com outro mtime: o hash é recalculado e a extração é reaproveitada
+    os.utime(caminho, ns=(1, 1))
+    assert cache.get(caminho) is not None
+
+    _pdf(tmp_path, conteudo=b"%PDF-1.4 nova redacao")
+    assert cache.get(caminho) is None
+    assert ParsedPDFCache(str(tmp_path / "cache"), parser="pypdf-99").get(caminho) is None
+
+def test_arquivo_corrompido_e_reextraido(tmp_path, parser):
+    cache = ParsedPDFCache(str(tmp_path / "cache"))
+    caminho = _pdf(tmp_path)
+    LegalPDFLoader(caminho, "cdc", cache=cache).load()
+    extracao, = [n for n in os.listdir(cache.directory) if n.endswith(".jsonl.gz")]
+    (tmp_path / "cache" / extracao).write_bytes(b"lixo")
+
+    assert len(LegalPDFLoader(caminho, "cdc", cache=cache).load()) == 3
+    assert parser.call_count == 2
+    assert cache.get(caminho) is not None
+
+def test_limite_de_tamanho_descarta_o_menos_usado(tmp_path, parser):
+    cache = ParsedPDFCache(str(tmp_path / "cache"), max_bytes=1)
+    antigo, novo = _pdf(tmp_path, "a.pdf", b"a"), _pdf(tmp_path, "b.pdf", b"b")
+    LegalPDFLoader(antigo, "cdc", cache=cache).load()
+    LegalPDFLoader(novo, "lgpd", cache=cache).load()
+
+    assert cache.stats()["extracoes"] == 1
+    assert cache.get(novo) is not None and cache.get(antigo) is None
+
+def test_invalidate(tmp_path, parser):
+    cache = ParsedPDFCache(str(tmp_path / "cache"))
+    a, b = _pdf(tmp_path, "a.pdf", b"a"), _pdf(tmp_path, "b.pdf", b"b")
+    for caminho in (a, b):
+        LegalPDFLoader(caminho, "cdc", cache=cache).load()
+
+    cache.invalidate(a)
+    assert cache.get(a) is None and cache.get(b) is not None
+    cache.invalidate()
+    assert cache.stats()["extracoes"] == 0
+
+def _ingerir(db_manager, cache, manifest, arquivos):
+    """Mesmo fluxo do `app.py`: sincroniza os arquivos atuais e apaga os que saíram da ingestão."""
+    manager = IngestionManager([LegalPDFLoader(a, "cdc", cache=cache) for a in arquivos], manifest=manifest)
+    fontes = manager.plan()
+    batches = DocumentProcessor().split_stream(manager.iter_documents(), batch_size=2)
+    resultado = db_manager.sync_stream(batches, sources=fontes)
+    resultado["removidos"] += db_manager.delete_sources(manager.removed_files())
+    manager.commit()
+    return resultado
+
+@pytest.mark.parametrize("copiar", [False, True])
+def test_arquivo_renomeado_ou_copiado_mantem_os_chunks(tmp_path, parser, copiar):
+    """Uma extração reaproveitada de outro caminho deve ser indexada com o caminho atual."""
+    cache = ParsedPDFCache(str(tmp_path / "cache"))
+    manifest = IngestionManifest(str(tmp_path / "manifest.json"))
+    original = _pdf(tmp_path, "a.pdf")
+    with VectorDatabaseManager(persist_directory=str(tmp_path / "db"), embeddings=HashEmbeddings(),
+                               backend="mmap") as db_manager:
+        assert _ingerir(db_manager, cache, manifest, [original])["adicionados"] == 3
+
+        novo = str(tmp_path / "b.pdf")
+        if copiar:
+            (tmp_path / "b.pdf").write_bytes((tmp_path / "a.pdf").read_bytes())
+            arquivos = [original, novo]
+        else:
+            os.rename(original, novo)
+            arquivos = [novo]
+        resultado = _ingerir(db_manager, cache, manifest, arquivos)
+
+        assert parser.call_count == 1 and resultado["adicionados"] == 3
+        assert resultado["removidos"] == (0 if copiar else 3)
+        assert db_manager.backend.count() == 3 * len(arquivos)
+        fontes = [doc.metadata["source"] for docs, _ in db_manager.backend.iter_batches(100) for doc in docs]
+        assert sorted(set(fontes)) == sorted(arquivos)
@@ -0,0 +1,124 @@
+import time
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from src.estrutura import LegalStructureSplitter, estimate_tokens
+from src.ingestao import DocumentProcessor
+from src.rag import VectorDatabaseManager
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && pytest tests/test_chunker_juridico.py
+
+PAGINA_1 = """LEI Nº 8.078, DE 11 DE SETEMBRO DE 1990
+Dispõe sobre a proteção do consumidor e dá outras providências.
+TÍTULO I
+Dos Direitos do Consumidor
+CAPÍTULO I
+Disposições Gerais
+Art. 1° O presente código estabelece normas de proteção e defesa do consumidor.
+Art. 2° Consumidor é toda pessoa física ou jurídica que adquire ou utiliza produto
+como destinatário final.
+Parágrafo único. Equipara-se a consumidor a coletividade de pessoas.
+CAPÍTULO II
+Da Política Nacional de Relações de Consumo
+Art. 4º A Política Nacional das Relações de Consumo tem por objetivo o atendimento
+das necessidades dos consumidores, atendidos os seguintes princípios:
+I - reconhecimento da vulnerabilidade do consumidor no mercado de consumo;"""
+
+PAGINA_2 = """II - ação governamental no sentido de proteger efetivamente o consumidor:
+a) por iniciativa direta;
+b) por incentivos à criação e desenvolvimento de associações representativas;
+Art. 5º Para a execução da Política Nacional das Relações de Consumo, contará o poder público
+com a manutenção de assistência jurídica, integral e gratuita para o consumidor carente."""
+
+def _paginas(source="cdc.pdf", fonte="cdc"):
+    return [Document(page_content=texto, metadata={"source": source, "page": i, "fonte": fonte})
+            for i, texto in enumerate([PAGINA_1, PAGINA_2])]
+
+def _artigo_longo(numero: int, paragrafos: int = 6) -> str:
+    linhas = [f"Art. {numero}. O fornecedor de produtos e serviços responde pelos danos causados."]
+    for p in range(1, paragrafos + 1):
+        linhas.append(f"§ {p}º " + "O produto é defeituoso quando não oferece a segurança esperada. " * 6)
+    return "\n".join(linhas)
+
+def test_hierarquia_e_artigo_que_atravessa_paginas():
+    chunks = DocumentProcessor().split_legal(_paginas(), max_tokens=400)
+    assert [c.metadata["unidade"] for c in chunks] == ["preambulo", "artigos", "artigos"]
+
+    preambulo, cap1, cap2 = chunks
+    assert "LEI Nº 8.078" in preambulo.page_content and "artigo" not in preambulo.metadata
+    assert cap1.metadata["titulo"] == "TÍTULO I - Dos Direitos do Consumidor"
+    assert cap1.metadata["capitulo"] == "CAPÍTULO I - Disposições Gerais"
+    assert (cap1.metadata["artigo_inicio"], cap1.metadata["artigo_fim"]) == (1, 2)
+    assert "Parágrafo único" in cap1.page_content
+
+    # Art. 4º começa na página 0 e seus incisos/alíneas continuam na página 1
+    assert cap2.metadata["capitulo"] == "CAPÍTULO II - Da Política Nacional de Relações de Consumo"
+    assert cap2.metadata["titulo"] == "TÍTULO I - Dos Direitos do Consumidor"
+    assert cap2.metadata["page"] == 0 and cap2.metadata["artigo"] == "4"
+    assert "b) por incentivos" in cap2.page_content and cap2.metadata["artigo_fim"] == 5
+    assert all(c.metadata["chunk_id"] == c.id for c in chunks)
+
+def test_artigos_nao_sao_agrupados_alem_do_orcamento():
+    chunks = DocumentProcessor().split_legal(_paginas(), max_tokens=40)
+    artigos = [(c.metadata.get("artigo_inicio"), c.metadata.get("artigo_fim")) for c in chunks if "artigo" in c.metadata]
+    assert (1, 1) in artigos and (2, 2) in artigos
+    assert all(inicio == fim for inicio, fim in artigos)
+
+def test_artigo_longo_dividido_nos_paragrafos():
+    doc = Document(page_content=_artigo_longo(12) + "\nArt. 12-A. Dispositivo curto.", metadata={"source": "cdc.pdf", "page": 3})
+    chunks = list(LegalStructureSplitter(max_tokens=250).split_documents([doc]))
+
+    partes = [c for c in chunks if c.metadata["unidade"] == "parte_artigo"]
+    assert len(partes) >= 3
+    assert all(c.metadata["artigo"] == "12" and estimate_tokens(c.page_content) <= 250 + 5 for c in partes)
+    assert partes[0].page_content.startswith("Art. 12.")
+    assert all(c.page_content.startswith("(Art. 12) §") for c in partes[1:])
+    # Nenhum parágrafo é cortado ao meio: cada "§ N" aparece em exatamente um chunk
+    for p in range(1, 7):
+        assert sum(f"§ {p}º" in c.page_content for c in partes) == 1
+    assert chunks[-1].metadata["artigo"] == "12-A" and chunks[-1].metadata["artigo_inicio"] == 12
+
+def test_sumario_nao_abre_capitulo():
+    doc = Document(page_content="CAPÍTULO I – Disposições Gerais ........ 7\nArt. 1º Texto.", metadata={"source": "x.pdf", "page": 0})
+    sumario, artigo = LegalStructureSplitter().split_documents([doc])
+    assert sumario.metadata["unidade"] == "preambulo"
+    assert "capitulo" not in artigo.metadata and artigo.metadata["artigo"] == "1"
+
+def test_sumario_com_entrada_quebrada_em_duas_linhas():
+    """Cabeçalho de sumário cujo pontilhado e página ficam na linha seguinte não vira capítulo."""
+    texto = "\n".join([
+        "TÍTULO I", "Dos Direitos do Consumidor",
+        "CAPÍTULO IV – Da Qualidade de Produtos e Serviços, da Prevenção e da", "Reparação dos Danos ........ 10",
+        "SEÇÃO II – Da Responsabilidade pelo Fato do Produto", "e do Serviço .......... 12",
+        "Art. 1º Texto.",
+    ])
+    chunks = list(LegalStructureSplitter().split_documents([Document(page_content=texto, metadata={"source": "x.pdf", "page": 0})]))
+    artigo = chunks[-1].metadata
+    assert artigo["artigo"] == "1" and artigo["titulo"] == "TÍTULO I - Dos Direitos do Consumidor"
+    assert "capitulo" not in artigo and "secao" not in artigo
+    assert all("...." not in chunk.page_content for chunk in chunks)
+
+def test_tempo_linear_em_textos_grandes():
+    def tempo(n):
+        texto = "\n".join(_artigo_longo(i, paragrafos=2) for i in range(1, n + 1))
+        inicio = time.perf_counter()
+        chunks = list(LegalStructureSplitter().split_documents([Document(page_content=texto, metadata={"source": "x.pdf"})]))
+        assert chunks[-1].metadata["artigo_fim"] == n
+        return time.perf_counter() - inicio
+
+    tempo(200)  # aquecimento
+    pequeno, grande = tempo(1000), tempo(8000)
+    assert grande < pequeno * 8 * 3
+
+@pytest.mark.parametrize("backend", ["chroma", "mmap"])
+def test_busca_exata_de_artigo(tmp_path, backend):
+    db_manager = VectorDatabaseManager(persist_directory=str(tmp_path / backend), backend=backend,
+                                       embeddings=DeterministicFakeEmbedding(size=16))
+    chunks = DocumentProcessor().split_legal(_paginas() + _paginas("lgpd.pdf", "lgpd"), max_tokens=400)
+    db_manager.sync_documents(chunks, sources=["cdc.pdf", "lgpd.pdf"])
+
+    encontrados = db_manager.get_article(2)
+    assert len(encontrados) == 2 and all("Art. 2°" in d.page_content for d in encontrados)
+    assert [d.metadata["artigo"] for d in db_manager.get_article(5, fontes=["lgpd"])] == ["4"]
+    assert db_manager.get_article(3) == []
+    db_manager.close()
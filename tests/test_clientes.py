@@ -0,0 +1,112 @@
+import asyncio
+import functools
+import time
+from unittest.mock import MagicMock, patch
+import pytest
+from langchain_core.documents import Document
+from langchain_google_genai import ChatGoogleGenerativeAI
+from benchmarks.sintetico import StubGeminiServer
+from src.clientes import ResilientChatModel, error_kind
+from src.metricas import Tracer
+from src.rag import RAGChainManager, VectorDatabaseManager
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && pytest tests/test_clientes.py
+
+LENTO = 1.0
+
+@pytest.fixture
+def stub():
+    with StubGeminiServer(latency=lambda modelo: LENTO if modelo == "lento" else 0.0) as servidor:
+        yield servidor
+
+def _cliente(stub, modelo):
+    """O cliente real do Gemini, apontado para o servidor local, sem retentativas próprias."""
+    return ChatGoogleGenerativeAI(model=modelo, google_api_key="teste", base_url=stub.url, max_retries=0, timeout=10)
+
+def _resiliente(stub, *modelos, **opcoes):
+    opcoes = {"base_delay": 0.01, "tracer": Tracer(), **opcoes}
+    return ResilientChatModel(models=[_cliente(stub, m) for m in modelos], **opcoes)
+
+def test_hedge_responde_pelo_fallback_quando_o_primario_demora(stub):
+    llm = _resiliente(stub, "lento", "rapido", hedge_after=0.1, stage="geracao")
+    inicio = time.perf_counter()
+    assert "rapido" in llm.invoke("Quais os direitos do consumidor?").content
+    assert asyncio.run(llm.ainvoke("Quais os direitos do consumidor?")).content.endswith("rapido (CDC).")
+    assert time.perf_counter() - inicio < LENTO
+
+    chamadas = llm.tracer.to_json()["llm.geracao"]
+    assert chamadas["contagem"] == 2 and chamadas["contadores"]["hedge"] == 2
+    assert stub.requests.count("lento") == 2 and stub.requests.count("rapido") == 2
+    # Sem hedge, o primário responde (devagar) sozinho
+    assert "lento" in _resiliente(stub, "lento", "rapido", hedge=False).invoke("oi").content
+
+def test_cota_erros_transitorios_e_fatais(stub):
+    llm = _resiliente(stub, "primario", "reserva")
+    stub.fail("primario", 429)
+    assert "reserva" in llm.invoke("oi").content
+    assert "reserva" in llm.invoke("oi").content  # o primário fica fora da rota durante o cooldown
+    assert stub.requests == ["primario", "reserva", "reserva"]
+
+    stub.fail("instavel", 503, 500)
+    assert "instavel" in _resiliente(stub, "instavel").invoke("oi").content
+    assert stub.requests[-3:] == ["instavel"] * 3
+
+    stub.fail("invalido", 400)
+    with pytest.raises(Exception) as erro:
+        _resiliente(stub, "invalido").invoke("oi")
+    assert error_kind(erro.value) == "fatal" and stub.requests.count("invalido") == 1
+
+def test_prazo_por_tentativa(stub):
+    llm = _resiliente(stub, "lento", timeout=0.2, max_retries=1, hedge=False, stage="rerank")
+    inicio = time.perf_counter()
+    with pytest.raises(TimeoutError):
+        llm.invoke("oi")
+    assert time.perf_counter() - inicio < LENTO
+    with pytest.raises(TimeoutError):
+        asyncio.run(llm.ainvoke("oi"))
+    etapas = llm.tracer.to_json()
+    assert etapas["llm.rerank"]["contadores"]["falha"] == 2
+    assert etapas["llm.rerank.tentativa"]["contagem"] >= 4
+
+def test_stream_sincrono_respeita_o_prazo_do_primeiro_token(stub):
+    llm = _resiliente(stub, "lento", "rapido", timeout=0.2, hedge=False, stage="chat")
+    inicio = time.perf_counter()
+    assert "rapido" in "".join(chunk.content for chunk in llm.stream("Quais os direitos do consumidor?"))
+    assert time.perf_counter() - inicio < LENTO
+    tentativas = llm.tracer.to_json()["llm.chat.tentativa"]
+    assert tentativas["contagem"] == 2 and tentativas["contadores"]["erro"] == 1
+
+def test_cota_so_pelo_codigo_de_status():
+    assert error_kind(ValueError("O art. 429 do Código Civil não se aplica.")) == "fatal"
+    assert error_kind(RuntimeError("429 RESOURCE_EXHAUSTED")) == "cota"
+    assert error_kind(RuntimeError("Error code: 429 - limite atingido")) == "cota"
+    causa = RuntimeError("sem detalhes")
+    causa.code = 429
+    erro = RuntimeError("falha na chamada")
+    erro.__cause__ = causa
+    assert error_kind(erro) == "cota"
+    causa.code = 503
+    assert error_kind(erro) == "transitorio"
+
+def test_rag_usa_o_fallback_e_conta_as_tentativas(stub):
+    db_manager = MagicMock(spec=VectorDatabaseManager)
+    docs = [Document(page_content=f"Art. {i}º Texto {i}.", metadata={"fonte": "cdc"}, id=f"id{i}") for i in range(6)]
+    db_manager.search.return_value = docs
+    db_manager.asearch.return_value = docs
+    tracer = Tracer()
+    cliente = functools.partial(ChatGoogleGenerativeAI, google_api_key="teste", base_url=stub.url)
+    with patch("src.rag.ChatGoogleGenerativeAI", side_effect=cliente):
+        rag_manager = RAGChainManager(db_manager, tracer=tracer)
+    # Etapas diferentes, mesmos clientes (e conexões)
+    assert rag_manager.stage_llms["rerank"].models[0] is rag_manager.stage_llms["geracao"].models[0]
+
+    stub.fail("gemini-flash-latest", 429)
+    assert rag_manager.ask("Quais os direitos do consumidor?").endswith("gemini-flash-lite-latest (CDC).")
+    async def coletar():
+        return "".join([token async for token in rag_manager.astream("E a garantia legal?")])
+    assert "gemini-flash-lite-latest" in asyncio.run(coletar())
+
+    etapas = tracer.to_json()
+    assert etapas["llm.rerank.tentativa"]["contadores"]["erro"] == 1
+    assert etapas["llm.geracao"]["contadores"]["fallback"] == 2
+    assert "rerank.fallback" not in etapas  # a cota esgotada não derrubou o rerank
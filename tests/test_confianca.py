@@ -0,0 +1,91 @@
+from unittest.mock import MagicMock
+import pytest
+from langchain_core.documents import Document
+from benchmarks.sintetico import FakeLegalLLM, HashEmbeddings
+from src.confianca import ConfidencePolicy, calibrate, evaluate
+from src.ingestao import DocumentProcessor
+from src.metricas import Tracer
+from src.rag import RAGChainManager, VectorDatabaseManager
+from src.reranking import Reranker
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && pytest tests/test_confianca.py
+
+ARTIGOS = [f"Art. {i}º O fornecedor de {tema} responde pelos danos causados ao consumidor." for i, tema in
+           enumerate(["produtos", "serviços", "alimentos", "veículos", "medicamentos", "viagens", "seguros",
+                      "imóveis", "cosméticos", "brinquedos", "eletrônicos", "roupas"], start=1)]
+ARTIGOS.append("Art. 49. O consumidor pode desistir do contrato no prazo de sete dias, "
+               "sempre que a contratação ocorrer fora do estabelecimento comercial.")
+
+def _docs(*similaridades):
+    return [Document(page_content=f"chunk {i}", id=f"id{i}", metadata={"similaridade": s})
+            for i, s in enumerate(similaridades)]
+
+def test_decisao_por_similaridade_e_margem():
+    policy = ConfidencePolicy(skip_similarity=0.85, skip_margin=0.05, shrink_similarity=0.75, widen_similarity=0.6)
+    assert policy.decide([0.95, 0.7])["acao"] == "pular_rerank"
+    assert policy.decide([0.95, 0.93])["acao"] == "reduzir"  # acerto alto, mas sem margem
+    assert policy.decide([0.7, 0.69])["acao"] == "padrao"
+    assert policy.decide([0.5, 0.4])["acao"] == "ampliar"
+    assert policy.decide([])["acao"] == "padrao"  # busca léxica: sem escores
+
+    escolhidos, decisao = policy.apply(_docs(0.7, 0.95, *[0.3] * 18))
+    assert not decisao["rerank"] and [d.id for d in escolhidos] == ["id1", "id0", "id2", "id3"]
+    assert len(policy.apply(_docs(0.5, *[0.3] * 19))[0]) == 20
+    assert len(ConfidencePolicy(adaptive=False).apply(_docs(0.99, *[0.1] * 19))[0]) == 10
+
+@pytest.fixture
+def db_manager(tmp_path):
+    manager = VectorDatabaseManager(persist_directory=str(tmp_path / "chroma_db"), embeddings=HashEmbeddings())
+    docs = DocumentProcessor().assign_ids([
+        Document(page_content=texto, metadata={"source": "cdc.pdf", "page": i, "fonte": "cdc"})
+        for i, texto in enumerate(ARTIGOS)
+    ])
+    manager.sync_documents(docs, sources=["cdc.pdf"])
+    yield manager
+    manager.close()
+
+def test_busca_vetorial_informa_similaridade(db_manager):
+    exato = db_manager.search(ARTIGOS[-1], k=3, mode="vector")
+    assert exato[0].metadata["similaridade"] == pytest.approx(1.0, abs=1e-5)
+    assert exato[0].metadata["similaridade"] > exato[1].metadata["similaridade"]
+    # No lote, o mesmo chunk tem a similaridade de cada consulta
+    primeira, segunda = db_manager.search_many([ARTIGOS[-1], "prazo para desistir"], k=20, mode="vector")
+    mesma = {d.id: d.metadata["similaridade"] for d in segunda}[primeira[0].id]
+    assert mesma < primeira[0].metadata["similaridade"]
+
+def test_ask_pula_rerank_no_acerto_obvio_e_amplia_na_busca_fraca(db_manager):
+    tracer = Tracer()
+    reranker = MagicMock(spec=Reranker)
+    reranker.rerank.side_effect = lambda pergunta, docs, k: docs[:k]
+    rag_manager = RAGChainManager(db_manager, llm=FakeLegalLLM(), reranker=reranker, tracer=tracer)
+
+    assert "(CDC)" in rag_manager.ask(ARTIGOS[-1])
+    reranker.rerank.assert_not_called()
+    rag_manager.ask("Quem responde por cláusula abusiva em contrato de adesão bancário?")
+    assert len(reranker.rerank.call_args.args[1]) == len(ARTIGOS)  # todos os candidatos (até 20)
+
+    acoes = [s["acao"] for s in tracer.spans if s["nome"] == "confianca"]
+    assert acoes == ["pular_rerank", "ampliar"]
+    resultado, = rag_manager.ask_many([ARTIGOS[-1]])
+    assert resultado["confianca"]["acao"] == "pular_rerank" and resultado["confianca"]["similaridade"] > 0.99
+
+def test_calibracao_economiza_sem_perder_qualidade(tmp_path):
+    ids = [f"id{i}" for i in range(20)]
+    amostras = []
+    for i in range(40):
+        if i % 2:  # fácil: acerto isolado no topo
+            similaridades, referencia = [0.9 + i / 1000] + [0.6] * 19, ["id0"]
+        elif i % 4 == 0:  # difícil: o chunk certo está no 15º lugar
+            similaridades, referencia = [0.55] * 20, ["id14"]
+        else:  # médio: o chunk certo está entre os 6 primeiros
+            similaridades, referencia = [0.72] + [0.7] * 19, ["id4"]
+        amostras.append({"candidatos": ids, "similaridades": similaridades, "referencia": referencia})
+
+    policy, relatorio = calibrate(amostras, min_quality=1.0)
+    assert relatorio["qualidade"] == 1.0 and relatorio["qualidade_fixa"] < 1.0
+    assert relatorio["pular_rerank"] == 20 and relatorio["reduzir"] == 10 and relatorio["ampliar"] == 10
+    assert relatorio["candidatos_medios"] < evaluate(ConfidencePolicy(adaptive=False), amostras)["candidatos_medios"]
+
+    caminho = tmp_path / "confianca.json"
+    policy.save(str(caminho))
+    assert ConfidencePolicy.load(str(caminho)).to_dict() == policy.to_dict()
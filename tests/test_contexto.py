@@ -0,0 +1,72 @@
+from unittest.mock import MagicMock
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from src.contexto import ContextPacker
+from src.estrutura import estimate_tokens
+from src.metricas import Tracer
+from src.rag import RAGChainManager
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && pytest tests/test_contexto.py
+
+PAGINA = ("Art. 49. O consumidor pode desistir do contrato, no prazo de 7 dias a contar de sua assinatura "
+          "ou do ato de recebimento do produto ou serviço, sempre que a contratação ocorrer fora do "
+          "estabelecimento comercial. Parágrafo único. Se o consumidor exercitar o direito de arrependimento, "
+          "os valores eventualmente pagos serão devolvidos, de imediato, monetariamente atualizados.")
+
+def _doc(texto, fonte="cdc", page=10, source="cdc.pdf", **metadata):
+    return Document(page_content=texto, metadata={"fonte": fonte, "page": page, "source": source, **metadata})
+
+def test_chunks_sobrepostos_da_mesma_pagina_sao_unidos():
+    # Overlap do splitter: o segundo chunk repete o fim do primeiro
+    primeiro, segundo = _doc(PAGINA[:220]), _doc(PAGINA[150:])
+    contexto, relatorio = ContextPacker().pack([segundo, primeiro])
+    assert contexto == f"[CDC]: {PAGINA}"
+    assert relatorio["mesclados"] == 1 and relatorio["blocos"] == 1
+    assert relatorio["tokens_economizados"] > 0
+
+    contido = ContextPacker().pack([_doc(PAGINA), _doc(PAGINA[40:120])])[1]
+    assert contido["mesclados"] == 1
+    outra_pagina = ContextPacker().pack([_doc(PAGINA[:220]), _doc(PAGINA[150:], page=11)])[1]
+    assert outra_pagina["mesclados"] == 0
+
+def test_frases_quase_duplicadas_sao_removidas():
+    repetida = "O fornecedor responde, independentemente da existência de culpa, pela reparação dos danos causados."
+    variacao = "O fornecedor responde independentemente da existência de culpa pela reparação dos danos causados aos consumidores."
+    docs = [_doc(f"Art. 12. {repetida} Texto próprio do CDC sobre produtos."),
+            _doc(f"Art. 14. {variacao} Outra regra distinta sobre serviços.", page=12),
+            _doc("Art. 42. Na cobrança de débitos, o consumidor inadimplente não será exposto a ridículo.", page=20)]
+    contexto, relatorio = ContextPacker().pack(docs)
+    assert relatorio["frases_removidas"] == 1
+    assert contexto.count("independentemente da existência de culpa") == 1
+    assert "Outra regra distinta sobre serviços." in contexto and "Art. 14." in contexto
+
+def test_ordem_por_relevancia_tags_e_orcamento():
+    docs = [_doc("Art. 18. O titular dos dados pessoais tem direito a obter do controlador a confirmação.",
+                 fonte="lgpd", source="lgpd.pdf"),
+            _doc(PAGINA, page=30)]
+    contexto, _ = ContextPacker().pack(docs)
+    assert contexto.index("[LGPD]: Art. 18.") < contexto.index("[CDC]: Art. 49.")
+
+    contexto, relatorio = ContextPacker(max_tokens=60).pack(docs)
+    assert relatorio["truncado"] and estimate_tokens(contexto) <= 60
+    assert contexto.startswith("[LGPD]: Art. 18.") and contexto.endswith(".")
+
+def test_partes_de_um_artigo_longo_viram_um_bloco():
+    inicio = _doc("Art. 51. São nulas as cláusulas que: I - impossibilitem a responsabilidade;", artigo="51", page=28)
+    parte = _doc("(Art. 51) § 1º Presume-se exagerada a vantagem que ofende os princípios.", artigo="51", page=29)
+    contexto, relatorio = ContextPacker().pack([parte, inicio])
+    assert relatorio["blocos"] == 1
+    assert contexto.startswith("[CDC]: Art. 51.") and "(Art. 51)" not in contexto
+    assert contexto.index("I - impossibilitem") < contexto.index("§ 1º")
+
+def test_ask_many_reporta_economia_por_pergunta():
+    tracer = Tracer()
+    db_manager = MagicMock()
+    db_manager.search_many.return_value = [[_doc(PAGINA[:220]), _doc(PAGINA[150:])]]
+    rag_manager = RAGChainManager(db_manager, llm=FakeListChatModel(responses=["Sim (CDC)."]), tracer=tracer)
+
+    resultado, = rag_manager.ask_many(["Posso desistir da compra?"], use_reranking=False)
+    assert resultado["contexto"]["tokens_economizados"] > 0
+    assert resultado["contexto"]["tokens_contexto"] < resultado["contexto"]["tokens_originais"]
+    span = [s for s in tracer.spans if s["nome"] == "format_docs"][0]
+    assert span["tokens_economizados"] == resultado["contexto"]["tokens_economizados"]
@@ -0,0 +1,76 @@
+import time
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from src.indexacao import EmbeddingPipeline, TokenBucket, is_rate_limit_error
+from src.ingestao import DocumentProcessor
+from src.rag import VectorDatabaseManager
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && pytest tests/test_indexacao.py
+
+class FlakyEmbeddings(DeterministicFakeEmbedding):
+    """Embeddings falsos que recusam as primeiras chamadas por cota."""
+    failures: int = 0
+    fail_after: int = -1
+    calls: int = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.failures > 0:
+            self.failures -= 1
+            raise RuntimeError("429 RESOURCE_EXHAUSTED: quota exceeded")
+        if self.fail_after >= 0 and self.calls > self.fail_after:
+            raise RuntimeError("conexão perdida")
+        return super().embed_documents(texts)
+
+def chunks(n):
+    docs = [Document(page_content=f"Art. {i}º texto do artigo {i}.", metadata={"source": "cdc.pdf", "page": i, "fonte": "cdc"})
+            for i in range(n)]
+    return DocumentProcessor().assign_ids(docs)
+
+def test_token_bucket_limita_taxa():
+    """Após esgotar a capacidade, o balde deve esperar pela reposição."""
+    bucket = TokenBucket(rate=20, capacity=2)
+    start = time.perf_counter()
+    for _ in range(4):
+        bucket.acquire()
+    assert time.perf_counter() - start >= 0.09
+
+def test_deteccao_de_erro_de_cota():
+    assert is_rate_limit_error(RuntimeError("429 RESOURCE_EXHAUSTED"))
+    assert not is_rate_limit_error(ValueError("texto inválido"))
+
+def test_backoff_em_resource_exhausted():
+    """Lotes recusados por cota devem ser repetidos até terem sucesso."""
+    embeddings = FlakyEmbeddings(size=8, failures=2)
+    pipeline = EmbeddingPipeline(embeddings, batch_size=5, max_workers=1, requests_per_minute=6000, base_delay=0.001)
+    gravados = []
+    stats = pipeline.run(chunks(5), sink=lambda docs, vectors: gravados.extend(vectors))
+    assert len(gravados) == 5
+    assert stats["retentativas"] == 2
+    assert stats["chunks_por_segundo"] > 0
+
+def test_erro_nao_relacionado_a_cota_propaga():
+    embeddings = FlakyEmbeddings(size=8, fail_after=0)
+    pipeline = EmbeddingPipeline(embeddings, batch_size=5, max_workers=1, requests_per_minute=6000)
+    with pytest.raises(RuntimeError, match="conexão perdida"):
+        pipeline.run(chunks(5), sink=lambda docs, vectors: None)
+
+def test_execucao_interrompida_e_retomada(tmp_path):
+    """Uma ingestão interrompida deve retomar apenas os lotes não gravados."""
+    embeddings = FlakyEmbeddings(size=8, fail_after=2)
+    db_manager = VectorDatabaseManager(persist_directory=str(tmp_path / "chroma_db"), embeddings=embeddings)
+    docs = chunks(10)
+
+    pipeline = EmbeddingPipeline(db_manager.embeddings, batch_size=2, max_workers=1, requests_per_minute=6000)
+    with pytest.raises(RuntimeError):
+        db_manager.sync_documents(docs, sources=["cdc.pdf"], pipeline=pipeline)
+    assert db_manager.vectorstore._collection.count() == 4
+
+    embeddings.fail_after = -1
+    resultado = db_manager.sync_documents(docs, sources=["cdc.pdf"], pipeline=pipeline)
+    assert resultado["adicionados"] == 6
+    assert resultado["lotes"] == 3
+    assert db_manager.vectorstore._collection.count() == 10
+    assert len(db_manager.search("Art. 3º", k=3)) == 3
+    db_manager.close()
@@ -0,0 +1,99 @@
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from src.ingestao import DocumentProcessor, IngestionManager, IngestionManifest, LegalPDFLoader
+from src.rag import VectorDatabaseManager
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && pytest tests/test_ingestao_incremental.py
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """Embeddings falsos que contam quantos textos foram embedados."""
+    embedded: int = 0
+
+    def embed_documents(self, texts):
+        self.embedded += len(texts)
+        return super().embed_documents(texts)
+
+class FakePDFLoader(LegalPDFLoader):
+    """Loader que lê o arquivo como texto puro, uma "página" por linha."""
+    calls = 0
+
+    def lazy_load(self):
+        FakePDFLoader.calls += 1
+        with open(self.file_path, encoding="utf-8") as f:
+            for i, line in enumerate(f.read().splitlines()):
+                yield Document(page_content=line, metadata={"source": self.file_path, "page": i, "fonte": self.source_label})
+
+def paginas(source, textos):
+    return [Document(page_content=t, metadata={"source": source, "page": i, "fonte": "lgpd"}) for i, t in enumerate(textos)]
+
+@pytest.fixture
+def db_manager(tmp_path):
+    manager = VectorDatabaseManager(persist_directory=str(tmp_path / "chroma_db"),
+                                    embeddings=CountingEmbeddings(size=16))
+    yield manager
+    manager.close()
+
+def test_ids_estaveis_e_deduplicados():
+    """Chunks iguais devem gerar o mesmo ID; duplicatas são descartadas."""
+    processor = DocumentProcessor()
+    a = processor.split_recursive(paginas("lgpd.pdf", ["Art. 1º Esta Lei dispõe.", "Art. 1º Esta Lei dispõe."]))
+    b = processor.split_recursive(paginas("lgpd.pdf", ["Art. 1º Esta Lei dispõe."]))
+    assert len(a) == 2  # páginas diferentes geram IDs diferentes
+    assert a[0].metadata["chunk_id"] == b[0].metadata["chunk_id"]
+    assert len(processor.assign_ids(a + b)) == 2
+
+def test_sync_embeda_apenas_alteracoes(db_manager):
+    """Uma emenda em uma página deve custar apenas o chunk alterado."""
+    processor = DocumentProcessor()
+    embeddings = db_manager.embeddings.embeddings
+
+    v1 = processor.split_recursive(paginas("lgpd.pdf", ["Art. 1º texto", "Art. 2º texto", "Art. 3º texto"]))
+    resultado = db_manager.sync_documents(v1, sources=["lgpd.pdf"])
+    assert resultado == {"adicionados": 3, "removidos": 0, "inalterados": 0}
+    assert embeddings.embedded == 3
+
+    v2 = processor.split_recursive(paginas("lgpd.pdf", ["Art. 1º texto", "Art. 2º texto emendado"]))
+    resultado = db_manager.sync_documents(v2, sources=["lgpd.pdf"])
+    assert resultado == {"adicionados": 1, "removidos": 2, "inalterados": 1}
+    assert embeddings.embedded == 4
+    assert db_manager.vectorstore._collection.count() == 2
+
+def test_manifesto_ignora_arquivos_inalterados(tmp_path, db_manager):
+    """Arquivos com hash já registrado não devem ser lidos novamente."""
+    arquivo = tmp_path / "cdc.txt"
+    arquivo.write_text("Art. 1º\nArt. 2º", encoding="utf-8")
+    manifest_path = str(tmp_path / "chroma_db" / "ingestao_manifest.json")
+    FakePDFLoader.calls = 0
+
+    manager = IngestionManager([FakePDFLoader(str(arquivo), "cdc")], manifest=IngestionManifest(manifest_path))
+    docs, stats = manager.load_all()
+    assert stats["total"] == 2 and stats["total_ignorados"] == 0
+    manager.commit()
+
+    manager = IngestionManager([FakePDFLoader(str(arquivo), "cdc")], manifest=IngestionManifest(manifest_path))
+    docs, stats = manager.load_all()
+    assert docs == [] and stats["total_ignorados"] == 1
+    assert FakePDFLoader.calls == 1
+
+    arquivo.write_text("Art. 1º\nArt. 2º alterado", encoding="utf-8")
+    docs, stats = manager.load_all()
+    assert stats["cdc"] == 2
+    assert FakePDFLoader.calls == 2
+
+def test_arquivo_removido_apaga_chunks(tmp_path, db_manager):
+    """Arquivos que saem da ingestão devem ter seus chunks removidos do banco."""
+    arquivo = tmp_path / "lgpd.txt"
+    arquivo.write_text("Art. 1º\nArt. 2º", encoding="utf-8")
+    manifest = IngestionManifest(str(tmp_path / "manifest.json"))
+
+    manager = IngestionManager([FakePDFLoader(str(arquivo), "lgpd")], manifest=manifest)
+    docs, _ = manager.load_all()
+    db_manager.sync_documents(DocumentProcessor().split_recursive(docs), sources=list(manager.loaded_files))
+    manager.commit()
+
+    manager = IngestionManager([], manifest=manifest)
+    assert manager.removed_files() == [str(arquivo)]
+    assert db_manager.delete_sources(manager.removed_files()) == 2
+    manager.commit()
+    assert manifest.files == {}
@@ -0,0 +1,93 @@
+import os
+import time
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from src.ingestao import DocumentProcessor, IngestionManager, LegalPDFLoader
+from src.rag import VectorDatabaseManager
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && pytest tests/test_ingestao_streaming.py
+
+class TextLoader(LegalPDFLoader):
+    """Loader que lê o arquivo como texto puro, uma "página" por linha."""
+    def lazy_load(self):
+        with open(self.file_path, encoding="utf-8") as f:
+            for i, line in enumerate(f.read().splitlines()):
+                yield Document(page_content=line, metadata={"source": self.file_path, "page": i, "fonte": self.source_label})
+
+@pytest.fixture
+def loaders(tmp_path):
+    result = []
+    for n in range(5):
+        arquivo = tmp_path / f"lei{n}.txt"
+        arquivo.write_text("\n".join(f"Lei {n}, art. {i}º." for i in range(n + 1)), encoding="utf-8")
+        result.append(TextLoader(str(arquivo), f"lei{n}"))
+    return result
+
+def test_iter_documents_em_pool_preserva_ordem_e_estatisticas(loaders):
+    """O parsing em processos deve gerar as mesmas páginas e estatísticas do modo sequencial."""
+    sequencial, stats_seq = IngestionManager(loaders).load_all()
+
+    manager = IngestionManager(loaders)
+    manager.plan()
+    paralelo = list(manager.iter_documents(max_workers=2))
+
+    assert [d.page_content for d in paralelo] == [d.page_content for d in sequencial]
+    assert manager.stats == stats_seq
+    assert manager.stats["total"] == 15
+    assert manager.stats["lei4"] == 5
+
+def test_iter_documents_e_preguicoso(loaders):
+    """Nenhum arquivo deve ser lido antes de o gerador ser consumido."""
+    manager = IngestionManager(loaders)
+    manager.plan()
+    documents = manager.iter_documents(max_workers=2)
+    assert manager.stats["total"] == 0
+    next(documents)
+    documents.close()
+
+class SlowLoader(TextLoader):
+    """Só extrai a segunda página depois que o consumidor recebeu a primeira (sinalizado por arquivo)."""
+    def lazy_load(self):
+        yield Document(page_content="Art. 1º", metadata={"source": self.file_path, "page": 0})
+        prazo = time.monotonic() + 10
+        while not os.path.exists(self.file_path + ".recebida"):
+            if time.monotonic() > prazo:
+                raise TimeoutError("a primeira página não chegou ao consumidor")
+            time.sleep(0.01)
+        yield Document(page_content="Art. 2º", metadata={"source": self.file_path, "page": 1})
+
+def test_pool_entrega_as_paginas_durante_o_parsing(tmp_path, loaders):
+    """No pool, as páginas de um arquivo chegam ao consumidor antes de o parsing terminar."""
+    lento = SlowLoader(str(tmp_path / "grande.pdf"), "grande")
+    manager = IngestionManager([lento] + loaders[:1])
+    manager.plan()
+    documents = manager.iter_documents(max_workers=2)
+    assert next(documents).page_content == "Art. 1º"
+    open(lento.file_path + ".recebida", "w").close()
+    assert [d.page_content for d in documents] == ["Art. 2º", "Lei 0, art. 0º."]
+    assert manager.stats == {"total": 3, "grande": 2, "lei0": 1}
+
+def test_split_stream_gera_lotes_limitados():
+    docs = [Document(page_content=f"Art. {i}º " + "texto " * 50, metadata={"source": "cdc.pdf", "page": i}) for i in range(10)]
+    batches = list(DocumentProcessor().split_stream(iter(docs), chunk_size=100, chunk_overlap=0, batch_size=7))
+    assert len(batches) > 1
+    total = sum(len(b) for b in batches)
+    assert total == len(DocumentProcessor().split_recursive(docs, chunk_size=100, chunk_overlap=0))
+
+def test_sync_stream_equivale_a_sync_documents(tmp_path, loaders):
+    """A ingestão em streaming deve produzir o mesmo banco da ingestão em lote."""
+    db_manager = VectorDatabaseManager(persist_directory=str(tmp_path / "chroma_db"),
+                                       embeddings=DeterministicFakeEmbedding(size=8))
+    manager = IngestionManager(loaders)
+    sources = manager.plan()
+    batches = DocumentProcessor().split_stream(manager.iter_documents(max_workers=2), batch_size=4)
+    resultado = db_manager.sync_stream(batches, sources=sources)
+
+    assert resultado == {"adicionados": 15, "removidos": 0, "inalterados": 0}
+    assert db_manager.vectorstore._collection.count() == 15
+
+    manager.plan()
+    batches = DocumentProcessor().split_stream(manager.iter_documents(), batch_size=4)
+    assert db_manager.sync_stream(batches, sources=sources)["inalterados"] == 15
+    db_manager.close()
@@ -0,0 +1,61 @@
+import json
+import os
+import subprocess
+import sys
+import types
+from unittest.mock import patch
+import pytest
+from src.dependencias import lazy_attributes, preload
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && pytest tests/test_inicializacao.py
+
+RAIZ = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PESADOS = ["langchain_core", "langchain_community", "langchain_google_genai", "chromadb", "pypdf"]
+
+def _modulos_carregados(codigo: str) -> list:
+    """Executa `codigo` num processo novo e retorna quais módulos pesados foram importados."""
+    script = f"import sys, json\n{codigo}\nprint(json.dumps([m for m in {PESADOS!r} if m in sys.modules]))"
+    env = {**os.environ, "PYTHONPATH": RAIZ}
+    env.pop("GOOGLE_API_KEY", None)
+    saida = subprocess.run([sys.executable, "-c", script], cwd=RAIZ, env=env, capture_output=True, text=True,
+                           check=True)
+    return json.loads(saida.stdout.strip().splitlines()[-1])
+
+def test_cli_inicia_sem_importar_o_pipeline():
+    assert _modulos_carregados("import app") == []
+    # O controlador só abre o banco e cria os clientes no primeiro uso (nem exige a chave da API)
+    assert _modulos_carregados("import app\nc = app.RAGController(app.RAGView(), backend='mmap')") == []
+    assert "langchain_google_genai" not in _modulos_carregados("import src.rag")
+    assert "langchain_community" not in _modulos_carregados("import src.ingestao")
+
+def test_atributos_preguicosos_respeitam_patch():
+    modulo = types.ModuleType("modulo_teste")
+    sys.modules["modulo_teste"] = modulo
+    try:
+        modulo.__getattr__, resolve = lazy_attributes("modulo_teste", {"OrderedDict": "collections"})
+        assert "OrderedDict" not in vars(modulo)
+        from collections import OrderedDict
+        assert resolve("OrderedDict") is OrderedDict and modulo.OrderedDict is OrderedDict
+        with patch("modulo_teste.OrderedDict", dict):
+            assert resolve("OrderedDict") is dict
+        assert resolve("OrderedDict") is OrderedDict
+        with pytest.raises(AttributeError):
+            modulo.Inexistente
+    finally:
+        del sys.modules["modulo_teste"]
+
+def test_preaquecer_cria_o_pipeline_antes_do_uso(tmp_path, monkeypatch):
+    import app
+    from langchain_core.embeddings import DeterministicFakeEmbedding
+    from langchain_core.language_models.fake_chat_models import FakeListChatModel
+    monkeypatch.setattr(app.RAGController, "DIRETORIOS", {"mmap": str(tmp_path / "mmap_db")})
+
+    controller = app.RAGController(app.RAGView(), backend="mmap")
+    assert controller._db_manager is None and controller._rag_manager is None
+    with patch("src.rag.GoogleGenerativeAIEmbeddings", return_value=DeterministicFakeEmbedding(size=8)), \
+         patch("src.rag.ChatGoogleGenerativeAI", return_value=FakeListChatModel(responses=["ok"])):
+        tempos = controller.preaquecer()
+    assert {"src.rag", "banco", "clientes", "centroides"} <= set(tempos)
+    assert controller._db_manager._backend is not None and controller._rag_manager is not None
+    assert preload(["json"])["json"] >= 0
+    controller.db_manager.close()
@@ -0,0 +1,86 @@
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from src.ingestao import DocumentProcessor
+from src.lexico import BM25Index, reciprocal_rank_fusion, tokenize
+from src.rag import VectorDatabaseManager
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && pytest tests/test_lexico.py
+
+ARTIGOS = [
+    "Art. 18. O titular dos dados pessoais tem direito a obter do controlador a confirmação do tratamento.",
+    "Art. 7º O tratamento de dados pessoais somente poderá ser realizado mediante o consentimento do titular.",
+    "Art. 49. O consumidor pode desistir do contrato no prazo de 7 dias. § 3º Aplica-se às compras fora do estabelecimento.",
+    "Art. 12. O fabricante responde pela reparação dos danos causados aos consumidores.",
+]
+
+def chunks():
+    docs = [Document(page_content=t, metadata={"source": "lei.pdf", "page": i, "fonte": "lgpd" if i < 2 else "cdc"})
+            for i, t in enumerate(ARTIGOS)]
+    return DocumentProcessor().assign_ids(docs)
+
+def test_tokenizacao_portugues():
+    """Acentos, stopwords, ordinais e plurais simples devem ser normalizados."""
+    assert tokenize("Art. 18º, § 3º da Proteção de Dados") == ["art", "18", "§", "3", "protecao", "dado"]
+    assert tokenize("informações") == tokenize("informacao")
+
+def test_plurais_em_es():
+    """Plurais em -res, -zes, -les e -ses devem casar com o singular."""
+    assert tokenize("consumidores consumidor fornecedores fornecedor") == ["consumidor", "consumidor",
+                                                                            "fornecedor", "fornecedor"]
+    assert tokenize("vezes") == tokenize("vez")
+    assert tokenize("controles") == tokenize("controle")
+    assert tokenize("países") == tokenize("país")
+
+def test_bm25_prioriza_numero_do_artigo(tmp_path):
+    index = BM25Index(str(tmp_path / "bm25.sqlite3"))
+    docs = chunks()
+    index.add(docs)
+    assert len(index) == 4
+    top_id, _ = index.search("o que diz o art. 49?", k=1)[0]
+    assert top_id == docs[2].metadata["chunk_id"]
+
+    index.delete([docs[2].metadata["chunk_id"]])
+    assert all(cid != docs[2].metadata["chunk_id"] for cid, _ in index.search("art. 49", k=4))
+    index.close()
+
+def test_reciprocal_rank_fusion():
+    """Itens bem posicionados em ambos os rankings devem subir."""
+    assert set(reciprocal_rank_fusion([["a", "b", "c"], ["c", "b", "d"]])[:2]) == {"b", "c"}
+
+@pytest.fixture
+def db_manager(tmp_path):
+    manager = VectorDatabaseManager(persist_directory=str(tmp_path / "chroma_db"),
+                                    embeddings=DeterministicFakeEmbedding(size=16))
+    manager.sync_documents(chunks(), sources=["lei.pdf"])
+    yield manager
+    manager.close()
+
+def test_busca_lexica_e_hibrida(db_manager):
+    """Os modos lexical e hybrid devem trazer o artigo citado literalmente."""
+    lexical = db_manager.search("art. 49 § 3º", k=1, mode="lexical")
+    assert lexical[0].page_content.startswith("Art. 49")
+
+    hybrid = db_manager.search("art. 49 § 3º", k=3, mode="hybrid")
+    assert len(hybrid) == 3
+    assert any(doc.page_content.startswith("Art. 49") for doc in hybrid)
+    assert len({doc.id for doc in hybrid}) == 3
+
+def test_indice_lexico_acompanha_o_banco(db_manager):
+    """Remoções na coleção devem refletir no índice BM25, e o rebuild deve recriá-lo."""
+    db_manager.delete_sources(["lei.pdf"])
+    assert len(db_manager.lexical_index) == 0
+
+    db_manager.sync_documents(chunks(), sources=["lei.pdf"])
+    db_manager.lexical_index.clear()
+    assert db_manager.rebuild_lexical_index() == 4
+    assert db_manager.search("consentimento", k=1, mode="lexical")[0].page_content.startswith("Art. 7º")
+
+def test_indice_de_outra_tokenizacao_e_reconstruido(db_manager):
+    """Um índice gravado com outra versão da tokenização é refeito ao abrir o banco."""
+    db_manager.lexical_index._connection().execute("PRAGMA user_version = 1")
+    db_manager.close()
+    assert db_manager.lexical_index.outdated()
+    encontrados = db_manager.search("consumidores", k=4, mode="lexical")
+    assert {doc.page_content[:7] for doc in encontrados} == {"Art. 49", "Art. 12"}
+    assert not db_manager.lexical_index.outdated()
@@ -0,0 +1,96 @@
+import json
+import pytest
+from unittest.mock import MagicMock, patch
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from src.cache import AnswerCache
+from src.ingestao import DocumentProcessor
+from src.rag import RAGChainManager, VectorDatabaseManager
+from src.reranking import Reranker
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && pytest tests/test_lote.py
+
+class CountingEmbeddings(DeterministicFakeEmbedding):
+    """Conta chamadas individuais e em lote ao modelo de embeddings."""
+    query_calls: int = 0
+    batch_calls: int = 0
+
+    def embed_query(self, text):
+        self.query_calls += 1
+        return super().embed_query(text)
+
+    def embed_documents(self, texts):
+        self.batch_calls += 1
+        return super().embed_documents(texts)
+
+@pytest.fixture
+def db_manager(tmp_path):
+    manager = VectorDatabaseManager(persist_directory=str(tmp_path / "chroma_db"), embeddings=CountingEmbeddings(size=16))
+    docs = DocumentProcessor().assign_ids([
+        Document(page_content=f"Art. {i}º texto sobre o tema {i}.", metadata={"source": "cdc.pdf", "page": i, "fonte": "cdc"})
+        for i in range(12)
+    ])
+    manager.sync_documents(docs, sources=["cdc.pdf"])
+    yield manager
+    manager.close()
+
+def test_embed_queries_em_uma_chamada(db_manager):
+    base = db_manager.embeddings.embeddings
+    base.batch_calls = 0
+    vetores = db_manager.embeddings.embed_queries(["a", "b", "a", "c"])
+    assert len(vetores) == 4 and vetores[0] == vetores[2]
+    assert base.batch_calls == 1 and base.query_calls == 0
+    db_manager.embeddings.embed_queries(["a", "b"])
+    assert base.batch_calls == 1
+
+@pytest.mark.parametrize("mode", ["vector", "hybrid"])
+def test_search_many_equivale_a_search(db_manager, mode):
+    perguntas = ["Art. 3º", "tema 7", "Art. 10º"]
+    em_lote = db_manager.search_many(perguntas, k=3, mode=mode)
+    individuais = [db_manager.search(p, k=3, mode=mode) for p in perguntas]
+    assert [[d.id for d in docs] for docs in em_lote] == [[d.id for d in docs] for docs in individuais]
+
+def test_ask_many_coalesce_perguntas_repetidas(db_manager):
+    """Perguntas repetidas devem gerar um único rerank e uma única geração."""
+    llm = FakeListChatModel(responses=["Resposta A (CDC).", "Resposta B (CDC)."])
+    reranker = MagicMock(spec=Reranker)
+    reranker.arerank.side_effect = lambda q, docs, k: docs[:k]
+    with patch("src.rag.ChatGoogleGenerativeAI", return_value=llm):
+        manager = RAGChainManager(db_manager, reranker=reranker)
+
+    perguntas = ["Qual o art. 3º?", "qual o art. 3º?", "E o tema 7?"]
+    resultados = manager.ask_many(perguntas, concurrency=2)
+
+    assert [r["pergunta"] for r in resultados] == perguntas
+    assert resultados[0]["resposta"] == resultados[1]["resposta"]
+    assert reranker.arerank.call_count == 2
+    assert len(resultados[2]["chunks"]) == 4
+    assert set(resultados[0]["tempos_ms"]) == {"busca_lote_ms", "rerank_ms", "geracao_ms"}
+
+def test_resposta_em_cache_mantem_os_chunks_citados(db_manager):
+    """Um acerto no cache de respostas deve citar a mesma evidência da resposta original."""
+    llm = FakeListChatModel(responses=["Resposta (CDC)."])
+    with patch("src.rag.ChatGoogleGenerativeAI", return_value=llm):
+        manager = RAGChainManager(db_manager, answer_cache=AnswerCache(), reranker=MagicMock(spec=Reranker))
+
+    primeira, = manager.ask_many(["O que diz o art. 3º?"], use_reranking=False)
+    segunda, = manager.ask_many(["O que diz o art. 3º?"], use_reranking=False)
+    assert not primeira["cache"] and segunda["cache"]
+    assert segunda["chunks"] and segunda["chunks"] == primeira["chunks"]
+
+def test_cli_modo_lote(tmp_path, db_manager):
+    """O app deve ler um CSV de perguntas e gravar um JSONL de respostas."""
+    import app
+    entrada = tmp_path / "perguntas.csv"
+    entrada.write_text("pergunta\nO que diz o art. 3º?\nE o art. 5º?\n", encoding="utf-8")
+    saida = tmp_path / "respostas.jsonl"
+
+    llm = FakeListChatModel(responses=["Resposta (CDC)."])
+    with patch("app.VectorDatabaseManager", return_value=db_manager), \
+         patch("src.rag.ChatGoogleGenerativeAI", return_value=llm):
+        app.main(["--lote", str(entrada), "--saida", str(saida), "--concorrencia", "2"])
+
+    linhas = [json.loads(l) for l in saida.read_text(encoding="utf-8").splitlines()]
+    assert [l["pergunta"] for l in linhas] == ["O que diz o art. 3º?", "E o art. 5º?"]
+    assert all(l["resposta"] for l in linhas)
@@ -0,0 +1,99 @@
+import json
+import time
+import urllib.request
+import pytest
+from unittest.mock import MagicMock, patch
+from langchain_core.documents import Document
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from src.metricas import Tracer, profile
+from src.rag import RAGChainManager, VectorDatabaseManager
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && pytest tests/test_metricas.py
+
+DOCS = [Document(page_content=f"Art. {i}º do CDC.", metadata={"fonte": "cdc"}, id=f"id{i}") for i in range(10)]
+
+@pytest.fixture
+def tracer():
+    return Tracer()
+
+def test_span_agrega_duracao_e_contadores(tracer):
+    for tokens in [10, 20]:
+        with tracer.span("generation", tokens_saida=tokens, modelo="fake"):
+            time.sleep(0.001)
+    etapas = tracer.to_json()
+    assert etapas["generation"]["contagem"] == 2
+    assert etapas["generation"]["contadores"] == {"tokens_saida": 30}
+    assert etapas["generation"]["p95_ms"] >= etapas["generation"]["p50_ms"] > 0
+
+def test_exporta_prometheus(tracer):
+    tracer.record("search", 0.02, chunks=10)
+    texto = tracer.to_prometheus()
+    assert 'rag_stage_duration_seconds_bucket{stage="search",le="0.025"} 1' in texto
+    assert 'rag_stage_duration_seconds_bucket{stage="search",le="0.01"} 0' in texto
+    assert 'rag_stage_duration_seconds_count{stage="search"} 1' in texto
+    assert 'rag_stage_chunks_total{stage="search"} 10' in texto
+
+def test_atributos_nao_aditivos_viram_medias(tracer):
+    for similaridade, tokens in [(0.8, 5), (0.6, 7)]:
+        tracer.record("confianca", 0.01, similaridade=similaridade, candidatos=20, tokens_entrada=tokens)
+    etapa = tracer.to_json()["confianca"]
+    assert etapa["contadores"] == {"tokens_entrada": 12}
+    assert etapa["medias"] == {"similaridade": pytest.approx(0.7), "candidatos": 20}
+    texto = tracer.to_prometheus()
+    assert texto.count("# TYPE rag_stage_tokens_entrada_total counter") == 1
+    assert "# TYPE rag_stage_similaridade_media gauge" in texto
+    assert "rag_stage_similaridade_total" not in texto and "rag_stage_counter_total" not in texto
+
+def test_dump_json_e_prom(tracer, tmp_path):
+    tracer.record("rerank", 0.1)
+    tracer.dump(str(tmp_path / "metricas.json"))
+    tracer.dump(str(tmp_path / "metricas.prom"))
+    dados = json.loads((tmp_path / "metricas.json").read_text(encoding="utf-8"))
+    assert dados["etapas"]["rerank"]["contagem"] == 1
+    assert "rag_stage_duration_seconds_sum" in (tmp_path / "metricas.prom").read_text(encoding="utf-8")
+
+def test_serve_expoe_metricas(tracer):
+    tracer.record("search", 0.01)
+    server = tracer.serve(port=0)
+    try:
+        porta = server.server_address[1]
+        with urllib.request.urlopen(f"http://127.0.0.1:{porta}/metrics.json") as resposta:
+            assert json.loads(resposta.read())["search"]["contagem"] == 1
+    finally:
+        server.shutdown()
+        server.server_close()
+
+def test_timed_iter_desconta_iterador_interno(tracer):
+    """O tempo do estágio externo não deve incluir o tempo do iterador que ele consome."""
+    def lento():
+        for i in range(3):
+            time.sleep(0.02)
+            yield i
+
+    interno = tracer.timed_iter("ingestao.load", lento())
+    externo = tracer.timed_iter("ingestao.chunk", (i * 2 for i in interno), exclude=interno)
+    assert list(externo) == [0, 2, 4]
+    etapas = tracer.to_json()
+    assert etapas["ingestao.load"]["total_ms"] >= 60
+    assert etapas["ingestao.chunk"]["total_ms"] < 20
+    assert etapas["ingestao.load"]["contadores"] == {"itens": 3}
+
+def test_profile_gera_relatorio(tmp_path):
+    caminho = tmp_path / "pergunta.prof"
+    with profile(str(caminho)) as perfil:
+        sum(range(1000))
+    assert "function calls" in perfil["relatorio"]
+    assert caminho.exists()
+
+def test_ask_registra_spans_por_etapa(tracer):
+    db_manager = MagicMock(spec=VectorDatabaseManager)
+    db_manager.search.return_value = DOCS
+    llm = FakeListChatModel(responses=["3, 1", "O consumidor tem direito (CDC)."])
+    with patch("src.rag.ChatGoogleGenerativeAI", return_value=llm):
+        rag_manager = RAGChainManager(db_manager, tracer=tracer)
+
+    rag_manager.ask("Quais os direitos do consumidor?")
+    etapas = tracer.to_json()
+    assert {"rerank", "format_docs", "generation"} <= set(etapas)
+    assert etapas["format_docs"]["contadores"]["chunks"] == 2
+    assert etapas["generation"]["contadores"]["caracteres_prompt"] > 0
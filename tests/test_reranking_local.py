@@ -0,0 +1,73 @@
+from unittest.mock import MagicMock, patch
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from src.ingestao import DocumentProcessor
+from src.rag import RAGChainManager, VectorDatabaseManager
+from src.reranking import LocalReranker, Reranker, compare_rerankers, top_k_agreement
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && pytest tests/test_reranking_local.py
+
+class KeywordEmbeddings(DeterministicFakeEmbedding):
+    """Embeddings de brinquedo: uma dimensão por palavra-chave jurídica."""
+    keywords: list = ["consumidor", "arrependimento", "dados", "consentimento", "fornecedor"]
+
+    def _vector(self, text):
+        text = text.lower()
+        return [float(word in text) for word in self.keywords] + [0.01]
+
+    def embed_query(self, text):
+        return self._vector(text)
+
+    def embed_documents(self, texts):
+        return [self._vector(t) for t in texts]
+
+DOCS = [
+    Document(page_content="Tratamento de dados exige consentimento.", metadata={"fonte": "lgpd"}),
+    Document(page_content="O fornecedor responde pelos danos.", metadata={"fonte": "cdc"}),
+    Document(page_content="O consumidor tem direito de arrependimento em 7 dias.", metadata={"fonte": "cdc"}),
+]
+
+def test_local_reranker_ordena_por_relevancia():
+    reranker = LocalReranker(KeywordEmbeddings(size=6))
+    top = reranker.rerank("Como funciona o arrependimento do consumidor?", DOCS, k=2)
+    assert len(top) == 2
+    assert "arrependimento" in top[0].page_content
+
+def test_local_reranker_usa_vetores_do_banco(tmp_path):
+    """Com IDs disponíveis, os vetores devem vir do banco, sem reembedar os chunks."""
+    embeddings = KeywordEmbeddings(size=6)
+    db_manager = VectorDatabaseManager(persist_directory=str(tmp_path / "chroma_db"), embeddings=embeddings)
+    docs = DocumentProcessor().assign_ids([
+        Document(page_content=d.page_content, metadata={**d.metadata, "source": "lei.pdf", "page": i})
+        for i, d in enumerate(DOCS)
+    ])
+    db_manager.sync_documents(docs, sources=["lei.pdf"])
+
+    candidatos = db_manager.search("consentimento", k=3)
+    with patch.object(KeywordEmbeddings, "embed_documents", side_effect=AssertionError("reembedou")):
+        top = db_manager.local_reranker().rerank("dados e consentimento", candidatos, k=1)
+    assert "consentimento" in top[0].page_content
+    db_manager.close()
+
+def test_rag_manager_aceita_reranker_plugavel():
+    """RAGChainManager.rerank deve delegar para a estratégia configurada."""
+    reranker = MagicMock(spec=Reranker)
+    reranker.rerank.return_value = DOCS[:1]
+    with patch("src.rag.ChatGoogleGenerativeAI"):
+        manager = RAGChainManager(MagicMock(spec=VectorDatabaseManager), reranker=reranker)
+    assert manager.rerank("pergunta", DOCS, k=1) == DOCS[:1]
+    reranker.rerank.assert_called_once_with("pergunta", DOCS, k=1)
+
+def test_comparacao_de_rerankers():
+    """A comparação deve medir latência e concordância top-k com a referência."""
+    local = LocalReranker(KeywordEmbeddings(size=6))
+    inverso = MagicMock(spec=Reranker)
+    inverso.rerank.side_effect = lambda q, docs, k: list(reversed(docs))[:k]
+    resultados = compare_rerankers(
+        ["arrependimento do consumidor"], retrieve=lambda q: DOCS,
+        rerankers={"local": local, "inverso": inverso}, reference="local", k=1
+    )
+    assert resultados["local"]["concordancia_top_k"] == 1.0
+    assert resultados["inverso"]["concordancia_top_k"] == 1.0  # DOCS[2] é o mais relevante e o último
+    assert resultados["local"]["latencia_media_ms"] >= 0
+    assert top_k_agreement(DOCS[:2], DOCS[1:]) == 0.5
@@ -0,0 +1,95 @@
+import os
+import sqlite3
+import pytest
+from unittest.mock import MagicMock
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+from src.ingestao import DocumentProcessor
+from src.lexico import BM25Index
+from src.metricas import Tracer
+from src.rag import RAGChainManager, VectorDatabaseManager
+from src.roteamento import QueryRouter
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && pytest tests/test_roteamento.py
+
+CENTROIDES = {"cdc": [1.0, 0.0], "lgpd": [0.0, 1.0]}
+
+@pytest.fixture
+def router():
+    return QueryRouter(centroids=lambda: CENTROIDES)
+
+@pytest.fixture
+def db_manager(tmp_path):
+    manager = VectorDatabaseManager(persist_directory=str(tmp_path / "chroma_db"),
+                                    embeddings=DeterministicFakeEmbedding(size=16))
+    docs = DocumentProcessor().assign_ids([
+        Document(page_content=f"Art. {i}º O titular e o consumidor têm direitos.",
+                 metadata={"source": f"{fonte}.pdf", "page": i, "fonte": fonte})
+        for fonte in ["cdc", "lgpd"] for i in range(6)
+    ])
+    manager.sync_documents(docs, sources=["cdc.pdf", "lgpd.pdf"])
+    yield manager
+    manager.close()
+
+def test_mencao_explicita_decide(router):
+    assert router.route("O que diz o art. 18 da LGPD?") == {"fontes": ["lgpd"], "motivo": "mencao"}
+    assert router.route("Segundo o Código de Defesa do Consumidor, posso trocar?")["fontes"] == ["cdc"]
+
+def test_palavras_chave(router):
+    assert router.route("Quais os direitos do titular sobre seus dados pessoais?")["fontes"] == ["lgpd"]
+    assert router.route("O fornecedor responde pelo defeito do produto?")["fontes"] == ["cdc"]
+    # Pergunta mista: as duas fontes empatam e a busca fica global
+    assert router.route("O fornecedor pode vender meus dados?")["fontes"] is None
+
+def test_fontes_fora_do_indice_sao_ignoradas(router):
+    decisao = router.route("Qual o prazo de férias na CLT?")
+    assert decisao["fontes"] is None
+
+def test_centroide_quando_nao_ha_palavras_chave(router):
+    decisao = router.route("Quando isso se aplica?", embed_query=lambda q: [0.1, 0.9])
+    assert decisao == {"fontes": ["lgpd"], "motivo": "centroide"}
+    assert router.route("Quando isso se aplica?", embed_query=lambda q: [1.0, 1.0])["fontes"] is None
+    assert router.route("Quando isso se aplica?")["motivo"] == "sem_sinal"
+
+def test_bm25_filtra_por_fonte_e_migra_indice_antigo(tmp_path):
+    path = str(tmp_path / "bm25.sqlite3")
+    with sqlite3.connect(path) as conn:
+        conn.execute("CREATE TABLE docs (chunk_id TEXT PRIMARY KEY, length INTEGER)")
+    index = BM25Index(path)
+    index.add([Document(page_content="consentimento do titular", metadata={"chunk_id": "a", "fonte": "lgpd"}),
+               Document(page_content="consentimento do consumidor", metadata={"chunk_id": "b", "fonte": "cdc"})])
+    assert {cid for cid, _ in index.search("consentimento")} == {"a", "b"}
+    assert [cid for cid, _ in index.search("consentimento", fontes=["cdc"])] == ["b"]
+    index.close()
+
+@pytest.mark.parametrize("mode", ["vector", "lexical", "hybrid"])
+def test_busca_filtrada_por_fonte(db_manager, mode):
+    docs = db_manager.search("Art. 2º direitos do titular", k=4, mode=mode, fontes=["lgpd"])
+    assert len(docs) == 4
+    assert {d.metadata["fonte"] for d in docs} == {"lgpd"}
+    lote = db_manager.search_many(["Art. 2º", "Art. 3º"], k=3, mode=mode, fontes=["cdc"])
+    assert all(d.metadata["fonte"] == "cdc" for docs in lote for d in docs)
+
+def test_centroides_em_cache_e_invalidados(db_manager):
+    centroides = db_manager.source_centroids()
+    assert set(centroides) == {"cdc", "lgpd"}
+    caminho = os.path.join(db_manager.persist_directory, "centroides.json")
+    assert os.path.exists(caminho)
+    db_manager.delete_sources(["cdc.pdf"])
+    assert not os.path.exists(caminho)
+    assert set(db_manager.source_centroids()) == {"lgpd"}
+
+def test_ask_roteado_registra_decisao_e_usa_fallback(router):
+    tracer = Tracer()
+    db_manager = MagicMock()
+    db_manager.search.side_effect = [[], [Document(page_content="Art. 1º", id="x")] * 4]
+    rag_manager = RAGChainManager(db_manager, llm=FakeListChatModel(responses=["Resposta (LGPD)."]),
+                                  router=router, tracer=tracer)
+
+    assert rag_manager.ask("O que diz a LGPD?", use_reranking=False) == "Resposta (LGPD)."
+    primeira, segunda = db_manager.search.call_args_list
+    assert primeira.kwargs["fontes"] == ["lgpd"]
+    assert "fontes" not in segunda.kwargs
+    span = [s for s in tracer.spans if s["nome"] == "roteamento"][0]
+    assert span["motivo"] == "mencao" and span["fontes"] == "lgpd"
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import threading
+import pytest
+from benchmarks.sintetico import FakeLegalLLM, HashEmbeddings, synthetic_corpus
+from src.metricas import Tracer
+from src.rag import RAGChainManager, VectorDatabaseManager
+from src.servidor import EmbeddingBatcher, RAGServer, batch_query_embeddings
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && pytest tests/test_servidor.py
+
+PERGUNTAS = ["Posso desistir da compra?", "Quem responde pelo defeito do produto?",
+             "O que é dado pessoal sensível?", "Qual o prazo para reclamar de vício aparente?",
+             "O controlador precisa de consentimento?"]
+
+async def _chamar(app, method, path, payload=None):
+    """Executa uma requisição diretamente na aplicação ASGI, sem rede."""
+    body = json.dumps(payload).encode("utf-8") if payload is not None else b""
+    sent = []
+
+    async def receive():
+        return {"type": "http.request", "body": body, "more_body": False}
+
+    async def send(message):
+        sent.append(message)
+
+    await app({"type": "http", "method": method, "path": path, "headers": []}, receive, send)
+    headers = dict(sent[0]["headers"])
+    data = b"".join(m.get("body", b"") for m in sent[1:]).decode("utf-8")
+    return sent[0]["status"], headers, json.loads(data) if headers[b"content-type"] == b"application/json" else data
+
+@pytest.fixture
+def servidor(tmp_path):
+    embeddings = HashEmbeddings()
+    db_manager = VectorDatabaseManager(persist_directory=str(tmp_path / "chroma_db"), embeddings=embeddings,
+                                       tracer=Tracer())
+    db_manager.sync_stream(synthetic_corpus(200), sources=["sintetico/cdc.pdf", "sintetico/lgpd.pdf"])
+    embeddings.calls = 0
+    batcher = batch_query_embeddings(db_manager, max_wait=0.02)
+    llm = FakeLegalLLM(latency=0.05)
+    rag_manager = RAGChainManager(db_manager, llm=llm, tracer=db_manager.tracer)
+    yield {"db_manager": db_manager, "embeddings": embeddings, "batcher": batcher, "llm": llm,
+           "rag_manager": rag_manager}
+    batcher.close()
+    db_manager.close()
+
+def test_perguntas_identicas_sao_coalescidas_e_embeddings_agrupados(servidor):
+    app = RAGServer(servidor["rag_manager"], max_concurrency=8, use_reranking=False, tracer=Tracer())
+
+    async def carga():
+        # 40 usuários simultâneos, 5 perguntas distintas (com variações de caixa e espaço)
+        pedidos = [{"pergunta": PERGUNTAS[i % 5] if i % 2 else f"  {PERGUNTAS[i % 5].upper()} "} for i in range(40)]
+        return await asyncio.gather(*(_chamar(app, "POST", "/perguntar", p) for p in pedidos))
+
+    respostas = asyncio.run(carga())
+    assert all(status == 200 for status, _, _ in respostas)
+    assert all("(CDC)" in corpo["resposta"] for _, _, corpo in respostas)
+    assert sum(corpo["coalescida"] for _, _, corpo in respostas) == 35
+    assert servidor["llm"].calls == 5
+    # As 5 consultas ao embedding chegam juntas e vão ao modelo em menos chamadas
+    assert servidor["batcher"].stats()["textos"] == 5
+    assert servidor["embeddings"].calls < 5
+    assert app.status() == {"em_execucao": 0, "na_fila": 0, "coalescidas": 35, "rejeitadas": 0}
+
+def test_cancelar_a_primeira_pergunta_nao_afeta_as_coalescidas():
+    class ManagerLento:
+        calls = 0
+
+        async def aask(self, question, use_reranking=True):
+            self.calls += 1
+            await asyncio.sleep(0.05)
+            return f"resposta: {question}"
+
+    manager = ManagerLento()
+    app = RAGServer(manager, tracer=Tracer())
+
+    async def cenario():
+        lider = asyncio.ensure_future(app.answer("Posso desistir da compra?"))
+        await asyncio.sleep(0)
+        seguidora = asyncio.ensure_future(_chamar(app, "POST", "/perguntar", {"pergunta": "posso desistir da compra?"}))
+        await asyncio.sleep(0.01)
+        lider.cancel()  # o cliente que iniciou a computação desconectou
+        with pytest.raises(asyncio.CancelledError):
+            await lider
+        return await seguidora
+
+    status, _, corpo = asyncio.run(cenario())
+    assert status == 200 and corpo["coalescida"] and corpo["resposta"] == "resposta: Posso desistir da compra?"
+    assert manager.calls == 1
+    assert app.status() == {"em_execucao": 0, "na_fila": 0, "coalescidas": 1, "rejeitadas": 0}
+
+def test_fila_cheia_responde_503(servidor):
+    app = RAGServer(servidor["rag_manager"], max_concurrency=1, max_queue=1, use_reranking=False, tracer=Tracer())
+
+    async def carga():
+        return await asyncio.gather(*(_chamar(app, "POST", "/perguntar", {"pergunta": p}) for p in PERGUNTAS))
+
+    respostas = asyncio.run(carga())
+    status = sorted(s for s, _, _ in respostas)
+    assert status == [200, 200, 503, 503, 503]
+    assert all(h[b"retry-after"] == b"1" for s, h, _ in respostas if s == 503)
+    assert app.rejected == 3 and servidor["llm"].calls == 2
+
+def test_rotas_auxiliares_e_erros(servidor):
+    tracer = Tracer()
+    app = RAGServer(servidor["rag_manager"], use_reranking=False, tracer=tracer)
+
+    async def chamadas():
+        return [await _chamar(app, "POST", "/perguntar", {"texto": "sem pergunta"}),
+                await _chamar(app, "GET", "/inexistente"),
+                await _chamar(app, "POST", "/perguntar", {"pergunta": PERGUNTAS[0]}),
+                await _chamar(app, "GET", "/saude"),
+                await _chamar(app, "GET", "/metrics")]
+
+    invalida, inexistente, ok, saude, metricas = asyncio.run(chamadas())
+    assert invalida[0] == 400 and inexistente[0] == 404 and ok[0] == 200
+    assert saude[2]["status"] == "ok" and saude[2]["na_fila"] == 0
+    assert 'stage="servidor.pergunta"' in metricas[2]
+
+def test_batcher_agrupa_chamadas_de_threads_e_propaga_erros():
+    embeddings = HashEmbeddings(latency=0.01)
+    batcher = EmbeddingBatcher(embeddings, max_batch=8, max_wait=0.05)
+    resultados = {}
+
+    def consulta(i):
+        resultados[i] = batcher.embed_query(f"pergunta {i % 10}")
+
+    threads = [threading.Thread(target=consulta, args=(i,)) for i in range(16)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert embeddings.calls < 16
+    assert all(resultados[i] == embeddings.embed_query(f"pergunta {i % 10}") for i in range(16))
+
+    embeddings.embed_documents = lambda texts: (_ for _ in ()).throw(RuntimeError("cota esgotada"))
+    with pytest.raises(RuntimeError, match="cota"):
+        batcher.embed_query("outra")
+    batcher.close()
@@ -0,0 +1,88 @@
+import os
+import pytest
+from langchain_core.documents import Document
+from benchmarks.sintetico import HashEmbeddings
+from src.ingestao import DocumentProcessor
+from src.rag import VectorDatabaseManager
+from src.snapshot import Snapshot, SnapshotError, export_snapshot
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && pytest tests/test_snapshot.py
+
+TEXTOS = [
+    "Art. 6º São direitos básicos do consumidor a proteção da vida, saúde e segurança.",
+    "Art. 18. Os fornecedores de produtos respondem solidariamente pelos vícios de qualidade.",
+    "Art. 49. O consumidor pode desistir do contrato no prazo de sete dias.",
+    "Art. 7º O tratamento de dados pessoais somente poderá ser realizado mediante consentimento.",
+    "Art. 18. O titular dos dados pessoais tem direito a obter do controlador a confirmação do tratamento.",
+]
+
+def _manager(caminho, backend="chroma", embeddings=None):
+    return VectorDatabaseManager(persist_directory=str(caminho), embeddings=embeddings or HashEmbeddings(),
+                                 backend=backend)
+
+@pytest.fixture
+def origem(tmp_path):
+    manager = _manager(tmp_path / "origem")
+    docs = DocumentProcessor().assign_ids([
+        Document(page_content=texto, metadata={"source": f"{fonte}.pdf", "page": i, "fonte": fonte})
+        for i, (texto, fonte) in enumerate(zip(TEXTOS, ["cdc", "cdc", "cdc", "lgpd", "lgpd"]))
+    ])
+    manager.sync_documents(docs, sources=["cdc.pdf", "lgpd.pdf"])
+    yield manager
+    manager.close()
+
+@pytest.mark.parametrize("backend", ["chroma", "mmap"])
+def test_importa_sem_reembedar(origem, tmp_path, backend):
+    caminho = str(tmp_path / "corpus.snap")
+    cabecalho = origem.export_snapshot(caminho)
+    assert cabecalho["linhas"] == len(TEXTOS) and cabecalho["fontes"] == {"cdc": 3, "lgpd": 2}
+    assert "bm25.sqlite3" in Snapshot(caminho).files
+
+    embeddings = HashEmbeddings()
+    with _manager(tmp_path / "destino", backend, embeddings) as destino:
+        destino.import_snapshot(caminho)
+        assert embeddings.calls == 0
+        assert destino.backend.count() == len(TEXTOS)
+        for modo in ("vector", "lexical"):
+            esperado = origem.search("desistir do contrato", k=3, mode=modo)
+            obtido = destino.search("desistir do contrato", k=3, mode=modo)
+            assert obtido[0].id == esperado[0].id and len(obtido) == len(esperado)
+            # Empates em zero podem trocar de ordem; as similaridades (vetores em int8) se mantêm
+            assert [d.metadata.get("similaridade", 0) for d in obtido] == pytest.approx(
+                [d.metadata.get("similaridade", 0) for d in esperado], abs=0.01)
+        # Reimportar substitui o banco aberto em vez de duplicar os chunks
+        destino.import_snapshot(caminho)
+        assert destino.backend.count() == len(TEXTOS)
+    assert not os.path.exists(str(tmp_path / "destino") + ".importando")
+
+def test_matriz_mapeada_do_arquivo(origem, tmp_path):
+    caminho = str(tmp_path / "corpus.snap")
+    export_snapshot(origem.backend, caminho, dtype="float16")
+    snapshot = Snapshot(caminho)
+    assert snapshot.vectors.shape == (len(TEXTOS), 256) and snapshot.scales is None
+    vetores = origem.backend.get_vectors([r["id"] for lote in snapshot.iter_chunks() for r in lote])
+    assert abs(snapshot.decode(0, 1)[0] - list(vetores.values())[0]).max() < 1e-3
+
+def test_rejeita_snapshot_invalido(origem, tmp_path):
+    caminho = tmp_path / "corpus.snap"
+    origem.export_snapshot(str(caminho))
+    dados = bytearray(caminho.read_bytes())
+    offset = Snapshot(str(caminho)).header["secoes"]["chunks"]["offset"]
+    dados[offset + 10] ^= 0xFF
+    corrompido = tmp_path / "corrompido.snap"
+    corrompido.write_bytes(bytes(dados))
+    with pytest.raises(SnapshotError, match="chunks"):
+        Snapshot(str(corrompido)).verify()
+
+    with _manager(tmp_path / "destino", "mmap") as destino:
+        with pytest.raises(SnapshotError):
+            destino.import_snapshot(str(corrompido))
+        assert destino.backend.count() == 0  # o banco atual fica intacto
+    with VectorDatabaseManager(persist_directory=str(tmp_path / "outro"), embeddings=HashEmbeddings(),
+                               embedding_model="outro-modelo", backend="mmap") as outro:
+        with pytest.raises(SnapshotError, match="outro-modelo"):
+            outro.import_snapshot(str(caminho))
+
+    (tmp_path / "texto.snap").write_bytes(b"nao e um snapshot" * 10)
+    with pytest.raises(SnapshotError, match="não é um snapshot"):
+        Snapshot(str(tmp_path / "texto.snap"))
@@ -0,0 +1,74 @@
+import pytest
+from unittest.mock import patch
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from src.rag import VectorDatabaseManager
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && pytest tests/test_vectorstore.py
+# Testes offline: usam embeddings determinísticos em vez do Gemini.
+
+@pytest.fixture
+def db_manager(tmp_path):
+    manager = VectorDatabaseManager(
+        persist_directory=str(tmp_path / "chroma_db"),
+        embeddings=DeterministicFakeEmbedding(size=32)
+    )
+    docs = [
+        Document(page_content="O consumidor pode desistir do contrato em 7 dias.", metadata={"fonte": "cdc"}),
+        Document(page_content="O tratamento de dados pessoais exige consentimento.", metadata={"fonte": "lgpd"})
+    ]
+    manager.create_or_update(docs, force_recreate=True)
+    yield manager
+    manager.close()
+
+def test_handle_reutilizado_entre_buscas(db_manager):
+    """Valida que search e get_retriever compartilham o mesmo handle do Chroma."""
+    with patch("src.vetores.Chroma") as mock_chroma:
+        db_manager.search("consentimento", k=1)
+        db_manager.get_retriever(k=2)
+        mock_chroma.assert_not_called()
+
+def test_close_reabre_sob_demanda(db_manager):
+    """Após close(), a próxima busca deve reabrir o banco persistido."""
+    primeiro = db_manager.vectorstore
+    db_manager.close()
+    assert db_manager._backend is None
+
+    results = db_manager.search("consumidor", k=2)
+    assert len(results) == 2
+    assert db_manager.vectorstore is not primeiro
+
+def test_force_recreate_troca_handle(db_manager):
+    """create_or_update(force_recreate=True) deve substituir o handle aberto."""
+    antigo = db_manager.vectorstore
+    novo, criado = db_manager.create_or_update(
+        [Document(page_content="Art. 18 da LGPD.", metadata={"fonte": "lgpd"})],
+        force_recreate=True
+    )
+    assert criado
+    assert novo is db_manager.vectorstore
+    assert novo is not antigo
+
+def test_force_recreate_substitui_o_corpus_com_ids_por_conteudo(db_manager):
+    """Recriar não duplica os chunks, e o sync seguinte reconhece os IDs gravados."""
+    docs = [
+        Document(page_content="O consumidor pode desistir do contrato em 7 dias.",
+                 metadata={"fonte": "cdc", "source": "cdc.pdf"}),
+        Document(page_content="O tratamento de dados pessoais exige consentimento.",
+                 metadata={"fonte": "lgpd", "source": "lgpd.pdf"})
+    ]
+    db_manager.create_or_update(docs, force_recreate=True)
+    db_manager.create_or_update(docs, force_recreate=True)
+    assert db_manager.backend.count() == 2
+    ids = db_manager.backend.ids_for_sources(["cdc.pdf", "lgpd.pdf"])
+    assert sorted(ids) == sorted(d.metadata["chunk_id"] for d in docs)
+    resultado = db_manager.sync_documents(docs, sources=["cdc.pdf", "lgpd.pdf"])
+    assert resultado["adicionados"] == 0 and resultado["inalterados"] == 2
+
+def test_context_manager_fecha_handle(tmp_path):
+    """O uso com `with` deve fechar o handle ao sair do bloco."""
+    with VectorDatabaseManager(persist_directory=str(tmp_path / "db"),
+                               embeddings=DeterministicFakeEmbedding(size=8)) as manager:
+        manager.vectorstore
+        assert manager._backend is not None
+    assert manager._backend is None
@@ -0,0 +1,129 @@
+import numpy as np
+import pytest
+from langchain_core.documents import Document
+from langchain_core.embeddings import DeterministicFakeEmbedding
+from src.ingestao import DocumentProcessor
+from src.rag import VectorDatabaseManager
+from src.vetores import MmapVectorStore, copy_vectors
+
+# Para rodar: export PYTHONPATH=$PYTHONPATH:. && pytest tests/test_vetores.py
+
+DIM = 32
+
+def _docs(n, offset=0):
+    return [Document(page_content=f"Art. {i}º texto {i}.",
+                     metadata={"chunk_id": f"id{i}", "source": f"{'cdc' if i % 2 == 0 else 'lgpd'}.pdf",
+                               "fonte": "cdc" if i % 2 == 0 else "lgpd"})
+            for i in range(offset, offset + n)]
+
+def _vectors(n, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, DIM)).astype(np.float32)
+
+@pytest.fixture
+def store(tmp_path):
+    store = MmapVectorStore(str(tmp_path / "mmap_db"), DeterministicFakeEmbedding(size=DIM), dtype="float16")
+    store.upsert(_docs(200), _vectors(200))
+    yield store
+    store.close()
+
+def _exact_top(vectors, query, k):
+    normed = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return list(np.argsort(-(normed @ (query / np.linalg.norm(query))))[:k])
+
+def test_forca_bruta_igual_ao_ranking_exato(store):
+    vectors = _vectors(200)
+    hits = store.query([vectors[17].tolist()], k=5)[0]
+    assert [doc.id for doc, _ in hits] == [f"id{i}" for i in _exact_top(vectors, vectors[17], 5)]
+    assert hits[0][1] == pytest.approx(0.0, abs=1e-3)
+
+def test_filtro_por_fonte(store):
+    query = _vectors(200)[17].tolist()
+    hits = store.query([query], k=10, where={"fonte": "lgpd"})[0]
+    assert len(hits) == 10
+    assert {doc.metadata["fonte"] for doc, _ in hits} == {"lgpd"}
+    assert store.query([query], k=3, where={"fonte": {"$in": ["cdc", "lgpd"]}})[0][0][0].id == "id17"
+    assert store.query([query], k=3, where={"fonte": "stj"})[0] == []
+
+def test_upsert_delete_e_compactacao(store):
+    novo = _vectors(1, seed=9)
+    store.upsert(_docs(1, offset=5), novo)
+    assert store.count() == 200
+    assert store.query([novo[0].tolist()], k=1)[0][0][0].id == "id5"
+
+    store.delete(["id5", "id6"])
+    assert store.count() == 198
+    assert store.get_by_ids(["id5", "id6", "id7"])[0].id == "id7"
+    store.compact()
+    assert store._header["linhas"] == 198
+    assert store.query([_vectors(200)[17].tolist()], k=1)[0][0][0].id == "id17"
+    assert set(store.get_vectors(["id17"])) == {"id17"}
+
+def test_reabre_sem_carregar_a_matriz(store):
+    store.close()
+    reaberto = MmapVectorStore(store.persist_directory, DeterministicFakeEmbedding(size=DIM))
+    assert isinstance(reaberto._matrix, np.memmap)
+    assert reaberto._matrix.dtype == np.float16
+    assert reaberto.query([_vectors(200)[42].tolist()], k=1)[0][0][0].id == "id42"
+    reaberto.close()
+
+@pytest.mark.parametrize("dtype", ["int8", "float16"])
+def test_quantizacao_preserva_o_ranking(tmp_path, dtype):
+    vectors = _vectors(500, seed=3)
+    store = MmapVectorStore(str(tmp_path / dtype), DeterministicFakeEmbedding(size=DIM), dtype=dtype)
+    store.upsert(_docs(500), vectors)
+    query = vectors[100] + 0.1 * _vectors(1, seed=4)[0]
+    exato = {f"id{i}" for i in _exact_top(vectors, query, 10)}
+    obtido = {doc.id for doc, _ in store.query([query.tolist()], k=10)[0]}
+    assert len(exato & obtido) >= 9
+    store.close()
+
+def test_ivf_recall_em_colecao_agrupada(tmp_path):
+    rng = np.random.default_rng(5)
+    centros = rng.normal(size=(20, DIM))
+    vectors = (centros[rng.integers(0, 20, size=4000)] + 0.3 * rng.normal(size=(4000, DIM))).astype(np.float32)
+    store = MmapVectorStore(str(tmp_path / "ivf"), DeterministicFakeEmbedding(size=DIM), ivf_min_rows=1000, nprobe=6)
+    store.upsert(_docs(4000), vectors)
+    store.optimize()
+    assert store._header["ivf"]["nlist"] == 63
+
+    consultas = vectors[rng.integers(0, 4000, size=20)] + 0.05 * rng.normal(size=(20, DIM))
+    aproximado = store.query(consultas.tolist(), k=10)
+    exato = store.query(consultas.tolist(), k=10, exact=True)
+    recall = np.mean([len({d.id for d, _ in a} & {d.id for d, _ in e}) / 10 for a, e in zip(aproximado, exato)])
+    assert recall >= 0.9
+    store.close()
+
+def test_backend_mmap_no_manager(tmp_path):
+    """O backend mmap deve servir de drop-in para search, get_retriever e o reranker local."""
+    db_manager = VectorDatabaseManager(persist_directory=str(tmp_path / "mmap_db"),
+                                       embeddings=DeterministicFakeEmbedding(size=DIM), backend="mmap")
+    docs = DocumentProcessor().assign_ids([
+        Document(page_content=f"Art. {i}º texto do código.", metadata={"source": "cdc.pdf", "page": i, "fonte": "cdc"})
+        for i in range(8)
+    ])
+    resultado = db_manager.sync_documents(docs, sources=["cdc.pdf"])
+    assert resultado["adicionados"] == 8
+    assert db_manager.sync_documents(docs[:6], sources=["cdc.pdf"])["removidos"] == 2
+
+    for mode in ["vector", "lexical", "hybrid"]:
+        assert len(db_manager.search("Art. 3º", k=3, mode=mode)) == 3
+    assert db_manager.search_many(["Art. 1º", "Art. 2º"], k=2)[1][0].id == db_manager.search("Art. 2º", k=1)[0].id
+    assert len(db_manager.get_retriever(k=2).invoke("Art. 4º")) == 2
+    assert len(db_manager.local_reranker().rerank("Art. 4º", docs[:6], k=2)) == 2
+    db_manager.close()
+
+def test_copia_do_chroma_para_mmap_sem_reembedar(tmp_path):
+    embeddings = DeterministicFakeEmbedding(size=DIM)
+    chroma = VectorDatabaseManager(persist_directory=str(tmp_path / "chroma_db"), embeddings=embeddings)
+    docs = DocumentProcessor().assign_ids([
+        Document(page_content=f"Art. {i}º da LGPD.", metadata={"source": "lgpd.pdf", "page": i, "fonte": "lgpd"})
+        for i in range(5)
+    ])
+    chroma.sync_documents(docs, sources=["lgpd.pdf"])
+    mmap = MmapVectorStore(str(tmp_path / "mmap_db"), embeddings)
+    assert copy_vectors(chroma.backend, mmap) == 5
+
+    query = embeddings.embed_query("Art. 2º da LGPD.")
+    assert [d.id for d, _ in mmap.query([query], k=3)[0]] == [d.id for d, _ in chroma.backend.query([query], k=3)[0]]
+    chroma.close()
+    mmap.close()